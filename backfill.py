@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+"""
+backfill.py converts an archive of climat files (e.g. decades of rows split by station)
+to one bufr message for each TTAAII and month.
+Run program by command: python3 backfill.py --work-dir work --output-dir bufr_dir archive/
+    1. Partition: the rows of all the climat files are streamed as bytes
+    (climat2bufr.mapped_row_spans) to the bucket files of their TTAAII and month
+    (REPORT_MONTH) in the work directory, so the archive is never in memory at once.
+    Only BUCKET_FILES buckets are open at the same time.
+    2. Encode: each bucket is a climat file named as climat2bufr expects
+    (TTAAII_YYYY-MM-01_00:00_code_backfill.dat), which is converted by
+    climat2bufr.convert_file in a pool of worker processes.
+    3. Progress is kept in the work directory (PROGRESS_FILE). The partition is done
+    again only if it was not finished and the buckets which are converted are skipped,
+    so an interrupted backfill continues from where it stopped. The climat files of
+    the partition are kept with their sizes and modification times, and a backfill is not
+    continued with other or changed climat files (--restart starts it again).
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import climat2bufr
+from file_mode import FILE_MODE
+from climat_errors import BackfillInputError
+
+PROGRESS_FILE = 'progress.json'
+BUCKET_DIR = 'buckets'
+BUCKET_FILES = 64
+NO_MONTH = '0000-00'
+TTAAII_PATTERN = re.compile(rb'(?:^|,)\s*TTAAII=([^,*]*)')
+MONTH_PATTERN = re.compile(rb'(?:^|,)\s*REPORT_MONTH=(\d{4}-\d{2})')
+
+def bucket_name(ttaaii, month, code):
+    """
+    This function returns the name of the bucket file of TTAAII and month (YYYY-MM).
+    The name has the parts of a climat filename, so the bufr file is named by them.
+    """
+    return ttaaii + '_' + month + '-01_00:00_' + code + '_backfill.dat'
+
+def row_bucket(row, default_ttaaii):
+    """
+    This function returns TTAAII and month (YYYY-MM) of climat row (bytes). TTAAII of
+    the climat filename (default_ttaaii) is used, if the row has no TTAAII. Only these two
+    values are decoded.
+    """
+    ttaaii = TTAAII_PATTERN.search(row)
+    month = MONTH_PATTERN.search(row)
+    if ttaaii and ttaaii.group(1) != b'/':
+        default_ttaaii = ttaaii.group(1).decode('utf8')
+    return default_ttaaii, month.group(1).decode('utf8') if month else NO_MONTH
+
+class Buckets:
+    """
+    This class writes climat rows (bytes) to the bucket files of bucket_dir. At most BUCKET_FILES
+    files are open, the least recently used one is closed first and opened again for
+    appending when it gets new rows.
+    """
+    def __init__(self, bucket_dir):
+        self.bucket_dir = bucket_dir
+        self.files = {}
+        self.rows = {}
+
+    def add(self, name, row):
+        """
+        This function appends row to bucket name.
+        """
+        bucket_file = self.files.pop(name, None)
+        if bucket_file is None:
+            if len(self.files) >= BUCKET_FILES:
+                self.files.pop(next(iter(self.files))).close()
+            bucket_file = open(os.path.join(self.bucket_dir, name), 'ab')
+        self.files[name] = bucket_file
+        bucket_file.write(row + b'\n')
+        self.rows[name] = self.rows.get(name, 0) + 1
+
+    def close(self):
+        """
+        This function closes all the bucket files.
+        """
+        for bucket_file in self.files.values():
+            bucket_file.close()
+        self.files.clear()
+
+def partition(climat_filenames, work_dir, code, ttaaii):
+    """
+    Step 1. Streams the rows of climat files to the buckets of their TTAAII and month.
+    The buckets are written to a temporary directory, which is renamed to BUCKET_DIR when
+    all the files are read, so a partition is never left half done. TTAAII and code of
+    the bucket names are taken from the climat filename or from ttaaii and code, if
+    the filename does not have them.
+    Returns the number of rows in each bucket.
+    """
+    bucket_dir = os.path.join(work_dir, BUCKET_DIR)
+    partial_dir = bucket_dir + '.partial'
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir)
+    buckets = Buckets(partial_dir)
+    try:
+        for climat_filename in climat_filenames:
+            parts = os.path.basename(climat_filename).split('_')
+            file_ttaaii = parts[0] if len(parts) == 5 else ttaaii
+            file_code = parts[3] if len(parts) == 5 else code
+            for mapped, start, end in climat2bufr.mapped_row_spans(climat_filename):
+                row = mapped[start:end].strip()
+                if not row or row == b'*':
+                    continue
+                row_ttaaii, month = row_bucket(row, file_ttaaii)
+                buckets.add(bucket_name(row_ttaaii, month, file_code), row)
+    finally:
+        buckets.close()
+    shutil.rmtree(bucket_dir, ignore_errors=True)
+    os.replace(partial_dir, bucket_dir)
+    return buckets.rows
+
+def input_files(climat_filenames):
+    """
+    This function returns the size and the modification time of each climat file
+    by its absolute path.
+    """
+    inputs = {}
+    for climat_filename in climat_filenames:
+        stat = os.stat(climat_filename)
+        inputs[os.path.abspath(climat_filename)] = [stat.st_size, stat.st_mtime_ns]
+    return inputs
+
+def changed_inputs(progress, climat_filenames):
+    """
+    This function returns the climat files which are new, removed or changed since
+    the partition of progress, sorted by name.
+    """
+    partitioned = progress.get('inputs') or {}
+    inputs = input_files(climat_filenames)
+    return sorted(name for name in set(partitioned) | set(inputs)
+        if partitioned.get(name) != inputs.get(name))
+
+def load_progress(work_dir):
+    """
+    This function returns the progress of the backfill in work_dir: the rows of each
+    bucket (None, if the partition is not done), the bufr files of converted buckets
+    and the climat files of the partition (input_files).
+    """
+    try:
+        with open(os.path.join(work_dir, PROGRESS_FILE), 'r', encoding="utf8") as progress_file:
+            return json.load(progress_file)
+    except FileNotFoundError:
+        return {'buckets': None, 'converted': {}, 'inputs': None}
+
+def save_progress(work_dir, progress):
+    """
+    This function writes the progress to work_dir. The file is written first to
+    a temporary file, which is renamed, so the progress is never left half written.
+    """
+    descriptor, temporary_name = tempfile.mkstemp(suffix='.tmp', dir=work_dir)
+    try:
+        with os.fdopen(descriptor, 'w', encoding="utf8") as progress_file:
+            json.dump(progress, progress_file, indent=1, sort_keys=True)
+        os.chmod(temporary_name, FILE_MODE)
+        os.replace(temporary_name, os.path.join(work_dir, PROGRESS_FILE))
+    except BaseException:
+        if os.path.exists(temporary_name):
+            os.remove(temporary_name)
+        raise
+
+def encode_buckets(names, work_dir, args, progress):
+    """
+    Step 2. Converts the bucket files (names) to bufr files in args.jobs worker processes
+    (climat2bufr.try_convert_file) and saves the progress of each bucket as soon as it is
+    converted (3.), in the order the buckets are finished. If the backfill is interrupted,
+    the buckets which are waiting are cancelled, so only the buckets which were being
+    converted at that moment can be converted again.
+    Returns the list of converted buckets and the list of failed buckets.
+    """
+    bucket_filenames = [os.path.join(work_dir, BUCKET_DIR, name) for name in names]
+    workers = min(len(names), args.jobs or 1)
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=climat2bufr.warm_eccodes,
+            initargs=(args.compress,))
+        futures = [pool.submit(climat2bufr.try_convert_file, bucket_filename, args, '', 1)
+            for bucket_filename in bucket_filenames]
+        results = (future.result() for future in as_completed(futures))
+    else:
+        results = map(climat2bufr.try_convert_file, bucket_filenames, repeat(args),
+            repeat(''), repeat(1))
+
+    converted = []
+    failed = []
+    try:
+        for bucket_filename, bufr_filenames, error_text in results:
+            name = os.path.basename(bucket_filename)
+            if error_text is not None:
+                climat2bufr.print_failure(bucket_filename, error_text)
+                failed.append(name)
+                continue
+            for bufr_filename in bufr_filenames:
+                print('bufr data in file: ', bufr_filename)
+            converted.append(name)
+            progress['converted'][name] = bufr_filenames
+            save_progress(work_dir, progress)
+    finally:
+        if pool is not None:
+            for future in futures:
+                future.cancel()
+            pool.shutdown()
+    return converted, failed
+
+def backfill(climat_filenames, args):
+    """
+    This function runs the backfill (steps 1. - 3.) of climat files with the options
+    (args) and returns the list of converted buckets and the list of failed buckets.
+    If the partition is done and climat files are given, they must be the files of
+    the partition (changed_inputs), otherwise BackfillInputError is raised. Without climat files
+    the backfill continues with the partition.
+    """
+    os.makedirs(args.work_dir, exist_ok=True)
+    progress = load_progress(args.work_dir)
+    if progress['buckets'] is None:
+        print('partitioning ' + str(len(climat_filenames)) + ' climat files')
+        inputs = input_files(climat_filenames)
+        progress['buckets'] = partition(climat_filenames, args.work_dir, args.code,
+            args.ttaaii)
+        progress['converted'] = {}
+        progress['inputs'] = inputs
+        save_progress(args.work_dir, progress)
+    elif climat_filenames and progress.get('inputs') is not None:
+        changed = changed_inputs(progress, climat_filenames)
+        if changed:
+            raise BackfillInputError('climat files have changed since the partition of '
+                + args.work_dir + ' (' + str(len(changed)) + ' new, removed or changed, e.g. '
+                + changed[0] + '), run with --restart to partition them again')
+    names = sorted(name for name in progress['buckets'] if name not in progress['converted'])
+    print(str(len(progress['buckets'])) + ' buckets, ' + str(len(names)) + ' to convert')
+    if not names:
+        return [], []
+    return encode_buckets(names, args.work_dir, args, progress)
+
+def main():
+    """
+    Main function gets the climat files and the options from command line and runs
+    the backfill. Returns 1, if any bucket failed.
+    """
+    parser = argparse.ArgumentParser(description='Convert an archive of climat files to '
+        + 'bufr files with one message for each TTAAII and month.')
+    parser.add_argument('climat_filenames', nargs='*', metavar='climat_filename',
+        help='climat files, directories or glob patterns (not needed when resuming)')
+    parser.add_argument('--work-dir', required=True, metavar='DIR',
+        help='directory for the buckets and the progress of the backfill')
+    parser.add_argument('--output-dir', metavar='DIR',
+        help='directory of the bufr files (default: current directory)')
+    parser.add_argument('--compress', action='store_true',
+        help='encode compressed bufr messages')
+    parser.add_argument('--max-subsets', type=climat2bufr.positive_int, metavar='N',
+        help='split the months to messages of at most N subsets')
+    parser.add_argument('--max-bytes', type=climat2bufr.positive_int, metavar='BYTES',
+        help='split the months to messages of at most BYTES bytes')
+    parser.add_argument('--split-files', action='store_true',
+        help='write each message to its own numbered file')
+    parser.add_argument('--jobs', type=int, metavar='N',
+        help='convert the buckets in N parallel processes')
+    parser.add_argument('--ttaaii', default='UNKNOWN',
+        help='TTAAII of the rows without it, if the climat filename has no TTAAII '
+        + '(default: UNKNOWN)')
+    parser.add_argument('--code', default='SC',
+        help='code of the bufr filenames for climat files without it (default: SC)')
+    parser.add_argument('--restart', action='store_true',
+        help='forget the progress in the work directory and start from the beginning')
+    args = parser.parse_args()
+
+    if args.restart:
+        shutil.rmtree(os.path.join(args.work_dir, BUCKET_DIR), ignore_errors=True)
+        if os.path.exists(os.path.join(args.work_dir, PROGRESS_FILE)):
+            os.remove(os.path.join(args.work_dir, PROGRESS_FILE))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if not args.climat_filenames and load_progress(args.work_dir)['buckets'] is None:
+        parser.error('give climat files or the work directory of an unfinished backfill')
+    try:
+        converted, failed = backfill(climat2bufr.expand_inputs(args.climat_filenames), args)
+    except BackfillInputError as err:
+        parser.error(str(err))
+    climat2bufr.print_summary(converted, failed)
+    return 1 if failed else None
+
+if __name__ == '__main__':
+    sys.exit(main())
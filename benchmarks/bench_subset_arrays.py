@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the interleaved arrays of replicated descriptors in subset_arrays.py.
+The vectorized functions of subset_arrays are timed against the Python append loops
+which they replaced, and the results are checked to be the same.
+Run by command: python3 benchmarks/bench_subset_arrays.py [number_of_subsets]
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import subset_arrays as subA
+import climat2bufr
+
+SAMPLE_FILE = 'ISCD02_YYYY-MM-DD_HH:MI_SC_timestamp.dat'
+REPEATS = 5
+
+def loop_make_list(list_of_lists, n_sub):
+    """
+    The replaced make_list: interleaves the lists by nested append loops.
+    """
+    result_list = []
+    mask_list = []
+    for sub in range(0, n_sub):
+        for l in list_of_lists:
+            result_list.append(np.ma.getdata(l)[sub])
+            mask_list.append(np.ma.getmaskarray(l)[sub])
+    return subA.masked_array(np.array(result_list), mask_list, subA.fill_value_of(list_of_lists))
+
+def loop_make_const_list(constant_list, n_sub):
+    """
+    The replaced make_const_list: appends the constants for each subset.
+    """
+    result_list = []
+    for i in range(0, n_sub):
+        for j in range(0, len(constant_list)):
+            result_list.append(constant_list[j])
+    return result_list
+
+def loop_height_of_sensor(elanem_list, elterm_list):
+    """
+    The replaced height_of_sensor: appends the sensor heights of each subset.
+    """
+    none = subA.missing_array(len(elanem_list), subA.missD)
+    return loop_make_list([elterm_list, none, elterm_list, elanem_list, none, none,
+        elterm_list, none, none], len(elanem_list))
+
+def int_columns(number_of_columns, ns, rng):
+    """
+    Returns masked integer columns of ns values, about 10 % of them missing.
+    """
+    return [subA.masked_array(rng.randint(0, 31, ns), rng.random_sample(ns) < 0.1, subA.miss)
+        for _ in range(0, number_of_columns)]
+
+def best_time(function, *args):
+    """
+    Returns the best time of REPEATS calls of function(*args) and its result.
+    """
+    best = None
+    for _ in range(0, REPEATS):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+def same(a, b):
+    """
+    Checks that the values for eccodes are the same.
+    """
+    return np.array_equal(np.asarray(subA.eccodes_values(a)), np.asarray(subA.eccodes_values(b)))
+
+def compare(name, loop_function, vector_function, *args):
+    """
+    Times the loop and the vectorized function and prints the speedup.
+    """
+    loop_seconds, loop_result = best_time(loop_function, *args)
+    vector_seconds, vector_result = best_time(vector_function, *args)
+    if not same(loop_result, vector_result):
+        raise AssertionError(name + ': results differ')
+    print(name.ljust(12) + str(round(loop_seconds * 1000, 2)).rjust(10) + ' ms'
+        + str(round(vector_seconds * 1000, 2)).rjust(10) + ' ms'
+        + str(round(loop_seconds / vector_seconds, 1)).rjust(8) + ' x')
+
+def sample_columns(ns, sparse=False):
+    """
+    Returns the keys and the value columns of the sample climat file repeated to ns rows.
+    If sparse is True, sections S30 - S45 are missing like in the data of small stations.
+    """
+    sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', SAMPLE_FILE)
+    with open(sample, 'r', encoding="utf8") as climat_file:
+        keys, value_columns = climat2bufr.read_climat(climat_file)
+    rows = len(value_columns[0])
+    value_columns = [[column[i % rows] for i in range(0, ns)] for column in value_columns]
+    if sparse:
+        for i, key in enumerate(keys):
+            if key[:3] in ('S30', 'S31', 'S32', 'S33', 'S34', 'S35', 'S36', 'S37', 'S38',
+                    'S39', 'S40', 'S41', 'S42', 'S43', 'S44', 'S45'):
+                value_columns[i] = [subA.MISSING_VALUE] * ns
+    return keys, value_columns
+
+def subset_fields(keys, value_columns):
+    """
+    Makes a subset object and all its fields, as bufr_encode does.
+    """
+    subs = subA.Subset(keys, value_columns)
+    for name in subA.DERIVED_FIELDS:
+        getattr(subs, name)
+    return subs
+
+def main():
+    """
+    Runs the benchmark for the number of subsets given in command line (default 10 000).
+    """
+    ns = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = np.random.RandomState(1)
+    print('subsets: ' + str(ns))
+    print('function'.ljust(12) + 'loop'.rjust(13) + 'vectorized'.rjust(13) + 'speedup'.rjust(10))
+    compare('TNRA', loop_make_list, subA.make_list, int_columns(24, ns, rng), ns)
+    compare('TOT_MISS', loop_make_list, subA.make_list, int_columns(15, ns, rng), ns)
+    compare('DD', loop_make_list, subA.make_list, int_columns(10, ns, rng), ns)
+    compare('N_MISS', loop_make_const_list, subA.make_const_list,
+        [1, 2, 4, 7, 8, 6, 5, 1, 2, 3, 4, 5, 6, 7, 8], ns)
+    heights = [subA.str2float(['2.0'] * ns, 4), subA.str2float(['10.0'] * ns, 1)]
+    compare('SENSOR', loop_height_of_sensor, subA.height_of_sensor, *heights)
+
+    for sparse in (False, True):
+        keys, value_columns = sample_columns(ns, sparse)
+        seconds, _ = best_time(subset_fields, keys, value_columns)
+        name = 'Subset sparse' if sparse else 'Subset'
+        print(name.ljust(14) + str(round(seconds * 1000, 2)).rjust(21) + ' ms')
+
+if __name__ == '__main__':
+    main()
@@ -3,59 +3,62 @@
 """
 climat2bufr.py is the main program which converts climat data to bufr message (edition 4).
 Run program by command: python3 climat2bufr.py name_of_the_climat_file.dat
+Many files in one run: python3 climat2bufr.py --output-dir bufr_dir climat_dir/ 'ISCD*.dat'
+Compressed bufr message: python3 climat2bufr.py --compress name_of_the_climat_file.dat
+Service watching a spool directory: python3 climat2bufr.py --watch spool_dir --output-dir bufr_dir
 """
+import os
 import sys
+import glob
+import mmap
+import time
+import shutil
+import signal
+import argparse
+import tempfile
 import traceback
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
 from eccodes import *
 import subset_arrays as subA
 import separate_keys_and_values
+import station_catalog
+import result_cache
+import subset_cache
+import corrections
+import column_cache
+from file_mode import FILE_MODE
+from climat_errors import ClimatError, FilenameError, ClimatDataError, EncodingError
 
 VERBOSE = 1
-
-def print_error_message(error_code, text):
+MASTER_TABLES_VERSION = 35 # 14
+CENTRE = 86
+DESCRIPTORS = [301150, 307073]
+TEMPLATE_CACHE_SIZE = 16
+BUFR_TEMPLATES = {}
+RANK_KEYS = {}
+UNCOMPRESSED_SIZES = []
+SPLICE_HEADER = []
+MMAP_MIN_SIZE = 64 * 1024 * 1024
+
+def climat_error(error_code, text, row=None):
     """
-    This function prints out error message and stops program.
+    This function returns the exception of an error in climat data, which is raised by
+    the caller.
         If error_code = 0: Error is with naming the bufr file according to the first row of
-        climat data file.
-        If error_code = 1: Error is with the data structure in climat file.
+        climat data file (FilenameError).
+        If error_code = 1: Error is with the data structure in climat file (ClimatDataError),
+        row is the number of the bad row.
         Function gets argument text, which adds information to the error text.
     """
-    print('\nError in climat data:\n')
     if error_code == 0:
-        print('Error with naming the bufr file.')
-        print('The input climat data shoud be: ')
-        print('FILENAME: TTAAII_year-month-day_hour:minute_code_datetime.dat')
-        print(text)
-    elif error_code == 1:
-        print('Row in climat data with n data values should be: ')
-        print('keyname1=value1,keyname2=value2,keyname3=value3,...,keynamen=valuen,*')
-        print(text)
-    sys.exit(1)
-
+        return FilenameError('Error with naming the bufr file.\n'
+            + 'The input climat data shoud be: \n'
+            + 'FILENAME: TTAAII_year-month-day_hour:minute_code_datetime.dat\n' + text)
+    return ClimatDataError('Row in climat data with n data values should be: \n'
+        + 'keyname1=value1,keyname2=value2,keyname3=value3,...,keynamen=valuen,*\n' + text, row)
 
-def check_data(data):
-    """
-    This function checks if the data section in climat file is written correctly.
-    Argument data is the data in climat file.
-    """
-    try:
-        data[0]
-    except IndexError:
-        print_error_message(1, 'climat file seems not to have any data.\n')
-
-    for i in range(1, len(data)):
-        if ',' not in data[i] or '=' not in data[i] or '*' not in data[i]:
-            message = 'climat file has bad data in row ' + str(i) + '.\n'
-            print_error_message(1, message)
-    for i in range(1, len(data)):
-        if ',=' in data[i] or '=,' in data[i]:
-            message = 'climat file has bad data in row ' + str(i) + '.\n'
-            print_error_message(1, message)
-        elif '=*' in data[i] or '*=' in data[i]:
-            message = 'climat file has bad data in row ' + str(i) + '.\n'
-            print_error_message(1, message)
-
-    return data
 
 def read_filename(row):
     """
@@ -95,144 +98,829 @@ def read_filename(row):
 
 def read_climat(rows):
     """
-    Separates climat data to key and value arrays:
-        1. Splits rows from ",", -> [ [key=value], [key=value], ...]
-        2. Splits: [key=value] in each row to [key, value] and the last value from "*".
+    Reads climat data row by row and separates it straight to key and value columns.
+    Argument rows can be any iterable of climat rows, e.g. the opened climat file. A row
+    can also be a tuple of the values of a row with the keys of the first row, which
+    mapped_rows has already matched.
+        1. Empty rows are skipped. The keys of the first row are the shared header of
+        the rows: a pattern is compiled of them (separate_keys_and_values.row_pattern) and
+        the next rows with the same keys in the same order are read by position only
+        (match_row). Other rows are split to keys and values by
+        separate_keys_and_values.split_row, which also checks that the row is written
+        correctly.
+        2. Each value is appended to the column of its key. A key which is met for the first
+        time gets a new column, which is filled with missing values for the earlier rows.
+        3. If the row does not have all the keys, columns of the missing keys get a missing
+        value.
+    Returns the list of keys and the list of value columns in the same order.
+    ClimatDataError is raised, if a row is written wrongly or there is no data.
     """
-    # 1.
-    split_rows = []
-    for row in rows:
-        split_rows.append(row.split(','))
+    keys = []
+    columns = {}
+    value_columns = []
+    number_of_rows = 0
+    pattern = None
+    header_columns = []
+
+    for i, row in enumerate(rows):
+        # 1.
+        if pattern is not None:
+            if isinstance(row, tuple):
+                row_values = row
+            else:
+                row_values = separate_keys_and_values.match_row(pattern, row)
+            if row_values is not None:
+                for column, value in zip(header_columns, row_values):
+                    column.append(value)
+                if len(value_columns) > len(header_columns):
+                    for column in value_columns[len(header_columns):]:
+                        column.append(separate_keys_and_values.MISSING_VALUE)
+                number_of_rows = number_of_rows + 1
+                continue
+        if not row.strip():
+            continue
+        try:
+            row_keys, row_values = separate_keys_and_values.split_row(row)
+        except ValueError as err:
+            message = 'climat file has bad data in row ' + str(i + 1) + ': ' + str(err) + '\n'
+            raise climat_error(1, message, i + 1)
+
+        # 2.
+        if row_keys == keys:
+            for j in range(0, len(row_values)):
+                value_columns[j].append(row_values[j])
+        else:
+            for key, value in zip(row_keys, row_values):
+                column = columns.get(key)
+                if column is None:
+                    column = [separate_keys_and_values.MISSING_VALUE] * number_of_rows
+                    columns[key] = column
+                    keys.append(key)
+                    value_columns.append(column)
+                column.append(value)
+            # 3.
+            for column in value_columns:
+                if len(column) == number_of_rows:
+                    column.append(separate_keys_and_values.MISSING_VALUE)
+        if pattern is None:
+            pattern = separate_keys_and_values.row_pattern(row_keys)
+            header_columns = [columns[key] for key in row_keys]
+        number_of_rows = number_of_rows + 1
+
+    if number_of_rows == 0:
+        raise climat_error(1, 'climat file seems not to have any data.\n')
+
+    return keys, value_columns
+
+def mapped_rows(climat_filename):
+    """
+    Reads a large climat file by memory-mapping it and yields its rows one by one to
+    read_climat (mapped_row_spans). The rows which have the keys of the first row in
+    the same order are matched by a bytes pattern (separate_keys_and_values.row_pattern)
+    straight in the mapped file, and only their values are decoded and yielded as a tuple.
+    Other rows are decoded and yielded as text, which read_climat splits by split_row.
+    So no text is made of the keys of the rows and the peak memory stays close to the size
+    of the value columns.
+    """
+    pattern = None
+    for mapped, start, end in mapped_row_spans(climat_filename):
+        if pattern is not None:
+            match = pattern.fullmatch(mapped, start, end)
+            if match is not None:
+                yield tuple(value.decode('utf8') for value in match.groups())
+                continue
+        row = mapped[start:end].decode('utf8')
+        if pattern is None and row.strip():
+            try:
+                row_keys = separate_keys_and_values.split_row(row)[0]
+            except ValueError:
+                row_keys = None
+            if row_keys is not None:
+                pattern = separate_keys_and_values.row_pattern(row_keys, binary=True)
+        yield row
+
+def mapped_row_spans(climat_filename):
+    """
+    Memory-maps a climat file and yields the mapped file and the start and the end of each
+    row in it. A row is found by scanning the '*' terminator with mmap.find (in C, like
+    memchr) and the line breaks and empty lines before it are skipped, so nothing is copied
+    out of the file. A row must end on its own line as in the line-based reading, so
+    ClimatDataError is raised, if a line has no '*' at its end.
+    """
+    with open(climat_filename, 'rb') as climat_file:
+        if os.fstat(climat_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(climat_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            size = len(mapped)
+            start = 0
+            while start < size:
+                end = mapped.find(b'*', start)
+                if end == -1:
+                    end = size - 1
+                while start < end and mapped[start] in (10, 13):
+                    start = start + 1
+                newline = mapped.find(b'\n', start, end)
+                while newline != -1 and not mapped[start:newline].strip():
+                    start = newline + 1
+                    newline = mapped.find(b'\n', start, end)
+                if newline != -1:
+                    line = mapped[:newline].count(b'\n') + 1
+                    message = ('climat file has bad data in row ' + str(line)
+                        + ': row does not end with ,*\n')
+                    raise climat_error(1, message, line)
+                yield mapped, start, end + 1
+                start = end + 1
+
+def most_common(values):
+    """
+    Returns the most common value in the values array. If there are several, the smallest
+    of them is returned. Missing values count as the eccodes missing value.
+    """
+    unique, counts = np.unique(subA.eccodes_values(values), return_counts=True)
+    return int(unique[np.argmax(counts)])
 
-    number_of_rows =  len(split_rows)
+def template_key(number_of_subsets, compressed):
+    """
+    Returns the key of the bufr template for number_of_subsets in BUFR_TEMPLATES.
+    Compressed and uncompressed messages have their own templates.
+    """
+    return (number_of_subsets, MASTER_TABLES_VERSION, CENTRE, compressed)
 
-    # 2.
-    rows_with_key_value_pairs = []
-    for i in range(0, number_of_rows):
-        key_value_array = []
-        row = split_rows[i]
-        number_of_arguments = len(row)
-        if '*' not in row[number_of_arguments-1]:
-            print("Error: Data row does not end with *")
-            print(row[number_of_arguments-1])
-            sys.exit(1)
-        for j in range(0, number_of_arguments -1):
-            key_value_pair = row[j]
-            split_key_value = key_value_pair.split('=')
-            key_value_array.append(split_key_value)
-        rows_with_key_value_pairs.append(key_value_array)
-    return rows_with_key_value_pairs
-
-def message_encoding(input_file, input_filename):
+def new_bufr_message(number_of_subsets, compressed=False):
     """
-    Main sends input file here.
-    1. Reads lines from input_file and checks (check_name) if file's first row
-    contains right parts for naming the output file. After that it checks (check_data)
-    if the climat data in input_file contains right parts for fetching the data.
-    2. Sends the first row of input file to read_filename to get the name for the
-    output file. After that it checks if output has a right amount of values for naming
-    the file.
-    3. Calls read_climat to get keys and values from input file.
-    4. Separates keys and values to their own arrays and makes subset array objects.
-    Keys and values are separated by separate_keys_and_values module.
-    Subset object has all the values from different subsets in the same array
-    according to key-name.
-    5. separate_keys_and_values module's longest_row function is used to choose the key
-    row from keys_in_each_row, which has the biggest amount of key names.
-    6. The bufr message sceleton is made from a sample (edition 4).
-    7. Sends the bufr sceleton and subset_array to bufr_encode to fill the bufr message.
-    8. Output filename is named by the parts from the first row of the data (output) and
-    the name of the centre.
-    9. Output file is opened, bufr message is written to it and output filename is
-    returned to main function.
+    Returns new bufr message for number_of_subsets. If compressed is True, the message
+    is encoded with compressedData = 1.
+    If BUFR_TEMPLATES has a template with the same key (template_key), the message is
+    cloned from it and unpacked, so the descriptors 301150 and 307073 are already expanded
+    and only the data keys need to be set. Otherwise the message is made from a sample
+    (edition 4) and all the header keys and the descriptors are set.
+    """
+    template = BUFR_TEMPLATES.get(template_key(number_of_subsets, compressed))
+    if template is not None:
+        bufr = codes_clone(template)
+        codes_set(bufr, 'unpack', 1)
+        return bufr
+
+    bufr = codes_bufr_new_from_samples('BUFR4')
+    codes_set(bufr, 'edition', 4)
+    codes_set(bufr, 'masterTableNumber', 0)
+    codes_set(bufr, 'bufrHeaderCentre', CENTRE)
+    codes_set(bufr, 'bufrHeaderSubCentre', 0)
+    codes_set(bufr, 'updateSequenceNumber', 1)
+    codes_set(bufr, 'dataCategory', 0)
+    codes_set(bufr, 'internationalDataSubCategory', 0)
+    codes_set(bufr, 'dataSubCategory', 1)
+    codes_set(bufr, 'masterTablesVersionNumber', MASTER_TABLES_VERSION)
+    codes_set(bufr, 'localTablesVersionNumber', 0)
+    codes_set(bufr, 'observedData', 1)
+    codes_set(bufr, 'numberOfSubsets', number_of_subsets)
+    codes_set(bufr, 'compressedData', 1 if compressed else 0)
+    # codes_set_array(bufr, 'inputDelayedDescriptorReplicationFactor', subs.DEL)
+    # codes_set(bufr, 'unexpandedDescriptors', 307073)
+    codes_set_array(bufr, 'unexpandedDescriptors', DESCRIPTORS)
+    return bufr
+
+def keep_template(bufr, number_of_subsets, compressed):
+    """
+    Keeps a clone of the encoded bufr message as the template for the next messages with
+    the same key (template_key). Every message sets the same data keys, so the values left
+    from the template are always overwritten. At most TEMPLATE_CACHE_SIZE templates are
+    kept, the oldest one is released first.
+    """
+    key = template_key(number_of_subsets, compressed)
+    if key in BUFR_TEMPLATES:
+        return
+    if len(BUFR_TEMPLATES) >= TEMPLATE_CACHE_SIZE:
+        codes_release(BUFR_TEMPLATES.pop(next(iter(BUFR_TEMPLATES))))
+    BUFR_TEMPLATES[key] = codes_clone(bufr)
+
+def release_templates():
     """
+    Releases all the cached bufr templates.
+    """
+    for template in BUFR_TEMPLATES.values():
+        codes_release(template)
+    BUFR_TEMPLATES.clear()
+
+def split_by_month(keys, value_columns):
+    """
+    A BUFR message shall contain reports for one specific month only. This function
+    groups the rows by the month (YYYY-MM) of REPORT_MONTH and returns a list of
+    (month, value_columns) pairs in the order of months. If all the rows are from the same
+    month (or there is no REPORT_MONTH), value_columns are returned as the only group.
+    """
+    if 'REPORT_MONTH' not in keys:
+        return [('', value_columns)]
+
+    months = value_columns[keys.index('REPORT_MONTH')]
+    rows_by_month = {}
+    for i, month in enumerate(months):
+        rows_by_month.setdefault(month[:7], []).append(i)
+    if len(rows_by_month) == 1:
+        return [(months[0][:7], value_columns)]
+
+    groups = []
+    for month in sorted(rows_by_month):
+        rows = rows_by_month[month]
+        groups.append((month, [[column[i] for i in rows] for column in value_columns]))
+    return groups
+
+def subsets_for_size(max_bytes):
+    """
+    Returns the biggest number of subsets, which fit in a bufr message of max_bytes
+    according to the size of uncompressed message (uncompressed_message_size). Compressed
+    messages are usually smaller, so for them the number is an estimate. At least one
+    subset is returned.
+    """
+    number_of_subsets = 1
+    while uncompressed_message_size(number_of_subsets * 2) <= max_bytes:
+        number_of_subsets = number_of_subsets * 2
+    step = number_of_subsets // 2
+    while step > 0:
+        if uncompressed_message_size(number_of_subsets + step) <= max_bytes:
+            number_of_subsets = number_of_subsets + step
+        step = step // 2
+    return number_of_subsets
+
+def split_to_chunks(groups, max_subsets=None, max_bytes=None):
+    """
+    Splits the groups of value columns (split_by_month) to windows of at most max_subsets
+    subsets and at most max_bytes bytes (subsets_for_size), so that each window is
+    encoded as its own bufr message. Returns list of (month, value_columns) pairs.
+    """
+    limit = max_subsets
+    if max_bytes:
+        by_size = subsets_for_size(max_bytes)
+        limit = by_size if not limit else min(limit, by_size)
+    if not limit:
+        return groups
+
+    chunks = []
+    for month, value_columns in groups:
+        number_of_rows = len(value_columns[0])
+        if number_of_rows <= limit:
+            chunks.append((month, value_columns))
+            continue
+        for start in range(0, number_of_rows, limit):
+            chunks.append((month, [column[start:start + limit] for column in value_columns]))
+    return chunks
+
+def encode_columns(keys, value_columns, compress=False):
+    """
+    Makes subset array object from keys and value columns, encodes it to a bufr message
+    (encode_subset) and returns the message as bytes. This function is also run in the
+    worker processes of encode_groups.
+    """
+    return encode_subset(subA.Subset(keys, value_columns), compress)
 
+def encode_subset(subset_array, compress=False):
+    """
+    Encodes subset array object to a bufr message (encode_message) and returns the message
+    as bytes. This function is also run in the worker processes of encode_subsets.
+    """
+    bufr = encode_message(subset_array, compress)
+    message = codes_get_message(bufr)
+    codes_release(bufr)
+    return message
+
+def encode_subsets(subsets, compress=False, jobs=None):
+    """
+    Encodes each subset array object (e.g. from column_cache.ColumnCache.load) to its own
+    bufr message as encode_groups does and returns the messages in the same order.
+    """
+    workers = min(len(subsets), jobs or os.cpu_count() or 1)
+    if workers == 1:
+        return [encode_subset(subset_array, compress) for subset_array in subsets]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(encode_subset, subsets, repeat(compress)))
+
+def encode_groups(keys, groups, compress=False, jobs=None, cache=None, segments=None):
+    """
+    Encodes each group of value columns (split_by_month) to its own bufr message and
+    returns the messages in the order of groups. If there are several groups, they are
+    encoded in parallel in a pool of worker processes (at most jobs processes, by
+    default one for each cpu).
+    If result cache (cache) is given, the messages of the groups which are in the cache
+    are not encoded again (cached_groups). If cache of subset segments (segments) is
+    given, uncompressed messages are spliced from the segments of the stations and only
+    the changed stations are encoded (spliced_groups).
+    """
+    if cache is not None:
+        return cached_groups(keys, groups, compress, jobs, cache, segments)
+    if segments is not None and not compress:
+        return spliced_groups(keys, groups, jobs, segments)
+    columns_of_groups = [value_columns for month, value_columns in groups]
+    workers = min(len(groups), jobs or os.cpu_count() or 1)
+    if workers == 1:
+        return [encode_columns(keys, value_columns, compress) for value_columns in columns_of_groups]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(encode_columns, repeat(keys), columns_of_groups, repeat(compress)))
+
+def cached_groups(keys, groups, compress, jobs, cache, segments=None):
+    """
+    Returns the bufr messages of the groups by result cache (cache). Each group is looked
+    up by the hash of its rows and the encoder settings (result_cache.message_key). Only
+    the groups which are not in the cache are encoded (encode_groups) and they are added
+    to the cache.
+    """
+    settings = (MASTER_TABLES_VERSION, CENTRE, DESCRIPTORS, compress)
+    message_keys = [result_cache.message_key(keys, value_columns, settings)
+        for month, value_columns in groups]
+    messages = [cache.get(key) for key in message_keys]
+    missing = [i for i, message in enumerate(messages) if message is None]
+    if missing:
+        encoded = encode_groups(keys, [groups[i] for i in missing], compress, jobs,
+            segments=segments)
+        for i, message in zip(missing, encoded):
+            cache.put(message_keys[i], message)
+            messages[i] = message
+    return messages
+
+def spliced_groups(keys, groups, jobs, segments):
+    """
+    Returns the uncompressed bufr messages of the groups spliced from the encoded subsets
+    (segments) of the stations, which are byte by byte the same as the encoded messages.
+        1. Each row is looked up in the cache of segments (segments) by its hash
+        (subset_cache.row_keys).
+        2. The rows which are not in the cache are encoded (encode_groups) and their
+        segments are cut from the messages (subset_cache.subset_segments) and cached.
+        3. Each message is spliced from the header of an empty message (splice_header)
+        and the segments of its rows. The typical date of the message is given by the
+        rows as in bufr_encode (typical_date). If the typical date is missing, the
+        group is encoded as a whole.
+    """
     # 1.
-    rows_in_input_file = input_file.readlines()
-    rows_in_input_file = check_data(rows_in_input_file)
+    header, subset_bits = splice_header()
+    settings = (MASTER_TABLES_VERSION, CENTRE, DESCRIPTORS)
+    hashes = [subset_cache.row_keys(keys, value_columns, settings)
+        for month, value_columns in groups]
+    segments_of_groups = [[segments.get(key) for key in row_hashes] for row_hashes in hashes]
 
     # 2.
-    #output = read_filename(rows_in_input_file[0])
-    output = input_filename.split('_')
-
+    changed = []
+    for month, value_columns in groups:
+        rows = [i for i, segment in enumerate(segments_of_groups[len(changed)])
+            if segment is None]
+        changed.append((month, rows, [[column[i] for i in rows] for column in value_columns]))
+    changed_groups = [(month, columns) for month, rows, columns in changed if rows]
+    encoded = iter(encode_groups(keys, changed_groups, False, jobs) if changed_groups else [])
+    for j, (month, rows, columns) in enumerate(changed):
+        if not rows:
+            continue
+        for i, segment in zip(rows, subset_cache.subset_segments(next(encoded), subset_bits)):
+            segments.put(hashes[j][i], segment)
+            segments_of_groups[j][i] = segment
 
-    if len(output) != 5:
-        print_error_message(0, '\n')
     # 3.
-    data_in = read_climat(rows_in_input_file)
+    messages = []
+    for (month, value_columns), segments_of_group in zip(groups, segments_of_groups):
+        date = typical_date(keys, value_columns)
+        if date is None:
+            messages.append(encode_columns(keys, value_columns))
+            continue
+        messages.append(subset_cache.splice_message(header, segments_of_group, subset_bits,
+            date))
+    return messages
+
+def splice_header():
+    """
+    Returns the sections 0 - 3 of an empty uncompressed bufr message and the number of
+    bits in one subset (by uncompressed_message_size). They are made once and kept in
+    SPLICE_HEADER.
+    """
+    if not SPLICE_HEADER:
+        uncompressed_message_size(1)
+        bufr = new_bufr_message(1)
+        codes_set(bufr, 'pack', 1)
+        message = codes_get_message(bufr)
+        codes_release(bufr)
+        section4 = subset_cache.section_offsets(message)[2]
+        SPLICE_HEADER.append(message[:section4])
+        SPLICE_HEADER.append(int(round(UNCOMPRESSED_SIZES[1] * 8)))
+    return SPLICE_HEADER[0], SPLICE_HEADER[1]
 
-    # 4.
-    keys_in_each_row = []
-    sub_array = []
+def typical_date(keys, value_columns):
+    """
+    Returns the typical date (year, month, day, hour, minute, second) of the bufr message
+    of the value columns, which is set by bufr_encode. None is returned, if a value is
+    missing (does not fit in section 1).
+    """
+    subs = subA.Subset(keys, value_columns)
+    date = (most_common(subs.R_YYYY), most_common(subs.R_MM), most_common(subs.R_DD),
+        most_common(subs.R_HH0), most_common(subs.R_MI), 0)
+    if not 0 <= date[0] < 65535 or not all(0 <= value < 255 for value in date[1:]):
+        return None
+    return date
+
+def message_encoding(input_file, input_filename, compress=False, max_subsets=None,
+        max_bytes=None, split_files=False, output_dir=None, jobs=None, name_suffix='',
+        catalog=None, cache=None, segments=None, corrections_dir=None, columns=None):
+    """
+    Main sends input file here.
+    1. Checks that input_filename (without its directory) has the right parts for naming
+    the output file.
+    2. Calls read_climat, which reads input_file row by row and returns the keys and
+    the value columns of the climat data. If station catalog (catalog) is given, the
+    station metadata is filled from it (station_catalog.StationCatalog.fill).
+    3. Groups the rows by REPORT_MONTH (split_by_month), because a bufr message shall
+    contain reports for one specific month only. If max_subsets or max_bytes is given,
+    the groups are split further to smaller messages (split_to_chunks).
+    If corrections_dir is given, only the stations which have changed since the previous
+    conversion of the same TTAAII and month are kept (corrections.changed_groups).
+    If column cache (columns) is given and it has the converted columns of input_filename,
+    steps 2. - 3. are skipped (column_cache.ColumnCache.load). Otherwise the converted
+    columns are written to the column cache.
+    4. - 5. Sends the groups to encode_groups, which makes a subset array object and
+    a bufr message of each group. Subset object has all the values from different subsets
+    in the same array according to key-name. Groups are encoded by at most jobs processes.
+    If result cache (cache) is given, the messages of unchanged groups are taken from it.
+    If cache of subset segments (segments) is given, uncompressed messages are spliced
+    from the subsets of unchanged stations.
+    If compress is True, the messages are compressed and the size saved by compression
+    is printed.
+    6. Output filename is named by the parts from the input filename (output), the name
+    of the centre and name_suffix, which separates the files of the same name in a batch.
+    If output_dir is given, the output file is written there.
+    7. Bufr messages are written to the output file in the order of months (write_bufr_files).
+    If split_files is True, each message is written to its own file, which is numbered
+    after the output filename. An existing bufr file is never replaced, the output file
+    gets the next free suffix instead. List of output filenames is returned to main function.
+    Correction messages get the next updateSequenceNumber and the states of corrections
+    are saved after the messages are written. If no station has changed, no file is
+    written.
+    """
+    if columns is not None:
+        output = output_parts(input_filename)
+        subsets = columns.load(input_filename, max_subsets, max_bytes)
+        if subsets is None:
+            output, keys, groups = parse_climat(input_file, input_filename, max_subsets,
+                max_bytes)
+            subsets = [subA.Subset(keys, value_columns) for month, value_columns in groups]
+            columns.save(input_filename, subsets, max_subsets, max_bytes)
+        messages = encode_climat(None, None, compress, jobs, subsets=subsets)
+        return write_bufr_messages(messages, output, split_files, output_dir, name_suffix)
+
+    output, keys, groups = parse_climat(input_file, input_filename, max_subsets, max_bytes,
+        catalog)
+    states = None
+    if corrections_dir is not None:
+        groups, numbers, states = correction_groups(keys, groups, corrections_dir)
+        if not groups:
+            print('no changed stations in file: ', input_filename)
+            return []
+    messages = encode_climat(keys, groups, compress, jobs, cache, segments)
+    if states is not None:
+        messages = correction_messages(messages, numbers)
+    output_filenames = write_bufr_messages(messages, output, split_files, output_dir,
+        name_suffix)
+    if states is not None:
+        corrections.save_states(states)
+    return output_filenames
+
+def correction_groups(keys, groups, corrections_dir):
+    """
+    Returns the groups of the stations which have changed since the previous conversion
+    of the same TTAAII and month (corrections.changed_groups), the updateSequenceNumber
+    of each group and the new states of corrections in corrections_dir.
+    """
+    settings = (MASTER_TABLES_VERSION, CENTRE, DESCRIPTORS)
+    return corrections.changed_groups(corrections_dir, keys, groups, settings)
 
-    for i in range(0,len(data_in[0])):
-        sub_array.append([])
+def correction_messages(messages, numbers):
+    """
+    Returns the bufr messages with their updateSequenceNumbers (numbers).
+    The first conversion of TTAAII and month has number 1 as every message of bufr_encode.
+    """
+    return [corrections.set_update_sequence_number(message, number)
+        for message, number in zip(messages, numbers)]
 
-    for i in range(0, len(data_in)):
-        keys_in_each_row.append(separate_keys_and_values.get_keys(data_in[i]))
-        values = separate_keys_and_values.get_values(data_in[i])
+def parse_climat(input_file, input_filename, max_subsets=None, max_bytes=None, catalog=None):
+    """
+    Steps 1. - 3. of message_encoding. Returns the parts of input filename for naming
+    the output file, the keys and the groups of value columns of the climat data.
+    """
+    # 1.
+    output = output_parts(input_filename)
 
-        for j in range(0,len(values)):
-            sub_array[j].append(values[j])
+    # 2.
+    keys, value_columns = read_climat(input_file)
+    if catalog is not None:
+        keys, value_columns = catalog.fill(keys, value_columns)
 
-    # 5.
-    longest = separate_keys_and_values.longest_row(keys_in_each_row)
-    subset_array = subA.Subset(keys_in_each_row[longest], sub_array)
+    # 3.
+    groups = split_by_month(keys, value_columns)
+    groups = split_to_chunks(groups, max_subsets, max_bytes)
+    return output, keys, groups
 
-    # 6.
-    bufr = codes_bufr_new_from_samples('BUFR4')
+def output_parts(input_filename):
+    """
+    Step 1. of message_encoding. Returns the parts of input filename (without its
+    directory) for naming the output file.
+    """
+    output = os.path.basename(input_filename).split('_')
 
-    # 7.
+    if len(output) != 5:
+        raise climat_error(0, '\n')
+    return output
+
+def encode_climat(keys, groups, compress=False, jobs=None, cache=None, segments=None,
+        subsets=None):
+    """
+    Steps 4. - 5. of message_encoding. Returns the bufr messages of the groups. If subset
+    array objects of the groups (subsets) are given, they are encoded instead.
+    EncodingError is raised, if eccodes fails to encode a message.
+    """
     try:
-        bufr = bufr_encode(bufr, subset_array)
-    except CodesInternalError as err:
-        if VERBOSE:
-            traceback.print_exc(file=sys.stderr)
+        if subsets is not None:
+            messages = encode_subsets(subsets, compress, jobs)
         else:
-            sys.stderr.write(err.msg + '\n')
-        codes_release(bufr)
-        sys.exit(1)
+            messages = encode_groups(keys, groups, compress, jobs, cache, segments)
+    except CodesInternalError as err:
+        raise EncodingError('Error in encoding bufr message: ' + str(err) + '\n') from err
+    if compress:
+        for message in messages:
+            print(compression_report(message))
+    return messages
 
-    # 8.
+def write_bufr_messages(messages, output, split_files=False, output_dir=None, name_suffix=''):
+    """
+    Steps 6. - 7. of message_encoding. Writes the bufr messages to the output file(s) named
+    by the parts of input filename (output) and returns list of output filenames.
+    """
+    # 6.
+    bufr = codes_new_from_message(messages[0])
     centre = codes_get_string(bufr, 'bufrHeaderCentre')
+    codes_release(bufr)
     output_filename = output[0] + '_' + str(centre.upper()) + '_' + output[1] + '_' + output[3]
-    output_filename = output_filename + '.bufr'
+    output_filename += name_suffix
+    if output_dir:
+        output_filename = os.path.join(output_dir, output_filename)
+
+    # 7.
+    if not split_files or len(messages) == 1:
+        return write_bufr_files(output_filename, [messages])
+    return write_bufr_files(output_filename, [[message] for message in messages])
+
+def encode_messages(climat, compress=False, max_subsets=None, max_bytes=None, jobs=1,
+        catalog=None, cache=None, segments=None, corrections_dir=None):
+    """
+    Library function which converts climat data to bufr messages in memory, without
+    files. Argument climat is the climat text or any iterable of climat rows.
+    Returns the list of bufr messages (bytes) in the order of months. The options are
+    the same as in message_encoding, by default the messages are encoded in this process.
+    Station metadata is filled from station catalog (catalog), if it is given.
+    Unchanged messages are taken from result cache (cache) and uncompressed messages are
+    spliced from the subsets of unchanged stations (segments), if they are given.
+    If corrections_dir is given, only the messages of the changed stations are returned
+    and the states of corrections are saved at once.
+    Raises ClimatDataError (WigosError) for bad climat data and EncodingError, if eccodes
+    fails.
+    """
+    if isinstance(climat, str):
+        climat = climat.splitlines()
+    keys, value_columns = read_climat(climat)
+    if catalog is not None:
+        keys, value_columns = catalog.fill(keys, value_columns)
+    groups = split_by_month(keys, value_columns)
+    groups = split_to_chunks(groups, max_subsets, max_bytes)
+    states = None
+    if corrections_dir is not None:
+        groups, numbers, states = correction_groups(keys, groups, corrections_dir)
+        if not groups:
+            return []
+    try:
+        messages = encode_groups(keys, groups, compress, jobs, cache, segments)
+    except CodesInternalError as err:
+        raise EncodingError('Error in encoding bufr message: ' + str(err) + '\n') from err
+    if states is not None:
+        messages = correction_messages(messages, numbers)
+        corrections.save_states(states)
+    return messages
+
+def encode(climat, compress=False, max_subsets=None, max_bytes=None, jobs=1, catalog=None,
+        cache=None, segments=None, corrections_dir=None):
+    """
+    Library function which converts climat data (text or iterable of rows) to bufr and
+    returns the bufr messages (encode_messages) joined to one bytes object, which is
+    the content of the bufr file.
+        import climat2bufr
+        bufr = climat2bufr.encode(climat_text)
+    """
+    return b''.join(encode_messages(climat, compress, max_subsets, max_bytes, jobs, catalog,
+        cache, segments, corrections_dir))
 
-    # 9.
-    with open(output_filename, 'wb') as fout:
-        codes_write(bufr, fout)
-        fout.close()
+def write_bufr_files(output_filename, files):
+    """
+    Writes the bufr messages of each file (files) to the bufr files named after
+    output_filename: output_filename.bufr, if there is one file, and output_filename_1.bufr,
+    output_filename_2.bufr, ... otherwise.
+        1. The messages are written first to temporary files in the same directory
+        (write_temporary_file), so a reader never sees a partly written file.
+        2. The temporary files are linked to the final names, which fails if a name exists
+        (claim_names). On filesystems without hard links the names are created exclusively
+        and the temporary files are renamed over them. An existing bufr file, e.g. of another conversion or another
+        process writing to the same directory, is never replaced: if a name is taken,
+        the next suffix _2, _3, ... is added to output_filename.
+    Returns list of output filenames.
+    """
+    temp_filenames = []
+    try:
+        # 1.
+        for messages in files:
+            temp_filenames.append(write_temporary_file(output_filename, messages))
+
+        # 2.
+        number = 1
+        while True:
+            name = output_filename if number == 1 else output_filename + '_' + str(number)
+            if len(files) == 1:
+                output_filenames = [name + '.bufr']
+            else:
+                output_filenames = [name + '_' + str(i + 1) + '.bufr'
+                    for i in range(0, len(files))]
+            if claim_names(temp_filenames, output_filenames):
+                return output_filenames
+            number = number + 1
+    finally:
+        for temp_filename in temp_filenames:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+def write_temporary_file(output_filename, messages):
+    """
+    Writes bufr messages to a temporary file in the directory of output_filename and
+    returns its name. The file gets the permissions of files made by open (FILE_MODE).
+    """
+    directory = os.path.dirname(output_filename) or '.'
+    fd, temp_filename = tempfile.mkstemp(dir=directory, suffix='.tmp',
+        prefix='.' + os.path.basename(output_filename) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            for message in messages:
+                fout.write(message)
+        os.chmod(temp_filename, FILE_MODE)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
+    return temp_filename
+
+def claim_names(temp_filenames, output_filenames):
+    """
+    Claims the output filenames for the temporary files (claim_name), so the names are
+    claimed atomically also against other processes. The temporary files of the names
+    which could not be linked are renamed to them after all the names are claimed.
+    If any of the names is taken, the names claimed are removed and False is returned.
+    """
+    claimed = []
+    reserved = []
+    try:
+        for temp_filename, output_filename in zip(temp_filenames, output_filenames):
+            if not claim_name(temp_filename, output_filename):
+                reserved.append((temp_filename, output_filename))
+            claimed.append(output_filename)
+        for temp_filename, output_filename in reserved:
+            os.replace(temp_filename, output_filename)
+    except FileExistsError:
+        for output_filename in claimed:
+            os.remove(output_filename)
+        return False
+    except BaseException:
+        for output_filename in claimed:
+            os.remove(output_filename)
+        raise
+    return True
+
+def claim_name(filename, target):
+    """
+    Claims name target for file filename. The file is linked to target and True is
+    returned. If the filesystem has no hard links (e.g. some network shares) or target is
+    on another filesystem, an empty target is created exclusively and False is returned,
+    so the caller renames or moves the file over it. FileExistsError is raised, if target
+    exists.
+    """
+    try:
+        os.link(filename, target)
+        return True
+    except FileExistsError:
+        raise
+    except OSError:
+        os.close(os.open(target, os.O_CREAT | os.O_EXCL | os.O_WRONLY, FILE_MODE))
+        return False
+
+def encode_message(subs, compressed=False):
+    """
+    Makes new bufr message (new_bufr_message) and encodes subset_array object (subs)
+    to it by bufr_encode. If compressed message is asked and eccodes does not accept it,
+    the message is encoded again without compression.
+    """
+    bufr = new_bufr_message(subs.NSUB, compressed)
+    try:
+        return bufr_encode(bufr, subs)
+    except CodesInternalError:
+        codes_release(bufr)
+        if not compressed:
+            raise
+    sys.stderr.write('Compressed encoding failed, the message is encoded without compression.\n')
+    return encode_message(subs, False)
 
+def uncompressed_message_size(number_of_subsets):
+    """
+    Returns the size of the uncompressed bufr message with number_of_subsets in bytes.
+    Each subset of sequence 307073 has the same size in uncompressed message, so the
+    size of the header and the size of one subset are measured once from two empty
+    messages (1 and 9 subsets) and kept in UNCOMPRESSED_SIZES.
+    """
+    if not UNCOMPRESSED_SIZES:
+        sizes = []
+        for n in (1, 9):
+            bufr = new_bufr_message(n)
+            codes_set(bufr, 'pack', 1)
+            sizes.append(codes_get(bufr, 'totalLength'))
+            codes_release(bufr)
+        UNCOMPRESSED_SIZES.append(sizes[0])
+        UNCOMPRESSED_SIZES.append((sizes[1] - sizes[0]) / 8.0)
+    return int(UNCOMPRESSED_SIZES[0] + (number_of_subsets - 1) * UNCOMPRESSED_SIZES[1])
+
+def compression_report(message):
+    """
+    Returns text with the size of the bufr message (bytes) and the size saved by
+    compression.
+    """
+    bufr = codes_new_from_message(message)
+    size = len(message)
+    compressed = codes_get(bufr, 'compressedData') == 1
+    number_of_subsets = codes_get(bufr, 'numberOfSubsets')
     codes_release(bufr)
-    return output_filename
+    if not compressed:
+        return 'bufr message is not compressed: ' + str(size) + ' bytes'
+    uncompressed = uncompressed_message_size(number_of_subsets)
+    saved = uncompressed - size
+    return ('compressed bufr message: ' + str(size) + ' bytes, saved ' + str(saved)
+        + ' bytes (' + str(round(100.0 * saved / uncompressed, 1)) + ' %)')
+
+def set_array(ibufr, key, values, number_of_subsets, compressed):
+    """
+    Sets values of all the subsets to key. In uncompressed message values are given subset
+    by subset to key at once. In compressed message each occurrence (rank) of the key in
+    the subset is set separately with the values of all the subsets. Missing values are
+    given as the eccodes missing values (eccodes_values).
+    """
+    values = subA.eccodes_values(values)
+    if not compressed:
+        codes_set_array(ibufr, key, values)
+        return
+    ranks = np.asarray(values).reshape(number_of_subsets, -1)
+    for i, rank_key in enumerate(rank_keys(key, ranks.shape[1])):
+        codes_set_array(ibufr, rank_key, ranks[:, i])
+
+def rank_keys(key, number_of_values):
+    """
+    Returns the list of rank keys '#1#key', '#2#key', ... for number_of_values.
+    The lists are kept in RANK_KEYS, so each of them is formatted only once.
+    """
+    keys = RANK_KEYS.get(key)
+    if keys is None or len(keys) < number_of_values:
+        keys = ['#' + str(i + 1) + '#' + key for i in range(0, number_of_values)]
+        RANK_KEYS[key] = keys
+    return keys[:number_of_values]
+
+def set_string_array(ibufr, key, values, compressed):
+    """
+    Sets string values of all the subsets to key by one codes_set_string_array call.
+    In compressed message the key is the first occurrence ('#1#key').
+    If eccodes does not accept string array for the key of uncompressed message (older
+    eccodes versions), values are set one by one with the rank keys (rank_keys).
+    Missing strings are set empty.
+    """
+    values = ['' if value == subA.MISSING_VALUE else value for value in values]
+    if compressed:
+        codes_set_string_array(ibufr, '#1#' + key, values)
+        return
+    try:
+        codes_set_string_array(ibufr, key, values)
+    except CodesInternalError:
+        for rank_key, value in zip(rank_keys(key, len(values)), values):
+            codes_set(ibufr, rank_key, value)
 
 def bufr_encode(ibufr, subs):
     """
     Encodes a bufr message (ibufr) by subset_array object (subs).
     Subser_array object is used to get all the values in each subset.
+    The header keys and the descriptors are already set by new_bufr_message. The encoded
+    message is kept as the template for the next messages (keep_template).
+    Values are set by set_array and set_string_array, which take care of the
+    compressed messages.
     """
-    codes_set(ibufr, 'edition', 4)
-    codes_set(ibufr, 'masterTableNumber', 0)
-    codes_set(ibufr, 'bufrHeaderCentre', 86)
-    codes_set(ibufr, 'bufrHeaderSubCentre', 0)
-    codes_set(ibufr, 'updateSequenceNumber', 1)
-    codes_set(ibufr, 'dataCategory', 0)
-    codes_set(ibufr, 'internationalDataSubCategory', 0)
-    codes_set(ibufr, 'dataSubCategory', 1)
-    codes_set(ibufr, 'masterTablesVersionNumber', 35) # 14)
-    codes_set(ibufr, 'localTablesVersionNumber', 0)
-    codes_set(ibufr, 'observedData', 1)
-    codes_set(ibufr, 'numberOfSubsets', subs.NSUB)
-    codes_set(ibufr, 'compressedData', 0)
-    codes_set(ibufr, 'typicalYear', max(set(subs.R_YYYY), key = subs.R_YYYY.count))
-    codes_set(ibufr, 'typicalMonth', max(set(subs.R_MM), key = subs.R_MM.count))
-    codes_set(ibufr, 'typicalDay', max(set(subs.R_DD), key = subs.R_DD.count))
-    codes_set(ibufr, 'typicalHour', max(set(subs.R_HH0), key = subs.R_HH0.count))
-    codes_set(ibufr, 'typicalMinute', max(set(subs.R_MI), key = subs.R_MI.count))
+    nsub = subs.NSUB
+    compressed = codes_get(ibufr, 'compressedData') == 1
+    codes_set(ibufr, 'typicalYear', most_common(subs.R_YYYY))
+    codes_set(ibufr, 'typicalMonth', most_common(subs.R_MM))
+    codes_set(ibufr, 'typicalDay', most_common(subs.R_DD))
+    codes_set(ibufr, 'typicalHour', most_common(subs.R_HH0))
+    codes_set(ibufr, 'typicalMinute', most_common(subs.R_MI))
     codes_set(ibufr, 'typicalSecond', 0)
-    # codes_set_array(ibufr, 'inputDelayedDescriptorReplicationFactor', subs.DEL)
-    # codes_set(ibufr, 'unexpandedDescriptors', 307073)
-    codes_set_array(ibufr, 'unexpandedDescriptors', [301150, 307073])
 
     # WIGOS identyfier:
     # 301150:
@@ -241,14 +929,11 @@ def bufr_encode(ibufr, subs):
         # 001127: WIGOS issue number
         # 001128: WIGOS local identifier (character)
 
-    codes_set_array(ibufr, 'wigosIdentifierSeries', subs.WSI_IDS)
-    codes_set_array(ibufr, 'wigosIssuerOfIdentifier', subs.WSI_IDI)
-    codes_set_array(ibufr, 'wigosIssueNumber', subs.WSI_INR)
+    set_array(ibufr, 'wigosIdentifierSeries', subs.WSI_IDS, nsub, compressed)
+    set_array(ibufr, 'wigosIssuerOfIdentifier', subs.WSI_IDI, nsub, compressed)
+    set_array(ibufr, 'wigosIssueNumber', subs.WSI_INR, nsub, compressed)
 
-    for i in range(0, len(subs.WSI_LID)):
-        key = '#'+str(i+1)+'#wigosLocalIdentifierCharacter'
-        codes_set(ibufr, key, subs.WSI_LID[i])
-        # codes_set_string_array, codes_get_string_array do not work
+    set_string_array(ibufr, 'wigosLocalIdentifierCharacter', subs.WSI_LID, compressed)
 
     # (Representation of CLIMAT data of the actual month and for monthly normals):
     # 307073:  307071, 307072
@@ -256,15 +941,12 @@ def bufr_encode(ibufr, subs):
         # 301090: 301004, 301011, 301012, 301021, 7030, 7031
             # 301004: 1001, 1002, 1015, 2001:
             # block number, station number, station name, station type
-    codes_set_array(ibufr, 'blockNumber', subs.BLOCK_NUMBER)
-    codes_set_array(ibufr, 'stationNumber', subs.STATION_NUMBER)
+    set_array(ibufr, 'blockNumber', subs.BLOCK_NUMBER, nsub, compressed)
+    set_array(ibufr, 'stationNumber', subs.STATION_NUMBER, nsub, compressed)
 
-    # codes_set_array is not for string values: codes_set_string_array, codes_get_string_array
-    for i in range(0, len(subs.STATION_NAME)):
-        key = '#'+str(i+1)+'#stationOrSiteName'
-        codes_set(ibufr, key, subs.STATION_NAME[i])
+    set_string_array(ibufr, 'stationOrSiteName', subs.STATION_NAME, compressed)
 
-    codes_set_array(ibufr, 'stationType', subs.STATION_TYPE)
+    set_array(ibufr, 'stationType', subs.STATION_TYPE, nsub, compressed)
 
     # 301011: 4001, 4002, 4003: year, moth, day
     # 301012: 4004, 4005: hour, minute
@@ -275,15 +957,15 @@ def bufr_encode(ibufr, subs):
         # REPORT_MONTH=2024-11-01 : YYYY, MM, DD
         # HH24 = 0
 
-    codes_set_array(ibufr, 'minute', subs.MI) # Aseta 0
+    set_array(ibufr, 'minute', subs.MI, nsub, compressed) # Aseta 0
 
     # 301021: 5001, 6001: latitude, longitude
     # 7030: height of station ground above mean sea level
     # 7031: height of barometer above mean sea level
-    codes_set_array(ibufr, 'latitude', subs.LAT)
-    codes_set_array(ibufr, 'longitude', subs.LON)
-    codes_set_array(ibufr, 'heightOfStationGroundAboveMeanSeaLevel', subs.ELSTAT)
-    codes_set_array(ibufr, 'heightOfBarometerAboveMeanSeaLevel', subs.ELBARO)
+    set_array(ibufr, 'latitude', subs.LAT, nsub, compressed)
+    set_array(ibufr, 'longitude', subs.LON, nsub, compressed)
+    set_array(ibufr, 'heightOfStationGroundAboveMeanSeaLevel', subs.ELSTAT, nsub, compressed)
+    set_array(ibufr, 'heightOfBarometerAboveMeanSeaLevel', subs.ELBARO, nsub, compressed)
 
     # 4074 Short time period or displacement (see Note 3) = UTC – LT
         #1#timePeriod # TP = -2
@@ -504,7 +1186,7 @@ def bufr_encode(ibufr, subs):
             # If the highest daily mean temperature occurred on more than one day, the first
             # day shall be reported for 0 04 003 and the preceding entry 0 08 053 shall be set
             # to 1.
-    codes_set_array(ibufr, 'highestDailyMeanTemperature', subs.S40_TXD)
+    set_array(ibufr, 'highestDailyMeanTemperature', subs.S40_TXD, nsub, compressed)
 
     # 8053 Day of occurrence qualifier = 0 On 1 day only, = 1 On 2 or more days
         #2#dayOfOccurrenceQualifier
@@ -517,7 +1199,7 @@ def bufr_encode(ibufr, subs):
             # shall be reported for 0 04 003 and the preceding entry 0 08 053 shall be set to 1.
     # 12153 Lowest daily mean temperature
         #1#lowestDailyMeanTemperature
-    codes_set_array(ibufr, 'lowestDailyMeanTemperature', subs.S41_TND)
+    set_array(ibufr, 'lowestDailyMeanTemperature', subs.S41_TND, nsub, compressed)
 
     # 8053 Day of occurrence qualifier = 0 On 1 day only, = 1 On 2 or more days
         #3#dayOfOccurrenceQualifier
@@ -574,14 +1256,14 @@ def bufr_encode(ibufr, subs):
             # measured in knots and bit No. 3 set to 1 indicates that wind speed was originally
             # measured in kilometres per hour. Setting both bits No. 2 and No. 3 to 0 indicates
             # that wind speed was originally measured in metres per second.
-    codes_set_array(ibufr, 'instrumentationForWindMeasurement', subs.S45_IW)
+    set_array(ibufr, 'instrumentationForWindMeasurement', subs.S45_IW, nsub, compressed)
     # 8053 Day of occurrence qualifier = 0 On 1 day only, = 1 On 2 or more days
         #5#dayOfOccurrenceQualifier
     # 4003 Day
         #6#day # DD = S45_YFX
     # 11046 Maximum instantaneous wind speed
         #1#maximumInstantaneousWindSpeed
-    codes_set_array(ibufr, 'maximumInstantaneousWindSpeed', subs.S45_FX)
+    set_array(ibufr, 'maximumInstantaneousWindSpeed', subs.S45_FX, nsub, compressed)
 
     # 8053 Day of occurrence qualifier Set to missing (cancel)
         #6#dayOfOccurrenceQualifier
@@ -631,7 +1313,7 @@ def bufr_encode(ibufr, subs):
 
     # 13051 Frequency group, precipitation
         #1#frequencyGroupPrecipitation
-    codes_set_array(ibufr, 'frequencyGroupPrecipitation', subs.S16_RD) # S16_RD
+    set_array(ibufr, 'frequencyGroupPrecipitation', subs.S16_RD, nsub, compressed) # S16_RD
             # Frequency group in which the total amount of precipitation of the month falls shall
             # be reported using Code table 0 13 051 (Frequency group; precipitation).
             # Note: If for a particular month the total amount of precipitation is zero,
@@ -671,11 +1353,11 @@ def bufr_encode(ibufr, subs):
     # 8052 Condition for which number of days of occurrence follows
         #19..24#conditionForWhichNumberOfDaysOfOccurrenceFollows
         # subs.CND = 10, 11, 12, 13, 14, 15
-    codes_set_array(ibufr, 'conditionForWhichNumberOfDaysOfOccurrenceFollows', subs.CND)
+    set_array(ibufr, 'conditionForWhichNumberOfDaysOfOccurrenceFollows', subs.CND, nsub, compressed)
     # 8022 Total number (with respect to accumulation or average) Days
         #19..24#totalNumberWithRespectToAccumulationOrAverage
         # = S33_R01, S33_R05, S34_R10, S34_R50, S35_R100, S35_R150
-    codes_set_array(ibufr, 'totalNumberWithRespectToAccumulationOrAverage', subs.TNRA)
+    set_array(ibufr, 'totalNumberWithRespectToAccumulationOrAverage', subs.TNRA, nsub, compressed)
             # Number of days in the month with precipitation beyond certain thresholds shall be
             # reported using Total number (0 08 022) being preceded by Condition for which
             # number of days of occurrence follows (0 08 052) in each of the required six
@@ -692,12 +1374,12 @@ def bufr_encode(ibufr, subs):
     # Occurrence of extreme precipitation
     # 8053 Day of occurrence qualifier = 0 On 1 day only, = 1 On 2 or more days
         #7#dayOfOccurrenceQualifier
-    codes_set_array(ibufr, 'dayOfOccurrenceQualifier', subs.D_OC)
+    set_array(ibufr, 'dayOfOccurrenceQualifier', subs.D_OC, nsub, compressed)
     # 4003 Day
         #8#day # DD = S44_YR
     # 13052 Highest daily amount of precipitation
         #1#highestDailyAmountOfPrecipitation
-    codes_set_array(ibufr, 'highestDailyAmountOfPrecipitation', subs.S44_RX)  # 1.0 kg /m² ~ 1 mm
+    set_array(ibufr, 'highestDailyAmountOfPrecipitation', subs.S44_RX, nsub, compressed)  # 1.0 kg /m² ~ 1 mm
             # The day on which the highest daily amount of precipitation occurred shall be
             # reported using Day (0 04 003). If the highest daily amount of precipitation
             # occurred on only one day, the preceding entry 0 08 053 (Day of occurrence
@@ -750,13 +1432,13 @@ def bufr_encode(ibufr, subs):
 
     # 10004 Pressure
         #2#nonCoordinatePressure
-    codes_set_array(ibufr, 'nonCoordinatePressure', subs.P_ST) # S21_P [hPa] -> [Pa]
+    set_array(ibufr, 'nonCoordinatePressure', subs.P_ST, nsub, compressed) # S21_P [hPa] -> [Pa]
             # Normal value of pressure shall be reported using 0 10 004 (Pressure) in pascals
             # (with precision in tens of pascals).
 
     # 10051 Pressure reduced to mean sea level
         #2#pressureReducedToMeanSeaLevel
-    codes_set_array(ibufr, 'pressureReducedToMeanSeaLevel', subs.P_SEA) # S22_P [hPa] -> [Pa]
+    set_array(ibufr, 'pressureReducedToMeanSeaLevel', subs.P_SEA, nsub, compressed) # S22_P [hPa] -> [Pa]
 
     # 7004 Pressure Standard level # miss
         #2#pressure
@@ -773,33 +1455,33 @@ def bufr_encode(ibufr, subs):
         # subs.SENSOR #  ELTERM
     # 12101 Temperature/air temperature
         #4#airTemperature
-    codes_set_array(ibufr, 'airTemperature', subs.T) # S23_T
+    set_array(ibufr, 'airTemperature', subs.T, nsub, compressed) # S23_T
 
     # 2051 Indicator to specify observing method for extreme temperatures = 2
         #2#indicatorToSpecifyObservingMethodForExtremeTemperatures
-    codes_set_array(ibufr, 'indicatorToSpecifyObservingMethodForExtremeTemperatures', subs.IND) # 2
+    set_array(ibufr, 'indicatorToSpecifyObservingMethodForExtremeTemperatures', subs.IND, nsub, compressed) # 2
     # 4051 Principal time of daily reading of maximum temperature
         #2#principalTimeOfDailyReadingOfMaximumTemperature
     # 12118 Maximum temperature at height specified, past 24 hours
         #2#maximumTemperatureAtHeightSpecifiedPast24Hours
-    codes_set_array(ibufr, 'maximumTemperatureAtHeightSpecifiedPast24Hours', subs.TMAX) # S24_TX
+    set_array(ibufr, 'maximumTemperatureAtHeightSpecifiedPast24Hours', subs.TMAX, nsub, compressed) # S24_TX
     # 4052 Principal time of daily reading of minimum temperature
         #2#principalTimeOfDailyReadingOfMinimumTemperature
     # 12119 Minimum temperature at height specified, past 24 hours
         #2#minimumTemperatureAtHeightSpecifiedPast24Hours
-    codes_set_array(ibufr, 'minimumTemperatureAtHeightSpecifiedPast24Hours', subs.TMIN) # S24_TN
+    set_array(ibufr, 'minimumTemperatureAtHeightSpecifiedPast24Hours', subs.TMIN, nsub, compressed) # S24_TN
     # 13004 Vapour pressure
         #2#vapourPressure
             # Normal value of vapour pressure shall be reported using 0 13 004 (Vapour
             # pressure) in pascals (with precision in tens of pascals).
-    codes_set_array(ibufr, 'vapourPressure', subs.E) # S25_E [hPa] -> [Pa]
+    set_array(ibufr, 'vapourPressure', subs.E, nsub, compressed) # S25_E [hPa] -> [Pa]
 
     # 12151 Standard deviation of daily mean temperature
         #2#dailyMeanTemperatureStandardDeviation
             # Normal value of standard deviation of daily mean temperature shall be reported
             # using 0 12 151 in kelvin
             # standard deviation on suhdeluku, eli C -> K ei tarvii tehda, eika pidakkaan
-    codes_set_array(ibufr, 'dailyMeanTemperatureStandardDeviation', subs.TMEAN) #  S23_ST
+    set_array(ibufr, 'dailyMeanTemperatureStandardDeviation', subs.TMEAN, nsub, compressed) #  S23_ST
 
     # 7032 Height of sensor above local ground (or deck of marine platform) Set to missing
         #8#heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform # miss
@@ -816,7 +1498,7 @@ def bufr_encode(ibufr, subs):
             # 0 14 033 shall be set to 1.
             # (2) If the normal is zero hours, Total sunshine 0 14 033 shall be set to 510.
             # (3) If the normal is not defined, Total sunshine 0 14 033 shall be set to missing.
-    codes_set_array(ibufr, 'totalSunshine', subs.SUND) # S27_S # [h] tulee valmiina tunneissa
+    set_array(ibufr, 'totalSunshine', subs.SUND, nsub, compressed) # S27_S # [h] tulee valmiina tunneissa
 
     # 8023 First-order statistics Set to missing
         #7#firstOrderStatistics
@@ -825,7 +1507,7 @@ def bufr_encode(ibufr, subs):
         #4#year YYYY = S20_YB
     # 4001 Year Ending of the reference period
         #5#year
-    codes_set_array(ibufr, 'year', subs.YYYY) # S20_YC
+    set_array(ibufr, 'year', subs.YYYY, nsub, compressed) # S20_YC
             # Reference period for calculation of the normal values of precipitation shall be
             # reported using two consecutive entries 0 04 001 (Year). The first 0 04 001 shall
             # express the year of beginning of the reference period and the second 0 04 001
@@ -833,22 +1515,22 @@ def bufr_encode(ibufr, subs):
 
     # 4002 Month
         #3#month
-    codes_set_array(ibufr, 'month', subs.MM) # Reported month
+    set_array(ibufr, 'month', subs.MM, nsub, compressed) # Reported month
     # 4003 Day (see Note 5) = 1
         #10#day
-    codes_set_array(ibufr, 'day', subs.DD) # 1
+    set_array(ibufr, 'day', subs.DD, nsub, compressed) # 1
     # 4004 Hour (see Note 5) = 6
         #4#hour
-    codes_set_array(ibufr, 'hour', subs.HH24) # 6
+    set_array(ibufr, 'hour', subs.HH24, nsub, compressed) # 6
     # 4022 Time period or displacement = 1
         #6#timePeriod
             # The one-month period for which the normals of precipitation are reported shall be
             # specified by month (0 04 002), day (0 04 003) being set to 1, hour (0 04 004)
             # being set to 6 and time period (0 04 022) being set to 1, i.e. 1 month.
-    codes_set_array(ibufr, 'timePeriod', subs.TP) # 1
+    set_array(ibufr, 'timePeriod', subs.TP, nsub, compressed) # 1
         # 7032 Height of sensor above local ground (or deck of marine platform) (see Note 4)
         #9#heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform  # miss
-    codes_set_array(ibufr, 'heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform', subs.SENSOR)
+    set_array(ibufr, 'heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform', subs.SENSOR, nsub, compressed)
     # 8023 First-order statistics = 4 Mean value
         #8#firstOrderStatistics FS = 4
             # This datum shall be set to 4 (mean value) to indicate that the following entries
@@ -857,7 +1539,7 @@ def bufr_encode(ibufr, subs):
 
     # 13060 Total accumulated precipitation
         #2#totalAccumulatedPrecipitati
-    codes_set_array(ibufr, 'totalAccumulatedPrecipitation', subs.R_AC) # S26_R  1.0 kg /m² ~ 1 mm
+    set_array(ibufr, 'totalAccumulatedPrecipitation', subs.R_AC, nsub, compressed) # S26_R  1.0 kg /m² ~ 1 mm
             # Normal value of monthly amount of precipitation shall be reported in kilograms
             # per square metre (with precision in tenths of a kilogram per square metre) using
             # 0 13 060 (Total accumulated precipitation).
@@ -866,26 +1548,26 @@ def bufr_encode(ibufr, subs):
 
     # 4053 Number of days with precipitation equal to or more than 1 mm
         #2#numberOfDaysWithPrecipitationEqualToOrMoreThan1Mm
-    codes_set_array(ibufr, 'numberOfDaysWithPrecipitationEqualToOrMoreThan1Mm', subs.R_N) # S26_NR
+    set_array(ibufr, 'numberOfDaysWithPrecipitationEqualToOrMoreThan1Mm', subs.R_N, nsub, compressed) # S26_NR
             # Normal value of number of days in the month with precipitation equal to or
             # greater than 1 kilogram per square metre shall be reported using 0 04 053
             # (Number of days in the month with precipitation equal to or greater than 1 mm).
 
     # 8023 First-order statistics Set to missing
         #9#firstOrderStatistics
-    codes_set_array(ibufr, 'firstOrderStatistics', subs.FS) # miss
+    set_array(ibufr, 'firstOrderStatistics', subs.FS, nsub, compressed) # miss
     # 102008 Replicate 2 descriptors 8 times
     # 8050 Qualifier for number of missing values in calculation of statistic (see Note 6)
     # = 1 Pressure, = 2 Temperature, = 3 Extreme temperature, = 4 Vapour pressure,
     # = 5 Precipitation,= 6 Sunshine duration,  = 7 Maximum temperature, = 8 Minimum temperature
         #8..15#qualifierForNumberOfMissingValuesInCalculationOfStatistic = 1,2,3,4,5,6,7,8
-    codes_set_array(ibufr, 'qualifierForNumberOfMissingValuesInCalculationOfStatistic', subs.N_MISS)
+    set_array(ibufr, 'qualifierForNumberOfMissingValuesInCalculationOfStatistic', subs.N_MISS, nsub, compressed)
     # 8020 Total number of missing entities (with respect to accumulation or average) (see Note 6)
         #8..15#totalNumberOfMissingEntitiesWithRespectToAccumulationOrAverage
         # S28_YP, S28_YT, S28_YTX, S29_YE, S29_YR, S29_YS, S28_YTX, S28_YTX
         # Puuttuvat kuukaudet 30v laskennassa, esim tammikuun datassa on 30 tammikuuta,
         # eli arvo on valilla 0-30
-    codes_set_array(ibufr, 'totalNumberOfMissingEntitiesWithRespectToAccumulationOrAverage', subs.TOT_MISS)
+    set_array(ibufr, 'totalNumberOfMissingEntitiesWithRespectToAccumulationOrAverage', subs.TOT_MISS, nsub, compressed)
             # Number of missing years within the reference period shall be reported using Total
             # number of missing entities (0 08 020) being preceded by Qualifier for number of
             # missing values in calculation of statistic (0 08 050) in each of the required eight
@@ -909,45 +1591,424 @@ def bufr_encode(ibufr, subs):
             # temperatures reported under 0 08 020 preceded by 0 08 050 in which Figure 3 is used.
 
     codes_set(ibufr, 'pack', 1)  # Required to encode the keys back in the data section
+    keep_template(ibufr, nsub, compressed)
     return ibufr
 
-def main():
+def expand_inputs(paths):
+    """
+    Returns list of climat filenames from the command line paths. A path can be a file,
+    a directory (all the files in it) or a glob pattern. A path which does not match any
+    file is returned as such, so that its error is reported by the conversion.
+    """
+    climat_filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            climat_filenames.extend(os.path.join(path, name) for name in names
+                if not name.startswith('.') and os.path.isfile(os.path.join(path, name)))
+        elif glob.has_magic(path):
+            climat_filenames.extend(sorted(glob.glob(path)) or [path])
+        else:
+            climat_filenames.append(path)
+    return climat_filenames
+
+def output_name_suffixes(climat_filenames, output_dir=None):
+    """
+    Returns name suffix for each climat file. Output filename is made of parts of the
+    input filename, so different input files (e.g. _1.dat and _2.dat of the same report)
+    can have the same output file. The first of them gets no suffix and the next ones
+    get suffixes _2, _3, ... in the order of climat_filenames.
+    """
+    seen = {}
+    suffixes = []
+    for climat_filename in climat_filenames:
+        parts = os.path.basename(climat_filename).split('_')
+        if len(parts) != 5:
+            suffixes.append('')
+            continue
+        name = (output_dir, parts[0], parts[1], parts[3])
+        seen[name] = seen.get(name, 0) + 1
+        suffixes.append('_' + str(seen[name]) if seen[name] > 1 else '')
+    return suffixes
+
+def warm_eccodes(compress=False):
+    """
+    Initializer of worker processes. Makes a bufr message of the climat template, so
+    eccodes loads the BUFR4 sample and the descriptor tables once for each worker
+    instead of once for each file.
+    """
+    codes_release(new_bufr_message(1, compress))
+
+def convert_file(climat_filename, args, name_suffix='', jobs=None):
+    """
+    Converts one climat file to bufr file(s) by message_encoding with the options (args)
+    of the command line. Files of MMAP_MIN_SIZE bytes or more are read by mapped_rows.
+    Station metadata is filled from the station catalog of args.catalog, if it is given,
+    unchanged messages are taken from the result cache of args.cache and uncompressed
+    messages are spliced from the subset cache of args.subset_cache. With args.corrections
+    only the changed stations are converted (correction messages) and with
+    args.column_cache the converted columns are taken from the column cache.
+    Returns list of output filenames.
+    """
+    catalog = open_station_catalog(args)
+    cache = open_result_cache(args)
+    segments = open_subset_cache(args)
+    corrections_dir = getattr(args, 'corrections', None)
+    columns = open_column_cache(args)
+    if os.path.getsize(climat_filename) >= MMAP_MIN_SIZE:
+        return message_encoding(mapped_rows(climat_filename), climat_filename, args.compress,
+            args.max_subsets, args.max_bytes, args.split_files, args.output_dir,
+            jobs, name_suffix, catalog, cache, segments, corrections_dir, columns)
+    with open(climat_filename, 'r', encoding="utf8") as climat_file:
+        return message_encoding(climat_file, climat_filename, args.compress,
+            args.max_subsets, args.max_bytes, args.split_files, args.output_dir,
+            jobs, name_suffix, catalog, cache, segments, corrections_dir, columns)
+
+def open_station_catalog(args):
+    """
+    Returns the station catalog of the command line option --catalog or None.
+    """
+    if getattr(args, 'catalog', None) is None:
+        return None
+    return station_catalog.open_catalog(args.catalog)
+
+def open_result_cache(args):
     """
-    Main function gets input file from command line and sends it to message_encode
-    function which writes the bufr into the output file named by input file information.
+    Returns the result cache of the command line options --cache and --cache-size or None.
     """
-    if len(sys.argv) < 2:
-        print('Usage: ', sys.argv[0], ' climat_filename', file=sys.stderr)
-        sys.exit(1)
-    climat_filename = sys.argv[1]
+    if getattr(args, 'cache', None) is None:
+        return None
+    return result_cache.open_cache(args.cache, args.cache_size * 1024 * 1024)
 
+def open_column_cache(args):
+    """
+    Returns the column cache of the command line option --column-cache or None.
+    """
+    if getattr(args, 'column_cache', None) is None:
+        return None
+    return column_cache.open_cache(args.column_cache)
+
+def open_subset_cache(args):
+    """
+    Returns the cache of subset segments of the command line option --subset-cache or None.
+    """
+    if getattr(args, 'subset_cache', None) is None:
+        return None
+    return result_cache.open_cache(args.subset_cache, args.cache_size * 1024 * 1024)
+
+def try_convert_file(climat_filename, args, name_suffix='', jobs=None):
+    """
+    Converts one climat file (convert_file) and catches its errors. Returns the name of
+    climat file, list of output filenames and error text, which is None, if the file was
+    converted. Runs also in the worker processes of convert_files.
+    """
+    print('climat data from file: ', climat_filename)
     try:
-        with open(climat_filename, 'r', encoding="utf8") as climat_file:
-            print('climat data from file: ', climat_filename)
-            try:
-                bufr_filename = message_encoding(climat_file, climat_filename)
-            except CodesInternalError as err:
-                if VERBOSE:
-                    traceback.print_exc(file=sys.stderr)
+        return climat_filename, convert_file(climat_filename, args, name_suffix, jobs), None
+    except Exception as err:
+        return climat_filename, [], error_text(err)
+
+def error_text(err):
+    """
+    Returns the text of error (err) for printing. Errors in climat data (ClimatError) are
+    told by their message, other errors by their traceback if VERBOSE is set.
+    """
+    if isinstance(err, ClimatError):
+        return 'Error in climat data:\n' + str(err)
+    if VERBOSE:
+        return ''.join(traceback.format_exception(type(err), err, err.__traceback__))
+    return str(err) + '\n'
+
+def print_failure(climat_filename, error_text):
+    """
+    Prints error (error_text) of climat file, which could not be converted.
+    """
+    sys.stderr.write('Error in converting file ' + climat_filename + '\n')
+    sys.stderr.write(error_text)
+
+def convert_files(climat_filenames, args):
+    """
+    Converts climat files in the same process, so python and eccodes are started only
+    once. With args.jobs > 1 the files are converted in a pool of worker processes, each
+    with warm eccodes (warm_eccodes), and a single file is encoded in parallel by its
+    months. An error in one file is printed and the conversion continues with the next
+    file. Returns the list of converted files and the list of failed files.
+    """
+    suffixes = output_name_suffixes(climat_filenames, args.output_dir)
+    workers = min(len(climat_filenames), args.jobs or 1)
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_eccodes,
+            initargs=(args.compress,))
+        # workers encode the months of a file one by one
+        results = pool.map(try_convert_file, climat_filenames, repeat(args), suffixes,
+            repeat(1))
+    else:
+        pool = None
+        results = map(try_convert_file, climat_filenames, repeat(args), suffixes,
+            repeat(args.jobs or 1))
+
+    converted = []
+    failed = []
+    try:
+        for climat_filename, bufr_filenames, error_text in results:
+            if error_text is not None:
+                print_failure(climat_filename, error_text)
+                failed.append(climat_filename)
+                continue
+            for bufr_filename in bufr_filenames:
+                print('bufr data in file: ', bufr_filename)
+            converted.append(climat_filename)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return converted, failed
+
+def stable_files(spool_dir, previous_stats, in_flight):
+    """
+    Returns the climat files of spool directory, which are ready for conversion. A file is
+    ready, when its size and modification time have not changed since the previous poll
+    (previous_stats), so a file which is still being written is not read. The stats of
+    this poll are saved to previous_stats. Files in_flight are not returned again. Ready
+    files are returned in the order of their modification time.
+    """
+    stats = {}
+    for entry in os.scandir(spool_dir):
+        if entry.name.startswith('.') or not entry.is_file():
+            continue
+        stat = entry.stat()
+        stats[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    ready = [path for path, stat in stats.items()
+        if stat[0] > 0 and previous_stats.get(path) == stat and path not in in_flight]
+    previous_stats.clear()
+    previous_stats.update(stats)
+    return sorted(ready, key=lambda path: (stats[path][1], path))
+
+def finish_spool_file(result, done_dir, failed_dir):
+    """
+    Prints the result of converted spool file (try_convert_file) and moves the climat
+    file to done directory or, if the conversion failed, to failed directory
+    (move_to_directory). Returns True, if the file was converted.
+    """
+    climat_filename, bufr_filenames, error_text = result
+    if error_text is not None:
+        print_failure(climat_filename, error_text)
+        target_dir = failed_dir
+    else:
+        for bufr_filename in bufr_filenames:
+            print('bufr data in file: ', bufr_filename)
+        target_dir = done_dir
+    move_to_directory(climat_filename, target_dir)
+    sys.stdout.flush()
+    return error_text is None
+
+def move_to_directory(filename, directory):
+    """
+    Moves file to directory and returns its new name. A file of the same name in
+    the directory is never replaced: the name is claimed as the names of bufr files
+    (claim_name) and, if it is taken, the next suffix _2, _3, ... is added before
+    the extension.
+    """
+    name, extension = os.path.splitext(os.path.basename(filename))
+    number = 1
+    while True:
+        suffix = '' if number == 1 else '_' + str(number)
+        target = os.path.join(directory, name + suffix + extension)
+        try:
+            linked = claim_name(filename, target)
+        except FileExistsError:
+            number = number + 1
+            continue
+        if linked:
+            os.remove(filename)
+        else:
+            shutil.move(filename, target)
+        return target
+
+def watch_spool(spool_dir, args):
+    """
+    Service mode: watches spool directory and converts new climat files as they appear,
+    until the process gets SIGTERM or SIGINT.
+    1. Eccodes, the BUFR4 sample and the descriptor tables are loaded once (warm_eccodes)
+    and kept for the life of the process, also in the worker processes of --jobs.
+    2. Spool directory is polled every args.poll_interval seconds. Files which have not
+    changed since the previous poll are converted (stable_files).
+    3. At most args.jobs files are converted at the same time. The other files wait in
+    the spool directory, so memory stays bounded during bursts of files.
+    4. Bufr files are written atomically (write_bufr_files) and the climat files are moved
+    to done or failed directory without replacing earlier files (finish_spool_file). Spool files which give the same output
+    filename (e.g. _1.dat and _2.dat of the same report) do not replace each other's bufr
+    file, the later one gets the next free suffix _2, _3, ...
+    5. After a stop signal the files in conversion are finished and the number of
+    converted and failed files is returned.
+    """
+    done_dir = args.done_dir or os.path.join(spool_dir, 'done')
+    failed_dir = args.failed_dir or os.path.join(spool_dir, 'failed')
+    os.makedirs(done_dir, exist_ok=True)
+    os.makedirs(failed_dir, exist_ok=True)
+
+    stop = []
+    def request_stop(signum, frame):
+        stop.append(signum)
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # 1.
+    warm_eccodes(args.compress)
+    workers = args.jobs or 1
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_eccodes,
+            initargs=(args.compress,))
+    print('watching spool directory: ', spool_dir)
+    sys.stdout.flush()
+
+    converted = 0
+    failed = 0
+    previous_stats = {}
+    in_flight = {}
+    try:
+        while not stop:
+            # 2. - 3.
+            ready = stable_files(spool_dir, previous_stats, in_flight.values())
+            for climat_filename in ready[:workers - len(in_flight)]:
+                if pool is None:
+                    result = try_convert_file(climat_filename, args, jobs=1)
                 else:
-                    sys.stderr.write(err.msg + '\n')
-                return 1
-            except Exception as err:
-                if VERBOSE:
-                    traceback.print_exc(file=sys.stderr)
+                    future = pool.submit(try_convert_file, climat_filename, args, '', 1)
+                    in_flight[future] = climat_filename
+                    continue
+                # 4.
+                if finish_spool_file(result, done_dir, failed_dir):
+                    converted += 1
                 else:
-                    print(err)
-                return 1
-            finally:
-                climat_file.close()
-    except FileNotFoundError as err:
-        if VERBOSE:
-            traceback.print_exc(file=sys.stderr)
-        else:
-            sys.stderr.write(err.msg + '\n')
-        return 1
+                    failed += 1
+                if stop:
+                    break
+            if in_flight:
+                finished, pending = wait(in_flight, timeout=args.poll_interval,
+                    return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del in_flight[future]
+                    if finish_spool_file(future.result(), done_dir, failed_dir):
+                        converted += 1
+                    else:
+                        failed += 1
+            elif not stop:
+                time.sleep(args.poll_interval)
+        # 5.
+        for future in list(in_flight):
+            if finish_spool_file(future.result(), done_dir, failed_dir):
+                converted += 1
+            else:
+                failed += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print('stopped watching spool directory: ', spool_dir)
+    return converted, failed
+
+def print_summary(converted, failed):
+    """
+    Prints the number of converted and failed climat files and the names of failed files.
+    """
+    print('\n' + str(len(converted)) + ' climat files converted, ' + str(len(failed)) + ' failed.')
+    for climat_filename in failed:
+        print('failed: ', climat_filename)
 
-    print('bufr data in file: ', bufr_filename)
+def positive_int(text):
+    """
+    Type of the command line options which are a number greater than zero (e.g.
+    --max-subsets), so zero or a negative number is reported as a usage error.
+    """
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid int value: ' + repr(text))
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be greater than zero: ' + repr(text))
+    return value
+
+def main():
+    """
+    Main function gets input files from command line and sends them to convert_files,
+    which converts them one by one (message_encoding) and writes the bufr into the output
+    files named by input file information. Input can be many files, directories or glob
+    patterns and outputs can be written to --output-dir. A summary is printed, if there
+    are many input files.
+    With option --compress the bufr message is compressed. Options --max-subsets and
+    --max-bytes split the data to smaller messages, which are written to one file or with
+    --split-files each to its own file. With --jobs N the files are converted in N
+    parallel processes. With --pipeline the files are read, encoded and written at the
+    same time (climat_pipeline.py). With --watch the program runs as a service (watch_spool).
+    """
+    parser = argparse.ArgumentParser(description='Converts climat files to bufr files (edition 4).')
+    parser.add_argument('climat_filenames', nargs='*', metavar='climat_filename',
+        help='climat file, directory of climat files or glob pattern')
+    parser.add_argument('--output-dir', metavar='DIR',
+        help='directory for the bufr files (default: current directory)')
+    parser.add_argument('--compress', action='store_true',
+        help='encode compressed bufr message (compressedData = 1), if eccodes accepts it')
+    parser.add_argument('--max-subsets', type=positive_int, metavar='N',
+        help='split the data to messages of at most N subsets')
+    parser.add_argument('--max-bytes', type=positive_int, metavar='BYTES',
+        help='split the data to messages of at most BYTES bytes (estimated)')
+    parser.add_argument('--split-files', action='store_true',
+        help='write each message to its own numbered file')
+    parser.add_argument('--jobs', type=int, metavar='N',
+        help='convert the files in N parallel processes (default: one file at a time)')
+    parser.add_argument('--catalog', metavar='PATH',
+        help='fill missing station metadata from station catalog file PATH (SQLite)')
+    parser.add_argument('--cache', metavar='DIR',
+        help='take the bufr messages of unchanged climat data from result cache DIR')
+    parser.add_argument('--cache-size', type=int, default=256, metavar='MB',
+        help='maximum size of --cache and --subset-cache (default: 256 MB each)')
+    parser.add_argument('--subset-cache', metavar='DIR',
+        help='splice uncompressed messages from the cached subsets of unchanged stations')
+    parser.add_argument('--corrections', metavar='STATE_DIR',
+        help='convert only the stations changed since the previous conversion of the same '
+        + 'TTAAII and month, with the next updateSequenceNumber (states in STATE_DIR)')
+    parser.add_argument('--column-cache', metavar='DIR',
+        help='keep the converted columns of the climat files in DIR, so unchanged files are '
+        + 'not parsed again')
+    parser.add_argument('--pipeline', action='store_true',
+        help='read, encode and write the files in an asyncio pipeline (climat_pipeline.py)')
+    parser.add_argument('--watch', metavar='SPOOL_DIR',
+        help='run as a service converting new climat files of SPOOL_DIR')
+    parser.add_argument('--done-dir', metavar='DIR',
+        help='with --watch, directory for converted climat files (default: SPOOL_DIR/done)')
+    parser.add_argument('--failed-dir', metavar='DIR',
+        help='with --watch, directory for failed climat files (default: SPOOL_DIR/failed)')
+    parser.add_argument('--poll-interval', type=float, default=2.0, metavar='SECONDS',
+        help='with --watch, seconds between polls of SPOOL_DIR (default: 2)')
+    args = parser.parse_args()
+    if not args.climat_filenames and not args.watch:
+        parser.error('give climat files or --watch SPOOL_DIR')
+    if args.column_cache and (args.catalog or args.cache or args.subset_cache
+            or args.corrections or args.pipeline):
+        parser.error('--column-cache cannot be used with --catalog, --cache, --subset-cache, '
+            + '--corrections or --pipeline')
+    if args.corrections and ((args.jobs or 1) > 1 or args.pipeline or args.watch):
+        parser.error('--corrections cannot be used with --jobs greater than 1, --pipeline or '
+            + '--watch, because the states of corrections are updated one file at a time')
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.watch:
+        converted, failed = watch_spool(args.watch, args)
+        print(str(converted) + ' climat files converted, ' + str(failed) + ' failed.')
+        return None
+    climat_filenames = expand_inputs(args.climat_filenames)
+    if args.pipeline:
+        # climat_pipeline imports this module
+        import climat_pipeline
+        converted, failed = climat_pipeline.run_pipeline(climat_filenames, args)
+    else:
+        converted, failed = convert_files(climat_filenames, args)
+    if len(climat_filenames) > 1:
+        print_summary(converted, failed)
+
+    if failed:
+        return 1
     return None
 
 if __name__ == '__main__':
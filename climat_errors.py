@@ -0,0 +1,43 @@
+"""
+This module has the exceptions of climat to bufr conversion.
+"""
+
+class ClimatError(Exception):
+    """
+    Base class of the errors in converting climat data to bufr.
+    """
+
+class FilenameError(ClimatError):
+    """
+    Climat filename has not the parts needed for naming the bufr file:
+    TTAAII_year-month-day_hour:minute_code_datetime.dat
+    """
+
+class ClimatDataError(ClimatError):
+    """
+    Climat data is not written correctly. Attribute row is the number of the bad row
+    (starting from 1) or None, if the error is not in one row.
+    """
+    def __init__(self, message, row=None):
+        super().__init__(message)
+        self.row = row
+
+class WigosError(ClimatDataError):
+    """
+    WIGOS identifier (WSI) of climat data is wrongly written. Attribute wigos_id is
+    the bad identifier.
+    """
+    def __init__(self, message, wigos_id=None):
+        super().__init__(message)
+        self.wigos_id = wigos_id
+
+class EncodingError(ClimatError):
+    """
+    Eccodes could not encode the climat data to bufr message.
+    """
+
+class BackfillInputError(ClimatError):
+    """
+    Climat files of a backfill which is continued are not the files which were partitioned
+    to its buckets (backfill.py).
+    """
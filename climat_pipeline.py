@@ -0,0 +1,218 @@
+"""
+This module converts climat files in an asyncio pipeline of three stages: read (reading
+and parsing the climat files in threads), encode (encoding the bufr messages in worker
+processes) and write (writing the bufr files in threads). The stages are connected by
+bounded queues, so upcoming files are read while earlier files are encoded and memory
+stays bounded. Run by command: python3 climat2bufr.py --pipeline climat_dir/
+"""
+import os
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import climat2bufr
+import corrections
+
+READ_THREADS = 4
+QUEUE_SIZE = 4
+END = None
+
+class StageStats:
+    """
+    StageStats counts the files, bytes and busy seconds of one pipeline stage.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.files = 0
+        self.nbytes = 0
+        self.seconds = 0.0
+
+    def add(self, nbytes, seconds):
+        """
+        This function adds one file of nbytes handled in seconds to the stage.
+        """
+        self.files += 1
+        self.nbytes += nbytes
+        self.seconds += seconds
+
+    def report(self):
+        """
+        This function returns the throughput of the stage as text.
+        """
+        rate = self.files / self.seconds if self.seconds > 0 else 0.0
+        return (self.name + ': ' + str(self.files) + ' files, '
+            + str(round(self.nbytes / 1e6, 3)) + ' MB, '
+            + str(round(self.seconds, 3)) + ' s busy, '
+            + str(round(rate, 1)) + ' files/s')
+
+def guarded(function, *args):
+    """
+    This function calls function(*args) in an executor and catches its errors, so that
+    an error of one file does not stop the pipeline. Returns error text (None, if there
+    was no error), the result of function and the seconds it took.
+    """
+    start = time.perf_counter()
+    try:
+        return None, function(*args), time.perf_counter() - start
+    except Exception as err:
+        return climat2bufr.error_text(err), None, time.perf_counter() - start
+
+def read_file(climat_filename, args):
+    """
+    This function reads and parses one climat file (parse_climat). Large files are read
+    by memory-mapping (mapped_rows). Station metadata is filled from the station catalog
+    of args.catalog, if it is given. With args.corrections only the changed stations are
+    kept (climat2bufr.correction_groups). Returns the parts of input filename, the keys,
+    the groups of value columns, the size of the file and the updates of corrections
+    (updateSequenceNumbers and states, None without args.corrections).
+    """
+    size = os.path.getsize(climat_filename)
+    if size >= climat2bufr.MMAP_MIN_SIZE:
+        rows = climat2bufr.mapped_rows(climat_filename)
+    else:
+        with open(climat_filename, 'r', encoding="utf8") as climat_file:
+            rows = climat_file.read().splitlines()
+    output, keys, groups = climat2bufr.parse_climat(rows, climat_filename,
+        args.max_subsets, args.max_bytes, climat2bufr.open_station_catalog(args))
+    updates = None
+    if getattr(args, 'corrections', None) is not None:
+        groups, numbers, states = climat2bufr.correction_groups(keys, groups, args.corrections)
+        updates = (numbers, states)
+    return output, keys, groups, size, updates
+
+async def read_files(loop, threads, files, parsed, args, stats, results):
+    """
+    This function takes the next file of files, reads it in a thread and puts it to parsed
+    queue. Several read_files run at the same time, so the latency of network-mounted
+    directories is overlapped.
+    """
+    for climat_filename, name_suffix in files:
+        print('climat data from file: ', climat_filename)
+        error_text, parsed_file, seconds = await loop.run_in_executor(threads, guarded,
+            read_file, climat_filename, args)
+        if error_text is not None:
+            results.append((climat_filename, [], error_text))
+            continue
+        output, keys, groups, nbytes, updates = parsed_file
+        stats.add(nbytes, seconds)
+        if not groups:
+            print('no changed stations in file: ', climat_filename)
+            results.append((climat_filename, [], None))
+            continue
+        await parsed.put((climat_filename, name_suffix, output, keys, groups, updates))
+
+async def encode_files(loop, processes, parsed, encoded, args, stats, results):
+    """
+    This function takes parsed files from parsed queue, encodes them in a worker process
+    (encode_climat) and puts the messages to encoded queue, until it gets END. Unchanged
+    messages are taken from the result cache of args.cache and uncompressed messages are
+    spliced from the subset cache of args.subset_cache.
+    """
+    while True:
+        item = await parsed.get()
+        if item is END:
+            return
+        climat_filename, name_suffix, output, keys, groups, updates = item
+        error_text, messages, seconds = await loop.run_in_executor(processes, guarded,
+            climat2bufr.encode_climat, keys, groups, args.compress, 1,
+            climat2bufr.open_result_cache(args), climat2bufr.open_subset_cache(args))
+        if error_text is not None:
+            results.append((climat_filename, [], error_text))
+            continue
+        stats.add(sum(len(message) for message in messages), seconds)
+        if updates is not None:
+            messages = climat2bufr.correction_messages(messages, updates[0])
+        await encoded.put((climat_filename, name_suffix, output, messages, updates))
+
+async def write_files(loop, threads, encoded, args, stats, results):
+    """
+    This function takes messages from encoded queue and writes them to bufr files in
+    a thread (write_bufr_messages) as they finish, until it gets END. The states of
+    corrections are saved after the file is written.
+    """
+    while True:
+        item = await encoded.get()
+        if item is END:
+            return
+        climat_filename, name_suffix, output, messages, updates = item
+        error_text, bufr_filenames, seconds = await loop.run_in_executor(threads, guarded,
+            climat2bufr.write_bufr_messages, messages, output, args.split_files,
+            args.output_dir, name_suffix)
+        if error_text is None:
+            stats.add(sum(len(message) for message in messages), seconds)
+            if updates is not None:
+                corrections.save_states(updates[1])
+        results.append((climat_filename, bufr_filenames or [], error_text))
+
+async def read_stage(loop, threads, files, parsed, workers, args, stats, results):
+    """
+    This function runs READ_THREADS read_files and then puts END for each encoder.
+    """
+    await asyncio.gather(*[read_files(loop, threads, files, parsed, args, stats, results)
+        for _ in range(READ_THREADS)])
+    for _ in range(workers):
+        await parsed.put(END)
+
+async def encode_stage(loop, processes, parsed, encoded, workers, args, stats, results):
+    """
+    This function runs an encode_files for each worker process and then puts END for
+    the writer.
+    """
+    await asyncio.gather(*[encode_files(loop, processes, parsed, encoded, args, stats,
+        results) for _ in range(workers)])
+    await encoded.put(END)
+
+async def pipeline(loop, climat_filenames, args, threads, processes, workers, stats, results):
+    """
+    This function connects the stages by bounded queues and runs them until all the
+    climat files are converted.
+    """
+    parsed = asyncio.Queue(maxsize=QUEUE_SIZE)
+    encoded = asyncio.Queue(maxsize=QUEUE_SIZE)
+    suffixes = climat2bufr.output_name_suffixes(climat_filenames, args.output_dir)
+    files = iter(list(zip(climat_filenames, suffixes)))
+    await asyncio.gather(
+        read_stage(loop, threads, files, parsed, workers, args, stats[0], results),
+        encode_stage(loop, processes, parsed, encoded, workers, args, stats[1], results),
+        write_files(loop, threads, encoded, args, stats[2], results))
+
+def run_pipeline(climat_filenames, args):
+    """
+    This function converts climat files in the pipeline with args.jobs encoding processes.
+    The bufr files are written as they finish and the results and the throughput of each
+    stage are printed at the end. Returns the list of converted files and the list of failed files.
+    """
+    workers = args.jobs or 1
+    stats = [StageStats('read'), StageStats('encode'), StageStats('write')]
+    results = []
+    threads = ThreadPoolExecutor(max_workers=READ_THREADS + 1)
+    processes = ProcessPoolExecutor(max_workers=workers,
+        initializer=climat2bufr.warm_eccodes, initargs=(args.compress,))
+    loop = asyncio.new_event_loop()
+    start = time.perf_counter()
+    try:
+        loop.run_until_complete(pipeline(loop, climat_filenames, args, threads, processes,
+            workers, stats, results))
+    finally:
+        loop.close()
+        processes.shutdown()
+        threads.shutdown()
+    seconds = time.perf_counter() - start
+
+    converted = []
+    failed = []
+    for climat_filename, bufr_filenames, error_text in results:
+        if error_text is not None:
+            climat2bufr.print_failure(climat_filename, error_text)
+            failed.append(climat_filename)
+            continue
+        for bufr_filename in bufr_filenames:
+            print('bufr data in file: ', bufr_filename)
+        converted.append(climat_filename)
+
+    for stage in stats:
+        print(stage.report())
+    print('pipeline: ' + str(len(climat_filenames)) + ' files in '
+        + str(round(seconds, 3)) + ' s')
+    sys.stdout.flush()
+    return converted, failed
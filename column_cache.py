@@ -0,0 +1,127 @@
+"""
+This module keeps the converted value columns of climat files in an on-disk cache
+(uncompressed .npz files), so a file which is converted again, e.g. with another
+masterTablesVersionNumber or after an eccodes upgrade, is not parsed and converted again.
+Each climat file (and its message options) has one entry, which is valid as long as
+the modification time and the size of the file are the same.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import subset_arrays as subA
+from file_mode import FILE_MODE
+
+# Version of the cached columns, changed when the conversion of subset_arrays changes
+CACHE_VERSION = 1
+SUFFIX = '.npz'
+CACHES = {}
+
+class ColumnCache:
+    """
+    This class is the cache of converted value columns in directory. An entry has
+    the subset objects of the bufr messages of one climat file (subset_arrays.Subset):
+        meta: version, modification time and size of the climat file, the number of
+        subsets of each message and the attributes of the climat data (json).
+        <message>:<attribute>:data and <message>:<attribute>:mask: masked arrays.
+        <message>:<attribute>:text: string columns.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, climat_filename, max_subsets=None, max_bytes=None):
+        """
+        This function returns the entry of the climat file and message options in the cache.
+        """
+        key = (os.path.abspath(climat_filename) + '|' + str(max_subsets) + '|'
+            + str(max_bytes))
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf8')).hexdigest()
+            + SUFFIX)
+
+    def load(self, climat_filename, max_subsets=None, max_bytes=None):
+        """
+        This function returns the subset objects of the messages of the climat file from
+        the cache or None, if the file has no valid entry. Columns which are all missing
+        are given as the shared missing arrays (subset_arrays.missing_array).
+        """
+        try:
+            entry = np.load(self.path(climat_filename, max_subsets, max_bytes),
+                allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        with entry:
+            meta = json.loads(str(entry['meta']))
+            if meta != dict(meta, **file_meta(climat_filename)):
+                return None
+            subsets = []
+            for i, number_of_subsets in enumerate(meta['subsets']):
+                columns = {}
+                for attribute in meta['attributes']:
+                    name = str(i) + ':' + attribute + ':'
+                    if name + 'text' in entry.files:
+                        columns[attribute] = entry[name + 'text'].tolist()
+                        continue
+                    default = subA.REGISTRY_BY_ATTRIBUTE[attribute][3]
+                    mask = entry[name + 'mask']
+                    if mask.all():
+                        columns[attribute] = subA.missing_array(number_of_subsets,
+                            default.fill_value, default.dtype)
+                    else:
+                        columns[attribute] = subA.masked_array(entry[name + 'data'], mask,
+                            default.fill_value)
+                subsets.append(subA.subset_from_columns(number_of_subsets, columns))
+        return subsets
+
+    def save(self, climat_filename, subsets, max_subsets=None, max_bytes=None):
+        """
+        This function writes the converted columns of subset objects (subsets) of
+        the climat file to the cache. The entry is written first to a temporary file, which
+        is renamed, so other processes never read half an entry.
+        """
+        arrays = {}
+        attributes = []
+        for i, subs in enumerate(subsets):
+            columns = subs.converted_columns()
+            attributes = sorted(columns)
+            for attribute, values in columns.items():
+                name = str(i) + ':' + attribute + ':'
+                if isinstance(values, list):
+                    arrays[name + 'text'] = np.array(values, dtype=str)
+                else:
+                    arrays[name + 'data'] = np.ma.getdata(values)
+                    arrays[name + 'mask'] = np.ma.getmaskarray(values)
+        meta = dict(file_meta(climat_filename), subsets=[subs.NSUB for subs in subsets],
+            attributes=attributes)
+        arrays['meta'] = np.array(json.dumps(meta, sort_keys=True))
+
+        descriptor, temporary_name = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as entry_file:
+                np.savez(entry_file, **arrays)
+            os.chmod(temporary_name, FILE_MODE)
+            os.replace(temporary_name, self.path(climat_filename, max_subsets, max_bytes))
+        except BaseException:
+            if os.path.exists(temporary_name):
+                os.remove(temporary_name)
+            raise
+
+def file_meta(climat_filename):
+    """
+    This function returns what makes the entry of the climat file valid: CACHE_VERSION,
+    modification time and size of the file.
+    """
+    stat = os.stat(climat_filename)
+    return {'version': CACHE_VERSION, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+def open_cache(directory):
+    """
+    This function returns the column cache of directory. Each cache is opened only once
+    in a process (CACHES).
+    """
+    cache = CACHES.get(directory)
+    if cache is None:
+        cache = ColumnCache(directory)
+        CACHES[directory] = cache
+    return cache
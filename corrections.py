@@ -0,0 +1,139 @@
+"""
+This module makes correction messages (e.g. CCA) of climat data. The stations of each
+TTAAII and month, which have been converted before, are kept in a state file with the
+hash of their rows (subset_cache.row_keys) and the last updateSequenceNumber. When the
+same TTAAII and month is converted again, only the stations which are new or have changed
+are encoded and updateSequenceNumber is incremented, so the correction message has only
+the subsets which the downstream consumers need to ingest again.
+"""
+import os
+import json
+import tempfile
+import subset_cache
+import station_catalog
+from file_mode import FILE_MODE
+from climat_errors import EncodingError
+from separate_keys_and_values import MISSING_VALUE
+
+STATE_SUFFIX = '.json'
+
+def state_path(state_dir, ttaaii, month):
+    """
+    This function returns the state file of TTAAII and month (YYYY-MM) in state_dir.
+    """
+    return os.path.join(state_dir, ttaaii + '_' + (month or 'no_month') + STATE_SUFFIX)
+
+def load_state(path):
+    """
+    This function returns the state in file path: the last updateSequenceNumber and
+    the hashes of the rows by station. A new state (number 0 and no stations) is returned,
+    if the file does not exist.
+    """
+    try:
+        with open(path, 'r', encoding="utf8") as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {'update_sequence_number': 0, 'stations': {}}
+
+def save_state(path, state):
+    """
+    This function writes state to file path. The file is written first to a temporary
+    file, which is renamed, so the state is never left half written.
+    """
+    directory = os.path.dirname(path) or '.'
+    descriptor, temporary_name = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(descriptor, 'w', encoding="utf8") as state_file:
+            json.dump(state, state_file, sort_keys=True)
+        os.chmod(temporary_name, FILE_MODE)
+        os.replace(temporary_name, path)
+    except BaseException:
+        if os.path.exists(temporary_name):
+            os.remove(temporary_name)
+        raise
+
+def station_ids(keys, value_columns):
+    """
+    This function returns the station of each row by its first station key
+    (station_catalog.station_key), e.g. 'FMISID:100908'. Rows without station key are
+    identified by their number.
+    """
+    columns = [(key, value_columns[keys.index(key)]) for key in station_catalog.STATION_KEYS
+        if key in keys]
+    ids = []
+    for i in range(0, len(value_columns[0])):
+        row_keys = {key: values[i] for key, values in columns if values[i] != MISSING_VALUE}
+        ids.append(station_catalog.station_key(row_keys) or 'ROW:' + str(i + 1))
+    return ids
+
+def changed_groups(state_dir, keys, groups, settings):
+    """
+    This function compares the groups of value columns (split_by_month, split_to_chunks)
+    with the states of their TTAAII and month in state_dir.
+        1. Each row is hashed with the encoder settings (settings) and its station is
+        found (station_ids). TTAAII is taken from the first row of the group. If a station
+        has several rows in the same month, they are numbered (e.g. 'FMISID:100908#2').
+        2. Rows of the stations which are new or have a different hash are kept. Groups
+        without such rows are left out.
+        3. Each changed month gets the next updateSequenceNumber. The states of the changed
+        months are returned, so they are saved (save_states) only after the messages are
+        written.
+    Returns the changed groups, updateSequenceNumber of each changed group and the states.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    states = {}
+    loaded = {}
+    counts = {}
+    changed = []
+    numbers = []
+    for month, value_columns in groups:
+        # 1.
+        hashes = subset_cache.row_keys(keys, value_columns, settings)
+        ids = station_ids(keys, value_columns)
+        ttaaii = value_columns[keys.index('TTAAII')][0] if 'TTAAII' in keys else 'TTAAII'
+        path = state_path(state_dir, ttaaii, month)
+        if path not in loaded:
+            loaded[path] = load_state(path)
+        state = loaded[path]
+        for i, station in enumerate(ids):
+            count = counts.get((path, station), 0) + 1
+            counts[(path, station)] = count
+            if count > 1:
+                ids[i] = station + '#' + str(count)
+
+        # 2.
+        rows = [i for i in range(0, len(hashes))
+            if state['stations'].get(ids[i]) != hashes[i]]
+        state['stations'].update(zip(ids, hashes))
+        if not rows:
+            continue
+        if len(rows) < len(hashes):
+            value_columns = [[column[i] for i in rows] for column in value_columns]
+        changed.append((month, value_columns))
+        # 3.
+        if path not in states:
+            state['update_sequence_number'] += 1
+            states[path] = state
+        numbers.append(state['update_sequence_number'])
+    return changed, numbers, states
+
+def save_states(states):
+    """
+    This function writes the states of changed_groups to their files.
+    """
+    for path, state in states.items():
+        save_state(path, state)
+
+def set_update_sequence_number(message, number):
+    """
+    This function returns bufr message (edition 4) with updateSequenceNumber (octet 9 of
+    section 1) set to number. The octet has room for numbers up to 255, EncodingError is
+    raised for bigger numbers, because a repeated number would not be a new correction.
+    """
+    if number > 255:
+        raise EncodingError('updateSequenceNumber ' + str(number) + ' does not fit in bufr '
+            + 'message (at most 255 corrections)\n')
+    section1 = subset_cache.section_offsets(message)[0]
+    message = bytearray(message)
+    message[section1 + 8] = number
+    return bytes(message)
@@ -0,0 +1,19 @@
+"""
+This module has the permissions of the files which are written first to a temporary
+file and then renamed or linked (bufr files, caches and states). tempfile.mkstemp makes
+the temporary file only for the user, so it is given the permissions of files made by
+open (FILE_MODE) before it gets its name.
+"""
+import os
+
+def read_umask():
+    """
+    This function returns the umask of the process. The umask can be read only by setting
+    it, which changes it for the whole process for a moment, so it is read only once
+    at import (FILE_MODE), before any threads are started.
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+FILE_MODE = 0o666 & ~read_umask()
@@ -0,0 +1,133 @@
+"""
+This module keeps the encoded bufr messages in an on-disk cache, so the climat data
+which has not changed since the previous run is not encoded again. Each message is
+cached by a content hash of its normalized climat rows and the encoder settings
+(message_key). The cache is bounded by size: the least recently used messages are
+removed first.
+"""
+import os
+import hashlib
+import tempfile
+import subset_arrays as subA
+from file_mode import FILE_MODE
+
+# Version of the cached messages, changed when the encoding changes
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+SUFFIX = '.bufr'
+CACHES = {}
+
+def message_key(keys, value_columns, settings):
+    """
+    This function returns the content hash (sha256, hex) of one bufr message.
+        1. The encoder settings (settings) and CACHE_VERSION are hashed first.
+        2. Only the keys which are encoded (subset_arrays.KEY_REGISTRY) are hashed, in
+        the order of the key names, so e.g. EXEC_DATE of a rewritten file or the order of
+        the keys in the rows do not change the hash. The order of the rows is kept,
+        because it is the order of the subsets.
+    """
+    # 1.
+    content = hashlib.sha256()
+    content.update((str(CACHE_VERSION) + '|' + '|'.join(str(value) for value in settings)
+        + '\n').encode('utf8'))
+    # 2.
+    columns = sorted((key, values) for key, values in zip(keys, value_columns)
+        if key in subA.KEY_REGISTRY)
+    for key, values in columns:
+        content.update((key + '=' + '\x1f'.join(values) + '\n').encode('utf8'))
+    return content.hexdigest()
+
+class ResultCache:
+    """
+    This class is the cache of bufr messages in directory, at most max_bytes in total.
+    Each message is a file named by its key (message_key). Reading a message touches
+    its file, so the modification times tell the order of use (LRU). The cache has no
+    open files, so it can be sent to worker processes and shared by many processes.
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for path, size, used in self.entries())
+
+    def path(self, key):
+        """
+        This function returns the file of key in the cache.
+        """
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        """
+        This function returns the cached message of key or None and marks the message used.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as cached_file:
+                message = cached_file.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return message
+
+    def put(self, key, message):
+        """
+        This function writes message of key to the cache. The file is written first to
+        a temporary file, which is renamed, so other processes never read half a message.
+        If the cache is bigger than max_bytes, it is evicted (evict).
+        """
+        descriptor, temporary_name = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as cached_file:
+                cached_file.write(message)
+            os.chmod(temporary_name, FILE_MODE)
+            os.replace(temporary_name, self.path(key))
+        except BaseException:
+            if os.path.exists(temporary_name):
+                os.remove(temporary_name)
+            raise
+        self.size += len(message)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """
+        This function returns (path, size, last use) of each message in the cache.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """
+        This function removes the least recently used messages until the cache is at most
+        max_bytes. The sizes are read from the directory, because other processes may
+        have written to the same cache.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(size for path, size, used in entries)
+        for path, size, used in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+def open_cache(directory, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    This function returns the result cache of directory. Each cache is opened only once
+    in a process (CACHES).
+    """
+    cache = CACHES.get(directory)
+    if cache is None:
+        cache = ResultCache(directory, max_bytes)
+        CACHES[directory] = cache
+    return cache
@@ -1,64 +1,62 @@
 """
 This module separates keys and values.
 """
-from eccodes import CODES_MISSING_DOUBLE
+import re
 
-def get_keys(row_with_key_value_pairs):
-    """
-    This funktion gets the keys and sets them in a array
-    Input "row_with_key_value_pairs" is one observation,
-    which includes key/value pairs.
-    """
-    number_of_pairs = len(row_with_key_value_pairs)
-    keys = []
-    for i in range(0, number_of_pairs):
-        key_value = row_with_key_value_pairs[i]
-        key = key_value[0]
-        keys.append(key)
-
-    return keys
+# Missing value of climat data. It is kept as such until the values are converted to
+# masked arrays in subset_arrays.
+MISSING_VALUE = '/'
 
-def get_values(row_with_key_value_pairs):
+def split_row(row):
     """
-    This funktion gets the values and sets them in an array.
-    Input "row_with_key_value_pairs" is one observation,
-    which includes key/value pairs.
+    This function splits one climat row to keys and values in one pass.
+    Input "row" is one observation: keyname1=value1,keyname2=value2,...,keynamen=valuen,*
+    Missing values "/" (MISSING_VALUE) are kept as they are.
+    ValueError is raised, if the row is not written in that form or a key is repeated.
     """
-    number_of_pairs = len(row_with_key_value_pairs)
+    pairs = row.split(',')
+    number_of_pairs = len(pairs) - 1
+    if number_of_pairs < 1 or pairs[number_of_pairs].strip() != '*':
+        raise ValueError('row does not end with ,*')
+
+    keys = []
     values = []
     for i in range(0, number_of_pairs):
-        key_value = row_with_key_value_pairs[i]
-        value = key_value[1]
-        if value == '/':
-            value = str(CODES_MISSING_DOUBLE)
+        key, separator, value = pairs[i].partition('=')
+        if not separator or not key or not value or key[-1] == '*' or value[0] == '*':
+            raise ValueError('bad key=value pair: ' + pairs[i])
+        keys.append(key)
         values.append(value)
 
-    return values
+    if len(set(keys)) != len(keys):
+        seen = set()
+        for key in keys:
+            if key in seen:
+                raise ValueError('duplicate key ' + key)
+            seen.add(key)
 
-def are_all_the_rows_similar(rows):
-    """
-    This function checks if all the rows are the same.
-    """
-    number_of_rows = len(rows)
-    answer = True
-    for i in range(0, number_of_rows - 1):
-        row_a = rows[i]
-        row_b = rows[i+1]
-        if row_a != row_b:
-            answer = False
+    return keys, values
 
-    return answer
+def row_pattern(keys, binary=False):
+    """
+    This function compiles a pattern of rows, which have the keys in the same order (shared
+    header). The pattern matches the same rows as split_row does for these keys, but finds
+    the values by position, without splitting key strings. If binary is True, the pattern
+    matches bytes (e.g. a memory-mapped file) instead of text.
+    """
+    pairs = [re.escape(key) + '=([^,*][^,]*)' for key in keys]
+    pattern = ','.join(pairs) + r',\s*\*\s*'
+    if binary:
+        return re.compile(pattern.encode('utf8'))
+    return re.compile(pattern)
 
-def longest_row(rows):
+def match_row(pattern, row):
     """
-    This functions check the longest row from rows.
+    This function returns the values of row by pattern (row_pattern). None is returned,
+    if the row has not the same keys in the same order, and then the row is split by
+    split_row.
     """
-    number_of_rows = len(rows)
-    longest = 0
-    for i in range(0, number_of_rows - 1):
-        l_a = len(rows[i])
-        l_b = len(rows[i+1])
-        if l_b > l_a:
-            longest = i + 1
-    return longest
-  
\ No newline at end of file
+    match = pattern.fullmatch(row)
+    if match is None:
+        return None
+    return list(match.groups())
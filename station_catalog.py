@@ -0,0 +1,235 @@
+"""
+This module keeps the station metadata of climat data in an on-disk catalog (SQLite).
+The catalog is loaded to memory once and it fills the metadata of climat rows, which
+have only the station key (FMISID, WSI or WMON) or some missing metadata values.
+"""
+import sqlite3
+import threading
+import subset_arrays as subA
+from climat_errors import WigosError
+from separate_keys_and_values import MISSING_VALUE
+
+# Station keys in the order of lookup
+STATION_KEYS = ('FMISID', 'WSI', 'WMON')
+# Metadata which is the same in every row of the station
+METADATA_KEYS = ('FMISID', 'WSI', 'WMON', 'STATION_NAME', 'STATION_TYPE', 'LAT', 'LON',
+    'ELSTAT', 'ELBARO', 'ELTERM', 'ELANEM')
+# Columns of the split WIGOS identifier (subset_arrays.split_wigos) of the station
+WIGOS_COLUMNS = (('wsi_ids', 'INTEGER'), ('wsi_idi', 'INTEGER'), ('wsi_inr', 'INTEGER'),
+    ('wsi_lid', 'TEXT'))
+CATALOGS = {}
+
+class StationCatalog:
+    """
+    This class is the station catalog of SQLite file (path).
+        1. All the stations are read to memory (stations) once, when the catalog is opened.
+        Each station is found by any of its station keys (index).
+        2. fill learns the metadata of the climat rows to the catalog and fills the missing
+        metadata of the rows from the catalog.
+        3. New and changed stations are written to the file at the end of fill. Rows of
+        the stations which are merged to another station are deleted.
+    Metadata values are kept as they are written in climat data, so they are converted
+    with the other values by subset_arrays. WSI is also kept split to its four parts
+    (WIGOS_COLUMNS), which are given to subset_arrays.SPLIT_WIGOS, so the WIGOS identifiers
+    of the stations are not split again for each month.
+    """
+    # 1.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stations = []
+        self.index = {}
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        columns = ', '.join(key.lower() + ' TEXT' for key in METADATA_KEYS)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS stations (station_key TEXT PRIMARY KEY, '
+            + columns + ')')
+        existing = [row[1] for row in self.connection.execute('PRAGMA table_info(stations)')]
+        with self.connection:
+            for name, column_type in WIGOS_COLUMNS:
+                if name not in existing:
+                    self.connection.execute('ALTER TABLE stations ADD COLUMN ' + name + ' '
+                        + column_type)
+        query = ('SELECT station_key, ' + ', '.join(key.lower() for key in METADATA_KEYS) + ', '
+            + ', '.join(name for name, column_type in WIGOS_COLUMNS) + ' FROM stations')
+        for row in self.connection.execute(query):
+            station = {key: value for key, value in zip(METADATA_KEYS, row[1:]) if value is not None}
+            station['station_key'] = row[0]
+            wigos = row[len(METADATA_KEYS) + 1:]
+            if wigos[0] is not None:
+                station['WIGOS'] = tuple(wigos)
+            elif 'WSI' in station:
+                station['WIGOS'] = wigos_parts(station['WSI'])
+            self.add_station(station)
+
+    def add_station(self, station):
+        """
+        This function adds station (dictionary of metadata) to memory and to the index.
+        """
+        self.stations.append(station)
+        for key in STATION_KEYS:
+            if key in station:
+                self.index[(key, station[key])] = station
+        if station.get('WIGOS') is not None:
+            subA.SPLIT_WIGOS[station['WSI']] = station['WIGOS']
+
+    def find(self, row_keys):
+        """
+        This function returns the station of row (row_keys: station key -> value) or None.
+        """
+        for key in STATION_KEYS:
+            value = row_keys.get(key)
+            if value is not None:
+                station = self.index.get((key, value))
+                if station is not None:
+                    return station
+        return None
+
+    # 2.
+    def fill(self, keys, value_columns):
+        """
+        This function fills the metadata of the climat data (keys and value columns) from
+        the catalog and returns the new keys and value columns.
+            a. Station of each row is found by its station keys (find). A new station is
+            added to the catalog.
+            b. Metadata values of the row, which are not missing, are learned to the station.
+            A station key which is learned is moved to the station (move_key), so the index
+            has no stale keys.
+            c. Missing metadata values of the row are filled from the station. Metadata keys
+            which are not in the climat data get columns of their own.
+        """
+        keys = list(keys)
+        value_columns = list(value_columns)
+        number_of_rows = len(value_columns[0])
+        for key in METADATA_KEYS:
+            if key not in keys:
+                keys.append(key)
+                value_columns.append([MISSING_VALUE] * number_of_rows)
+        columns = {key: value_columns[keys.index(key)] for key in METADATA_KEYS}
+
+        changed = {}
+        deleted = []
+        with self.lock:
+            for i in range(0, number_of_rows):
+                # a.
+                row_keys = {key: columns[key][i] for key in STATION_KEYS
+                    if columns[key][i] != MISSING_VALUE}
+                if not row_keys:
+                    continue
+                station = self.find(row_keys)
+                if station is None:
+                    station = {'station_key': station_key(row_keys)}
+                    self.stations.append(station)
+                # b. - c.
+                learned = False
+                for key in METADATA_KEYS:
+                    value = columns[key][i]
+                    if value == MISSING_VALUE:
+                        columns[key][i] = station.get(key, MISSING_VALUE)
+                    elif station.get(key) != value:
+                        if key in STATION_KEYS:
+                            self.move_key(station, key, value, changed, deleted)
+                        station[key] = value
+                        if key == 'WSI':
+                            station['WIGOS'] = wigos_parts(value)
+                            if station['WIGOS'] is not None:
+                                subA.SPLIT_WIGOS[value] = station['WIGOS']
+                        learned = True
+                if learned:
+                    rename_station(station, deleted)
+                    changed[id(station)] = station
+            # 3.
+            if changed or deleted:
+                self.save(changed.values(), deleted)
+        return keys, value_columns
+
+    def move_key(self, station, key, value, changed, deleted):
+        """
+        This function indexes station by the new value of station key (key). The old value
+        of the station is removed from the index. If another station has the value, it is
+        removed from that station, which is renamed (rename_station) or, if it has no station
+        keys left, merged to station and deleted. The stations to write and to delete are added to changed
+        and deleted.
+        """
+        old_value = station.get(key)
+        if old_value is not None and self.index.get((key, old_value)) is station:
+            del self.index[(key, old_value)]
+        other = self.index.get((key, value))
+        if other is not None and other is not station:
+            del other[key]
+            if key == 'WSI':
+                other.pop('WIGOS', None)
+            if any(other_key in other for other_key in STATION_KEYS):
+                rename_station(other, deleted)
+                changed[id(other)] = other
+            else:
+                for other_key in METADATA_KEYS:
+                    if other_key in other:
+                        station.setdefault(other_key, other[other_key])
+                self.stations.remove(other)
+                deleted.append(other['station_key'])
+                changed.pop(id(other), None)
+        self.index[(key, value)] = station
+
+    # 3.
+    def save(self, stations, deleted=()):
+        """
+        This function deletes the rows of station keys (deleted) from the catalog file
+        and writes stations to it.
+        """
+        names = ', '.join([key.lower() for key in METADATA_KEYS]
+            + [name for name, column_type in WIGOS_COLUMNS])
+        marks = ', '.join('?' for _ in range(0, len(METADATA_KEYS) + len(WIGOS_COLUMNS) + 1))
+        rows = [[station['station_key']] + [station.get(key) for key in METADATA_KEYS]
+            + list(station.get('WIGOS') or (None,) * len(WIGOS_COLUMNS)) for station in stations]
+        with self.connection:
+            self.connection.executemany('DELETE FROM stations WHERE station_key = ?',
+                [(key,) for key in deleted])
+            self.connection.executemany('INSERT OR REPLACE INTO stations (station_key, '
+                + names + ') VALUES (' + marks + ')', rows)
+
+    def close(self):
+        """
+        This function closes the catalog file.
+        """
+        self.connection.close()
+
+def station_key(row_keys):
+    """
+    This function returns the key of new station in the catalog file, e.g. 'FMISID:100908'.
+    """
+    for key in STATION_KEYS:
+        if key in row_keys:
+            return key + ':' + row_keys[key]
+    return None
+
+def rename_station(station, deleted):
+    """
+    This function gives station the key of its station keys (station_key), if they have
+    changed. The old key is added to deleted, so its row is deleted from the catalog file.
+    """
+    key = station_key(station)
+    if key != station['station_key']:
+        deleted.append(station['station_key'])
+        station['station_key'] = key
+
+def wigos_parts(wigos):
+    """
+    This function returns the four parts of WIGOS identifier (subset_arrays.split_wigos)
+    or None, if the identifier is wrongly written. Then the error is raised, when
+    the identifier is converted.
+    """
+    try:
+        return subA.split_wigos(wigos)
+    except WigosError:
+        return None
+
+def open_catalog(path):
+    """
+    This function returns the station catalog of path. Each catalog is opened only once
+    in a process (CATALOGS), so it stays in memory e.g. in the service mode.
+    """
+    catalog = CATALOGS.get(path)
+    if catalog is None:
+        catalog = StationCatalog(path)
+        CATALOGS[path] = catalog
+    return catalog
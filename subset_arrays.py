@@ -1,475 +1,296 @@
 """
 This module makes subset objects by different functions and Subset class.
 """
-import sys
+import numpy as np
 from eccodes import CODES_MISSING_LONG as miss
 from eccodes import CODES_MISSING_DOUBLE as missD
+from climat_errors import WigosError
+from separate_keys_and_values import MISSING_VALUE
+
+ALL_MISSING = {}
+ALL_MISSING_CACHE_SIZE = 64
+# WIGOS identifiers which are split already (e.g. by station_catalog): identifier -> parts
+SPLIT_WIGOS = {}
 
 class Subset:
     """
     This class makes keyname objects with key names that are used in climat
     data. All the values with same keyname are placed into the same object as an array.
     The values are modified in different functions according to codes manual.
-        1. At first Subset class makes all the values, which are not dependent
-        on any other objects to be missing. Only the number of subsets (NSUB) is given.
-        2. The values are read form v_a, and value is placed in keyname object acording
-        keyname's index position. Values that don't depend on any other are given first.
-        As an exception, block number and sation number are given acording to WMO. Date
-        values are picked from REPORDED MONTH and WIGOS valus are picked from WSI.
-        3. The rest of all the needed values are given.
+        1. Subset class keeps the value columns of v_a, which have a key in KEY_REGISTRY.
+        Only the number of subsets (NSUB) is given at once.
+        2. A key is converted on its first use by the converter and k_id which KEY_REGISTRY
+        has for it (column). Keys which are not in the climat data are missing.
+        3. The rest of all the needed values (DERIVED_FIELDS) are also given on their first
+        use. As an exception, block number and sation number are given acording to WMO.
+        Date values are picked from REPORDED MONTH and WIGOS valus are picked from WSI.
+        The values are kept in the field store of the object (_fields), so each of them is
+        made only once.
         4. Functions which gives the right values to bufr message, are placed below.
-    """
+    The object has only three slots (NSUB, _columns, _fields) instead of an attribute
+    dictionary. When it is pickled (e.g. sent to a worker process), the value columns are
+    sent as converted arrays instead of lists of strings.
+    Numeric values are kept in masked NumPy arrays (float64 or int64), which are converted
+    by one vectorized operation per key. The mask tells which values are missing and
+    the fill value of the array is the eccodes missing value (CODES_MISSING_LONG or
+    CODES_MISSING_DOUBLE), which is put in place of the missing values only when the values
+    are given to eccodes (eccodes_values). Values which are all missing, e.g. the sections
+    which small stations do not report, are shared read-only arrays (missing_array).
+    """
+    __slots__ = ('NSUB', '_columns', '_fields')
+
     # 1.
     def __init__(self, key_array, value_array):
         k_a = key_array
         v_a = value_array
         self.NSUB = len(v_a[0])
-        miss_list = []
-        miss_char_list = []
-        for i in range(0, self.NSUB):
-            miss_list.append('-1e+100')
-            miss_char_list.append('')
-        self.TTAAII = miss_list
-        self.ELANEM = str2float(miss_list, 1)
-        self.ELBARO = str2float(miss_list, 2)
-        self.ELSTAT = str2float(miss_list, 3)
-        self.ELTERM = str2float(miss_list, 4)
-        self.LAT = str2float(miss_list, 5)
-        self.LON = str2float(miss_list, 6)
-        self.STATION_NAME = miss_list
-        self.STATION_TYPE = str2int(miss_list, 8)
-        self.WMON = miss_list
-        self.WSI_IDS = str2int(miss_list, 0)
-        self.WSI_IDI = str2int(miss_list, 0)
-        self.WSI_INR = str2int(miss_list, 0)
-        self.WSI_LID = miss_char_list
-        self.BLOCK_NUMBER = str2int(self.WMON, 64)
-        self.STATION_NUMBER = str2int(self.WMON, 65)
-        self.YYYY = str2int(miss_list, 63)
-        self.R_YYYY = str2int(miss_list, 63)
-        self.S20_YB = str2int(miss_list, 63)
-        self.S20_YC = str2int(miss_list, 63)
-        self.MM = str2int(miss_list, 27)
-        self.R_MM = str2int(miss_list, 27)
-        self.R_DD = str2int(miss_list, 21)
-        self.HH24 = str2int(miss_list, 24)
-        self.R_HH0 = str2int(miss_list, 24)
-        self.R_HH6 = str2int(miss_list, 24)
-        self.MI = str2int(miss_list, 26)
-        self.R_MI = str2int(miss_list, 26)
-        self.DD = str2int(miss_list, 21)
-        self.S40_YX = str2int(miss_list, 21)
-        self.S41_YN = str2int(miss_list, 21)
-        self.S42_YAX = str2int(miss_list, 21)
-        self.S43_YAN = str2int(miss_list, 21)
-        self.S45_YFX = str2int(miss_list, 21)
-        self.S44_YR = str2int(miss_list, 21)
-        self.S11_P = str2float(miss_list, 34)
-        self.S21_P = str2float(miss_list, 34)
-        self.S12_P = str2float(miss_list, 34)
-        self.S22_P = str2float(miss_list, 34)
-        self.S15_E = str2float(miss_list, 34)
-        self.S25_E = str2float(miss_list, 34)
-        self.S16_R = str2float(miss_list, 40)
-        self.S26_R = str2float(miss_list, 40)
-        self.S16_RD = str2int(miss_list, 31)
-        self.S16_NR = str2int(miss_list, 32)
-        self.S26_NR = str2int(miss_list, 32)
-        self.S44_RX = str2float(miss_list, 44)
-        self.S17_S = str2float(miss_list, 43)
-        self.S17_PS = str2float(miss_list, 43)
-        self.S27_S = str2float(miss_list, 43)
-        self.S13_T = str2float(miss_list, 50)
-        self.S42_TAX = str2float(miss_list, 50)
-        self.S43_TAN = str2float(miss_list, 50)
-        self.S23_T = str2float(miss_list, 50)
-        self.S14_TX = str2float(miss_list, 50)
-        self.S14_TN = str2float(miss_list, 50)
-        self.S24_TX = str2float(miss_list, 50)
-        self.S24_TN = str2float(miss_list, 50)
-        self.S13_ST = str2float(miss_list, 52)
-        self.S23_ST = str2float(miss_list, 52)
-        self.S18_MP = str2int(miss_list, 51)
-        self.S18_MT = str2int(miss_list, 51)
-        self.S19_ME = str2int(miss_list, 51)
-        self.S18_MTX = str2int(miss_list, 51)
-        self.S18_MTN = str2int(miss_list, 51)
-        self.S19_MS = str2int(miss_list, 51)
-        self.S19_MR = str2int(miss_list, 51)
-        self.S28_YP = str2int(miss_list, 56)
-        self.S28_YT = str2int(miss_list, 56)
-        self.S28_YTX = str2int(miss_list, 56)
-        self.S29_YE = str2int(miss_list, 56)
-        self.S29_YR = str2int(miss_list, 56)
-        self.S29_YS = str2int(miss_list, 56)
-        self.S38_F10 = str2int(miss_list, 51)
-        self.S38_F20 = str2int(miss_list, 51)
-        self.S38_F30 = str2int(miss_list, 51)
-        self.S32_TX0 = str2int(miss_list, 51)
-        self.S30_T25 = str2int(miss_list, 51)
-        self.S30_T30 = str2int(miss_list, 51)
-        self.S31_T35 = str2int(miss_list, 51)
-        self.S31_T40 = str2int(miss_list, 51)
-        self.S32_TN0 = str2int(miss_list, 51)
-        self.S36_S00 = str2int(miss_list, 51)
-        self.S36_S01 = str2int(miss_list, 51)
-        self.S37_S10 = str2int(miss_list, 51)
-        self.S37_S50 = str2int(miss_list, 51)
-        self.S39_V1 = str2int(miss_list, 51)
-        self.S39_V2 = str2int(miss_list, 51)
-        self.S39_V3 = str2int(miss_list, 51)
-        self.S33_R01 = str2int(miss_list, 51)
-        self.S33_R05 = str2int(miss_list, 51)
-        self.S34_R10 = str2int(miss_list, 51)
-        self.S34_R50 = str2int(miss_list, 51)
-        self.S35_R100 = str2int(miss_list, 51)
-        self.S35_R150 = str2int(miss_list, 51)
-        self.S40_TXD = str2float(miss_list, 50)
-        self.S41_TND = str2float(miss_list, 50)
-        self.S45_IW = str2int(miss_list, 66)
-        self.S45_FX =  str2float(miss_list, 67)
+        self._columns = {}
+        self._fields = {}
+        for key, values in zip(k_a, v_a):
+            registered = KEY_REGISTRY.get(key)
+            if registered is not None:
+                self._columns[registered[0]] = values
+
+    def __getattr__(self, name):
+        """
+        This function gives the value of name from the field store or, on its first use,
+        by DERIVED_FIELDS (2. - 3.) and keeps it in the field store.
+        Names starting with '_' are not fields, so e.g. pickle does not find them here.
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        fields = self._fields
+        value = fields.get(name)
+        if value is None:
+            derive = DERIVED_FIELDS.get(name)
+            if derive is None:
+                raise AttributeError("'Subset' object has no attribute '" + name + "'")
+            value = derive(self)
+            fields[name] = value
+        return value
+
+    def __getstate__(self):
+        """
+        This function returns the state of the object for pickle. The value columns are
+        converted first, so the state has arrays instead of the lists of strings.
+        """
+        for attribute in self._columns:
+            getattr(self, attribute)
+        return self.NSUB, dict.fromkeys(self._columns), self._fields
+
+    def __setstate__(self, state):
+        """
+        This function sets the state of the object from pickle.
+        """
+        self.NSUB, self._columns, self._fields = state
+
+    def converted_columns(self):
+        """
+        This function returns the converted value columns of the climat data by attribute
+        (e.g. for column_cache.py).
+        """
+        return {attribute: getattr(self, attribute) for attribute in self._columns}
+
+    def has(self, attribute):
+        """
+        This function tells if the climat data has the key of attribute.
+        """
+        return attribute in self._columns
 
     # 2.
-        for key in k_a:
-            if key == 'TTAAII':
-                self.TTAAII = v_a[k_a.index(key)]
-            elif key == 'ELANEM':
-                self.ELANEM = str2float(v_a[k_a.index(key)], 1)
-            elif key == 'ELBARO':
-                self.ELBARO = str2float(v_a[k_a.index(key)], 2)
-            elif key == 'ELSTAT':
-                self.ELSTAT = str2float(v_a[k_a.index(key)], 3)
-            elif key == 'ELTERM':
-                self.ELTERM = str2float(v_a[k_a.index(key)], 4)
-            elif key == 'LAT':
-                self.LAT = str2float(v_a[k_a.index(key)], 5)
-            elif key == 'LON':
-                self.LON = str2float(v_a[k_a.index(key)], 6)
-            elif key == 'STATION_NAME':
-                self.STATION_NAME = v_a[k_a.index(key)]
-            elif key == 'STATION_TYPE':
-                self.STATION_TYPE = str2int(v_a[k_a.index(key)], 8)
-            elif key == 'WMON':
-                self.WMON = v_a[k_a.index(key)]
-                self.BLOCK_NUMBER = str2int(self.WMON, 64)
-                self.STATION_NUMBER = str2int(self.WMON, 65)
-            elif key == 'WSI':
-                self.WSI_IDS = get_wigos(v_a[k_a.index(key)], 0)
-                self.WSI_IDI = get_wigos(v_a[k_a.index(key)], 1)
-                self.WSI_INR = get_wigos(v_a[k_a.index(key)], 2)
-                self.WSI_LID = get_wigos(v_a[k_a.index(key)], 3)
-            elif key == 'S40_YX':
-                self.S40_YX = str2int(v_a[k_a.index(key)], 21)
-            elif key == 'S41_YN':
-                self.S41_YN = str2int(v_a[k_a.index(key)], 21)
-            elif key == 'S42_YAX':
-                self.S42_YAX = str2int(v_a[k_a.index(key)], 21)
-            elif key == 'S43_YAN':
-                self.S43_YAN = str2int(v_a[k_a.index(key)], 21)
-            elif key == 'S45_YFX':
-                self.S45_YFX = str2int(v_a[k_a.index(key)], 21)
-            elif key == 'S44_YR':
-                self.S44_YR = str2int(v_a[k_a.index(key)], 21)
-            elif key == 'S11_P':
-                self.S11_P = str2float(v_a[k_a.index(key)], 34)
-            elif key == 'S21_P':
-                self.S21_P = str2float(v_a[k_a.index(key)], 34)
-            elif key == 'S12_P':
-                self.S12_P = str2float(v_a[k_a.index(key)], 34)
-            elif key == 'S22_P':
-                self.S22_P = str2float(v_a[k_a.index(key)], 34)
-            elif key == 'S15_E':
-                self.S15_E = str2float(v_a[k_a.index(key)], 34)
-            elif key == 'S25_E':
-                self.S25_E = str2float(v_a[k_a.index(key)], 34)
-            elif key == 'S16_R':
-                self.S16_R = str2float(v_a[k_a.index(key)], 40)
-            elif key == 'S26_R':
-                self.S26_R = str2float(v_a[k_a.index(key)], 40)
-            elif key == 'S16_RD':
-                self.S16_RD = str2int(v_a[k_a.index(key)], 31)
-            elif key == 'S16_NR':
-                self.S16_NR = str2int(v_a[k_a.index(key)], 32)
-            elif key == 'S26_NR':
-                self.S26_NR = str2int(v_a[k_a.index(key)], 32)
-            elif key == 'S44_RX':
-                self.S44_RX = str2float(v_a[k_a.index(key)], 44)
-            elif key == 'S13_T':
-                self.S13_T = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S42_TAX':
-                self.S42_TAX = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S43_TAN':
-                self.S43_TAN = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S23_T':
-                self.S23_T = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S13_ST':
-                self.S13_ST = str2float(v_a[k_a.index(key)], 52)
-            elif key == 'S23_ST':
-                self.S23_ST = str2float(v_a[k_a.index(key)], 52)
-            elif key == 'S14_TX':
-                self.S14_TX = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S24_TX':
-                self.S24_TX = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S14_TN':
-                self.S14_TN = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S24_TN':
-                self.S24_TN = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S18_MP':
-                self.S18_MP = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S18_MT':
-                self.S18_MT = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S19_ME':
-                self.S19_ME = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S18_MTX':
-                self.S18_MTX = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S18_MTN':
-                self.S18_MTN = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S19_MS':
-                self.S19_MS = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S19_MR':
-                self.S19_MR = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S28_YP':
-                self.S28_YP = str2int(v_a[k_a.index(key)], 56)
-            elif key == 'S28_YT':
-                self.S28_YT = str2int(v_a[k_a.index(key)], 56)
-            elif key == 'S28_YTX':
-                self.S28_YTX = str2int(v_a[k_a.index(key)], 56)
-            elif key == 'S29_YE':
-                self.S29_YE = str2int(v_a[k_a.index(key)], 56)
-            elif key == 'S29_YR':
-                self.S29_YR = str2int(v_a[k_a.index(key)], 56)
-            elif key == 'S29_YS':
-                self.S29_YS = str2int(v_a[k_a.index(key)], 56)
-            elif key == 'S17_S':
-                self.S17_S = str2float(v_a[k_a.index(key)], 43)
-            elif key == 'S17_PS':
-                self.S17_PS = str2float(v_a[k_a.index(key)], 43)
-            elif key == 'S27_S':
-                self.S27_S = str2float(v_a[k_a.index(key)], 43)
-            elif key == 'S20_YB':
-                self.S20_YB = get_times(v_a[k_a.index(key)], 1)
-            elif key == 'S20_YC':
-                self.S20_YC = get_times(v_a[k_a.index(key)], 1)
-            elif key == 'REPORT_MONTH':
-                self.REPORT_MONTH = v_a[k_a.index(key)]
-                self.R_YYYY = get_times(self.REPORT_MONTH, 0)
-                self.R_MM = get_times(self.REPORT_MONTH, 2)
-                self.R_DD = get_times(self.REPORT_MONTH, 3)
-                self.R_HH0 = get_number_list(self.NSUB, 0)
-                self.R_HH6 = get_number_list(self.NSUB, 6)
-                self.R_MI = get_number_list(self.NSUB, 0)
-            elif key == 'S38_F10':
-                self.S38_F10 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S38_F20':
-                self.S38_F20 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S38_F30':
-                self.S38_F30 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S32_TX0':
-                self.S32_TX0 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S30_T25':
-                self.S30_T25 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S30_T30':
-                self.S30_T30 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S31_T35':
-                self.S31_T35 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S31_T40':
-                self.S31_T40 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S32_TN0':
-                self.S32_TN0 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S36_S00':
-                self.S36_S00 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S36_S01':
-                self.S36_S01 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S37_S10':
-                self.S37_S10 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S37_S50':
-                self.S37_S50 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S39_V1':
-                self.S39_V1 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S39_V2':
-                self.S39_V2 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S39_V3':
-                self.S39_V3 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S33_R01':
-                self.S33_R01 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S33_R05':
-                self.S33_R05 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S34_R10':
-                self.S34_R10 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S34_R50':
-                self.S34_R50 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S35_R100':
-                self.S35_R100 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S35_R150':
-                self.S35_R150 = str2int(v_a[k_a.index(key)], 51)
-            elif key == 'S40_TXD':
-                self.S40_TXD = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S41_TND':
-                self.S41_TND = str2float(v_a[k_a.index(key)], 50)
-            elif key == 'S45_IW':
-                self.S45_IW = str2int(v_a[k_a.index(key)], 66)
-            elif key == 'S45_FX':
-                self.S45_FX = str2float(v_a[k_a.index(key)], 67)
-
-    # 3.
-        self.YYYY = make_list([self.R_YYYY, self.S20_YB, self.S20_YC, self.S20_YB,
-            self.S20_YC], self.NSUB)
-        self.MM = make_list([self.R_MM, self.R_MM, self.R_MM], self.NSUB)
-        self.DD = make_day_list([self.R_DD, self.S40_YX, self.S41_YN, self.S42_YAX, self.S43_YAN,
-            self.S45_YFX, self.R_DD, self.S44_YR, self.R_DD, self.R_DD], self.NSUB)
-        self.HH24 = make_list([self.R_HH0, self.R_HH6, self.R_HH0, self.R_HH6], self.NSUB)
-        self.MI = self.R_MI
-        self.NM = days_in_month_list(self.R_YYYY, self.R_MM)
-        self.UTC_DIFF = get_times(self.R_MM, 4)
-        self.TP = make_list([self.UTC_DIFF, self.NM, self.NM, self.UTC_DIFF,
-            get_number_list(self.NSUB, 1), get_number_list(self.NSUB, 1)], self.NSUB)
-        self.TOT_MISS = make_list([self.S18_MP, self.S18_MT, self.S19_ME, self.S18_MTX,
-            self.S18_MTN, self.S19_MS, self.S19_MR,
-            self.S28_YP, self.S28_YT, self.S28_YTX,self.S29_YE, self.S29_YR, self.S29_YS,
-            self.S28_YTX, self.S28_YTX], self.NSUB)
-        self.TNRA = make_list([self.S38_F10, self.S38_F20, self.S38_F30, self.S32_TX0,
-            self.S30_T25, self.S30_T30, self.S31_T35, self.S31_T40, self.S32_TN0,
-            self.S36_S00, self.S36_S01, self.S37_S10, self.S37_S50,
-            self.S39_V1, self.S39_V2, self.S39_V3, str2int(miss_list, 51), str2int(miss_list, 51),
-            self.S33_R01, self.S33_R05, self.S34_R10, self.S34_R50, self.S35_R100, self.S35_R150],
-            self.NSUB)
-        self.P_ST = make_list([self.S11_P, self.S21_P], self.NSUB)
-        self.P_SEA = make_list([self.S12_P, self.S22_P], self.NSUB)
-        self.T = make_list([self.S13_T, self.S42_TAX, self.S43_TAN, self.S23_T], self.NSUB)
-        self.TMAX = make_list([self.S14_TX, self.S24_TX], self.NSUB)
-        self.TMIN = make_list([self.S14_TN, self.S24_TN], self.NSUB)
-        self.TMEAN = make_list([self.S13_ST, self.S23_ST], self.NSUB)
-        self.E = make_list([self.S15_E, self.S25_E], self.NSUB)
-        self.SUND = make_list([self.S17_S, sunshine_pros(self.S17_S, self.S27_S), self.S27_S],
-            self.NSUB)
-        self.R_AC = make_list([self.S16_R, self.S26_R], self.NSUB)
-        self.R_N = make_list([self.S16_NR, self.S26_NR], self.NSUB)
-        self.N_MISS = make_const_list([1,2,4,7,8,6,5,1,2,3,4,5,6,7,8], self.NSUB)
-        self.SENSOR = height_of_sensor(self.ELANEM, self.ELTERM)
-        self.INSTRUMENT = instrument_type(self.NSUB)
-        self.FS = first_order_statistics(self.NSUB)
-        self.IND = observing_method_extreme_temperatures(self.NSUB)
-        self.CND = make_const_list([0,1,2,3,4,5,6,7,8,16,17,18,19,20,21,22,23,24,10,11,12,13,14,15],
-            self.NSUB)
-        self.D_OC = day_of_occurance_qualifier(self.S40_YX, self.S41_YN, self.S42_YAX, self.S43_YAN,
-            self.S45_YFX, miss_list, self.S44_YR)
-# 4.
-
-def get_wigos(wigos_id, key_id):
-    """
-    This function splits WIGOS identifier (wigos_id)from "-" to get a wigos_array with:
-        wigos_array[0] = WIGOS identifier series = WSI_IDS  (value between 0-14)
-        wigos_array[1] = WIGOS issuer of identifier = WSI_IDI
+    def column(self, attribute):
+        """
+        This function converts the value column of attribute by its converter and k_id.
+        A column which is all missing (or is not in the climat data) is given as
+        the shared missing array.
+        """
+        values = self._columns.get(attribute)
+        converter, k_id, default = REGISTRY_BY_ATTRIBUTE[attribute][1:]
+        if converter is None:
+            if values is None:
+                return [default] * self.NSUB
+            return values
+        if values is None or values.count(MISSING_VALUE) == len(values):
+            return missing_array(self.NSUB, default.fill_value, default.dtype)
+        converted = converter(values, k_id)
+        if converted.mask.all():
+            return missing_array(self.NSUB, default.fill_value, default.dtype)
+        return converted
+
+def subset_from_columns(number_of_subsets, columns):
+    """
+    This function returns subset object of number_of_subsets from the converted value
+    columns by attribute (Subset.converted_columns), so the columns are not converted again.
+    """
+    subs = Subset.__new__(Subset)
+    subs.__setstate__((number_of_subsets, dict.fromkeys(columns), dict(columns)))
+    return subs
+
+def get_wigos(wigos_id):
+    """
+    This function splits WIGOS identifiers (wigos_id) from "-" in one pass and returns
+    the four parts of them:
+        WSI_IDS = WIGOS identifier series (value between 0-14)
+        WSI_IDI = WIGOS issuer of identifier
             Value between 1 and 9 999 when no WMO number.
             Value between 10 000 and 99 999 otherwise.
-        wigos_array[2] = WIGOS issue number = WSI_INR
-        wigos_array[3] = WIGOS local identifier (character) = WSI_LID
+        WSI_INR = WIGOS issue number
+        WSI_LID = WIGOS local identifier (character)
             NSI number is used if WMO number is missing provided.
     https://wiki.fmi.fi/pages/viewpage.action?pageId=107195152
-    """
-    wigos_term = []
-    for i in range(0, len(wigos_id)):
-        if wigos_id[i] != '-1e+100':
-            wigos_array = wigos_id[i].split('-')
-
-            if len(wigos_array)!= 4:
-                print('WIGOS identifier is wrongly written!\n')
-                sys.exit(1)
-            try:
-                wigos_array[0] = int(wigos_array[0])
-                wigos_array[1] = int(wigos_array[1])
-                wigos_array[2] = int(wigos_array[2])
-                if wigos_array[0] not in range(0, 15):
-                    print('WIGOS identifier series number should be in range (0, 14).\n')
-                    sys.exit(1)
-                elif wigos_array[1] not in range(1, 100000):
-                    print('WIGOS issuer of identifier number should be in range (1, 99 999).\n')
-                    sys.exit(1)
-                elif wigos_array[2] not in range(0, 100000):
-                    print('WIGOS issue number should be in range (0, 99 999.\n')
-                    sys.exit(1)
-                elif len(wigos_array[3])> 16:
-                    print('WIGOS local identifier should be 16 characters max.\n')
-                    sys.exit(1)
-                wigos_term.append(wigos_array[key_id])
-            except ValueError:
-                print('WIGOS identifier series, WIGOS issuer of identifier')
-                print('and WIGOS issuer number should be positive integers.\n')
-                sys.exit(1)
+    Numbers of missing identifiers are masked and their local identifier is empty.
+    Identifiers which are in SPLIT_WIGOS are not split again.
+    """
+    numbers = []
+    mask = []
+    local_ids = []
+    for wigos in wigos_id:
+        if wigos != MISSING_VALUE:
+            wigos_array = SPLIT_WIGOS.get(wigos)
+            if wigos_array is None:
+                wigos_array = split_wigos(wigos)
+            mask.append(False)
         else:
-            wigos_array = [miss, miss, miss, '']
-            wigos_term.append(wigos_array[key_id])
-
-    return wigos_term
+            wigos_array = (0, 0, 0, '')
+            mask.append(True)
+        numbers.append(wigos_array[:3])
+        local_ids.append(wigos_array[3])
+
+    numbers = np.array(numbers, dtype=np.int64).reshape(-1, 3)
+    return (masked_array(numbers[:, 0], mask, miss), masked_array(numbers[:, 1], mask, miss),
+        masked_array(numbers[:, 2], mask, miss), local_ids)
+
+def split_wigos(wigos):
+    """
+    This function splits one WIGOS identifier (wigos) to its four parts and checks them.
+    WigosError is raised, if the identifier is wrongly written.
+    """
+    wigos_array = wigos.split('-')
+
+    if len(wigos_array)!= 4:
+        raise WigosError('WIGOS identifier is wrongly written!\n', wigos)
+    try:
+        wigos_array[0] = int(wigos_array[0])
+        wigos_array[1] = int(wigos_array[1])
+        wigos_array[2] = int(wigos_array[2])
+    except ValueError:
+        raise WigosError('WIGOS identifier series, WIGOS issuer of identifier\n'
+            + 'and WIGOS issuer number should be positive integers.\n', wigos)
+    if wigos_array[0] not in range(0, 15):
+        raise WigosError('WIGOS identifier series number should be in range (0, 14).\n', wigos)
+    elif wigos_array[1] not in range(1, 100000):
+        raise WigosError('WIGOS issuer of identifier number should be in range (1, 99 999).\n',
+            wigos)
+    elif wigos_array[2] not in range(0, 100000):
+        raise WigosError('WIGOS issue number should be in range (0, 99 999).\n', wigos)
+    elif len(wigos_array[3])> 16:
+        raise WigosError('WIGOS local identifier should be 16 characters max.\n', wigos)
+    return tuple(wigos_array)
+
+def report_time(subs, n):
+    """
+    This function returns year (n == 0), month (n == 2) or day (n == 3) of REPORT_MONTH
+    of subset object (subs) by get_times. They are missing, if there is no REPORT_MONTH.
+    """
+    if subs.has('REPORT_MONTH'):
+        return get_times(subs.REPORT_MONTH, n)
+    return missing_array(subs.NSUB, miss)
+
+def report_hour(subs, hour):
+    """
+    This function returns the hour (or minute) of the report, which is missing, if there
+    is no REPORT_MONTH.
+    """
+    if subs.has('REPORT_MONTH'):
+        return get_number_list(subs.NSUB, hour)
+    return missing_array(subs.NSUB, miss)
 
 def get_times(time_list, n):
     """
-    This function returns time list according to number n:
+    This function returns time array according to number n:
         n == 0: years from parameter REPORT_MONTH=YYYY-MM-DD
         n == 1: years from year list (yyyy)
         n == 2: months from parameter REPORT_MONTH=YYYY-MM-DD
         n == 3: days from parameter REPORT_MONTH=YYYY-MM-DD
         n == 4: utc - ltm according which month it is (mm)
-    """
-    times = []
-    for i in range (0, len(time_list)):
-        time = time_list[i]
-        if n == 0:
-            times.append(int(time[:4]))
-        elif n == 1:
-            times.append(int(time))
-        elif n == 2:
-            times.append(int(time[5:7]))
-        elif n == 3:
-            times.append(int(time[-2:]))
-        elif n == 4:
-            if int(time) < 4:
-                times.append(-2)
-            elif int(time) > 10:
-                times.append(-2)
-            else:
-                times.append(-3)
-        else:
-            times.append(miss)
-
-    return times
+    Times of missing values are masked.
+    """
+    if n == 1:
+        return str2int(time_list, 0)
+    if n == 4:
+        months = np.ma.getdata(time_list)
+        return masked_array(np.where((months < 4) | (months > 10), -2, -3),
+            np.ma.getmaskarray(time_list), miss)
+
+    str_array, mask = split_missing(time_list)
+    dates = np.where(mask, 'NaT', str_array.astype('U10')).astype('datetime64[D]')
+    if n == 0:
+        times = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    elif n == 2:
+        times = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    elif n == 3:
+        times = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+    else:
+        return missing_array(len(time_list), miss)
+    return masked_array(times, mask, miss)
 
 def get_number_list(ns, value):
     """
-    This function returns list of values.
-    List will have items as many as subsets (ns).
+    This function returns array of values.
+    Array will have items as many as subsets (ns).
     """
-    values = []
-    for i in range (0, ns):
-        values.append(int(value))
-    return values
+    return np.full(ns, int(value), dtype=np.int64)
 
-def is_leap_year(year):
+def missing_array(ns, fill_value, dtype=None):
     """
-    This function checks if the year is a leap year
+    This function returns array of ns missing values. fill_value is the eccodes missing
+    value, which tells also the type of the array (CODES_MISSING_LONG = int64,
+    CODES_MISSING_DOUBLE = float64), if dtype is not given. The arrays are read-only and
+    shared (ALL_MISSING), so missing values do not take memory for each subset object.
     """
-    return (year % 4 == 0 and year % 100 != 0) or (year % 400 == 0)
+    if dtype is None:
+        dtype = np.float64 if isinstance(fill_value, float) else np.int64
+    key = (ns, np.dtype(dtype).str, fill_value)
+    array = ALL_MISSING.get(key)
+    if array is None:
+        if len(ALL_MISSING) >= ALL_MISSING_CACHE_SIZE:
+            ALL_MISSING.clear()
+        data = np.zeros(ns, dtype=dtype)
+        mask = np.ones(ns, dtype=bool)
+        data.setflags(write=False)
+        mask.setflags(write=False)
+        array = masked_array(data, mask, fill_value)
+        ALL_MISSING[key] = array
+    return array
 
-def days_in_month(year, month):
+def masked_array(data, mask, fill_value):
     """
-    This function return number of days in month.
-    If it's February, the leap year is checked.
+    This function returns data as a masked array, where mask is True for the missing
+    values. fill_value is the eccodes missing value of the data.
     """
-    days_in_months = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    return np.ma.MaskedArray(data, mask=mask, fill_value=fill_value)
 
-    if month == 2 and is_leap_year(year):
-        return 29
-    else:
-        return days_in_months[month - 1]
+def eccodes_values(values):
+    """
+    This function returns values for eccodes. Masked (missing) values are replaced by
+    the fill value of the array, which is the eccodes missing value of the data.
+    """
+    if isinstance(values, np.ma.MaskedArray):
+        return values.filled()
+    return values
 
 def days_in_month_list(y_list, m_list):
     """
-    This function return number of days in month list.
+    This function return number of days in month array.
+    Leap years are taken into account by numpy's datetime64 months.
+    Number of days is masked, if the year or the month is missing.
     """
-    nm_list = []
-    for i in range (0, len(m_list)):
-        nm_list.append(days_in_month(int(y_list[i]), int(m_list[i])))
-    return nm_list
+    mask = np.ma.getmaskarray(y_list) | np.ma.getmaskarray(m_list)
+    years = np.where(mask, 1970, np.ma.getdata(y_list)).astype(np.int64)
+    months = (years - 1970) * 12 + np.where(mask, 1, np.ma.getdata(m_list)).astype(np.int64) - 1
+    months = months.astype('datetime64[M]')
+    days = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+    return masked_array(days, mask, miss)
 
 def sunshine_pros(s_month_list, s_30v_list):
     """
@@ -481,39 +302,22 @@ def sunshine_pros(s_month_list, s_30v_list):
         (2) If the normal is zero hours, Total sunshine 0 14 033 shall be set to 510.
         (3) If the normal is not defined, Total sunshine 0 14 033 shall be set to missing.
     """
-    s_pros_list = []
-    for s in range(0, len(s_month_list)):
-        if float(s_30v_list[s]) == missD or float(s_month_list[s]) == missD:
-            s_pros_list.append(missD)
-        else:
-            if float(s_30v_list[s]) == 0.0:
-                s_pros_list.append(510)
-            else:
-                s_pros = 100* float(s_month_list[s]) / float(s_30v_list[s])
-                if 0.0 <= s_pros and s_pros <= 1.0:
-                    s_pros_list.append(1)
-                else:
-                    s_pros_list.append(int(s_pros))
+    mask = np.ma.getmaskarray(s_month_list) | np.ma.getmaskarray(s_30v_list)
+    s_month = np.ma.getdata(s_month_list).astype(np.float64)
+    s_30v = np.ma.getdata(s_30v_list).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s_pros = 100 * s_month / s_30v
+    s_pros_list = np.where((0.0 <= s_pros) & (s_pros <= 1.0), 1.0, np.trunc(s_pros))
+    s_pros_list = np.where(s_30v == 0.0, 510.0, s_pros_list)
 
-    return s_pros_list
+    return masked_array(s_pros_list, mask, missD)
 
 def first_order_statistics(ns):
     """
     This function retusn list of first order statistics
     according to code table 0 08 023
     """
-    fs_list = []
-    for i in range (0, ns):
-        fs_list.append(4)
-        fs_list.append(63)
-        fs_list.append(2)
-        fs_list.append(3)
-        fs_list.append(63)
-        fs_list.append(4)
-        fs_list.append(63)
-        fs_list.append(4)
-        fs_list.append(63)
-    return fs_list
+    return make_const_list([4, 63, 2, 3, 63, 4, 63, 4, 63], ns)
 
 def observing_method_extreme_temperatures(ns):
     """
@@ -527,44 +331,23 @@ def observing_method_extreme_temperatures(ns):
         4–14 Reserved
         15 Missing value
     """
-    ind_list = []
-    for i in range (0, ns):
-        ind_list.append(15)
-        ind_list.append(2)
-    return ind_list
-
-
+    return make_const_list([15, 2], ns)
 
 def height_of_sensor(elanem_list, elterm_list):
     """
     This function makes a list of all the sensor heights
     in CLIMATE sequence 3 07 073.
     """
-    float_list = []
-    for i in range(0, len(elanem_list)):
-        float_list.append(elterm_list[i])
-        float_list.append(missD)
-        float_list.append(elterm_list[i])
-        float_list.append(elanem_list[i])
-        float_list.append(missD)
-        float_list.append(missD)
-        float_list.append(elterm_list[i])
-        float_list.append(missD)
-        float_list.append(missD)
-    return float_list
-
+    none = missing_array(len(elanem_list), missD)
+    return make_list([elterm_list, none, elterm_list, elanem_list, none, none,
+        elterm_list, none, none], len(elanem_list))
 
 def instrument_type(ns):
     """
     This function gives the total list of instrument types.
     The size of list depends on ns = NSUB = number of subsets.
     """
-    float_list = []
-    i = 0
-    while i < ns:
-        float_list.append(8.0)
-        i = i + 1
-    return float_list
+    return np.full(ns, 8.0)
 
 def day_of_occurance_qualifier(d1_list, d2_list, d3_list, d4_list, d5_list, d6_list, d7_list):
     """
@@ -572,29 +355,17 @@ def day_of_occurance_qualifier(d1_list, d2_list, d3_list, d4_list, d5_list, d6_l
     If the extreme daily value occurred on only one day, the day of occurrence qualifier
     shall be set to 0. If the extreme daily value occurred on more than one day, the first
     day shall be reported for 0 04 003 and the day of occurrence qualifier shall be set to 1.
-    If the extreme daily value is missing, the day of occurrence qualifier shall be set to 3.
+    If the extreme daily value is missing, the day of occurrence qualifier shall be set to 3
+    (missing value), so it is masked.
     The input in this function is list of the days when the extreme daily value occured.
     If the value occured more than once the value of day is increased with 50.
     """
-    q_list = []
-    d_list_of_lists = [d1_list, d2_list, d3_list, d4_list, d5_list, d6_list, d7_list]
-    for sub in range(0, len(d1_list)):
-        for d_list in d_list_of_lists:
-            if d_list[sub] == '-1e+100':
-                q_list.append(3)
-            elif int(d_list[sub]) >= 1 and int(d_list[sub]) <= 31:
-                q_list.append(0)
-            elif int(d_list[sub]) > 31 and int(d_list[sub]) <= 81:
-                q_list.append(1)
-            else:
-                q_list.append(3)
-    return q_list
-
-def precipitation(str_value):
-    """
-    Function retuns value for precipitation with one decimal point.
-    """
-    return round(float(str_value), 1)
+    q_lists = []
+    for d_list in [d1_list, d2_list, d3_list, d4_list, d5_list, d6_list, d7_list]:
+        days = np.ma.getdata(d_list)
+        mask = np.ma.getmaskarray(d_list) | (days < 1) | (days > 81)
+        q_lists.append(masked_array(np.where(days <= 31, 0, 1), mask, miss))
+    return make_list(q_lists, len(d1_list))
 
 def make_missing(k_id):
     """
@@ -603,74 +374,64 @@ def make_missing(k_id):
     value = miss
     if 22 <= k_id <= 23:
         value = 31
-    elif k_id == 31:
-        value = 15
     elif 54 <= k_id <= 55:
         value = 31
     elif k_id == 62:
         value = 511
     return value
 
-def not_missing(str_value, k_id):
+def split_missing(str_list):
     """
-    Function gives right values according to given value (str_value) and its id (k_id).
+    This function returns str_list as a string array and a missing-value mask, which is
+    True where the value is missing (MISSING_VALUE = '/').
     """
-    value = int(str_value)
-    if k_id == 29:
-        value = int(value*12.5 + 0.5)
-    elif k_id == 53 and value > 81900:
-        value = 81900
-    elif k_id == 64:
-        value = int(str_value[:2])
-    elif k_id == 65:
-        value = int(str_value[-3:])
-    return value
+    str_array = np.asarray(str_list, dtype=str)
+    return str_array, str_array == MISSING_VALUE
 
 def str2int(str_list, k_id):
     """
-    This function makes a string list (str_list) to a integer list (int_list).
+    This function makes a string list (str_list) to a masked integer array (int64).
         k_id represents the id of different values. Values are converted from string to
-        integer depending on k_id. Before this function, missing values = '/' are changed
-        to be '-1e+100', which in eccodes is the missing value of float type value.
-        It is changed to be missing value of integer type value.
-    """
-    int_list = []
-    for i in range (0, len(str_list)):
-        if str_list[i] == '-1e+100':
-            int_list.append(make_missing(k_id))
-        else:
-            int_list.append(not_missing(str_list[i], k_id))
-    return int_list
+        integer depending on k_id by one vectorized operation. Missing values ('/') are
+        masked and the fill value of the array is the missing value of k_id (make_missing).
+    """
+    str_array, mask = split_missing(str_list)
+    str_array = np.where(mask, '0', str_array)
+    if k_id == 64:
+        int_array = str_array.astype('U2').astype(np.int64)
+    else:
+        int_array = str_array.astype(np.int64)
+        if k_id == 29:
+            int_array = (int_array * 12.5 + 0.5).astype(np.int64)
+        elif k_id == 53:
+            int_array = np.minimum(int_array, 81900)
+        elif k_id == 65:
+            int_array = int_array % 1000
+    return masked_array(int_array, mask, make_missing(k_id))
 
 def str2float(str_list, k_id):
     """
-    This function makes a string list (str_list) to a float list (float_list).
+    This function makes a string list (str_list) to a masked float array (float64).
         k_id represents the id of different values. Values are converted from string to
-        float depending on k_id. Before this function, missing values = '/' are changed
-        to be '-1e+100' which in eccodes is the missing value of float type value.
-    """
-    float_list = []
-    for i in range (0, len(str_list)):
-        if str_list[i] == '-1e+100' and k_id != 42:
-            float_list.append(float(str_list[i]))
-        elif k_id == 4 and 1.5 <= float(str_list[i]) < 3.0:
-            float_list.append(2.00)
-        elif k_id == 34:
-            float_list.append(float(str_list[i]) * 100)
-        elif k_id == 40:
-            float_list.append(precipitation(str_list[i]))
-        elif k_id == 41:
-            float_list.append(float(str_list[i]) * 0.010)
-        elif k_id == 42:
-            if str_list[i] == miss or str_list[i] == '-1e+100':
-                float_list.append(miss)
-            else:
-                float_list.append(float(str_list[i]) * 60.0)
-        elif k_id == 50:
-            float_list.append(float(str_list[i]) + 273.15)
-        else:
-            float_list.append(float(str_list[i]))
-    return float_list
+        float depending on k_id by one vectorized operation. Missing values ('/') are
+        masked and the fill value of the array is the eccodes missing value of float type
+        value (or of integer type value for k_id 42).
+    """
+    str_array, mask = split_missing(str_list)
+    float_array = np.where(mask, '0', str_array).astype(np.float64)
+    if k_id == 4:
+        float_array[(1.5 <= float_array) & (float_array < 3.0)] = 2.00
+    elif k_id == 34:
+        float_array = float_array * 100
+    elif k_id == 40:
+        float_array = np.round(float_array, 1)
+    elif k_id == 41:
+        float_array = float_array * 0.010
+    elif k_id == 42:
+        float_array = float_array * 60.0
+    elif k_id == 50:
+        float_array = float_array + 273.15
+    return masked_array(float_array, mask, miss if k_id == 42 else missD)
 
 def make_day_list(list_of_lists, n_sub):
     """
@@ -682,21 +443,10 @@ def make_day_list(list_of_lists, n_sub):
     This function also check if the day is in range [1,31] or [51,81]. If the later, the
     result day is decreased by 50.
     """
-    # Check if list_of_lists is a list of integers or other non-list elements
-    if list_of_lists and not any(isinstance(item, list) for item in list_of_lists):
-        # Wrap the single list in another list to make it a list of lists
-        list_of_lists = [list_of_lists]
-    result_list = []
-
-    for sub in range (0, n_sub):
-        for l in list_of_lists:
-            if l[sub] == '-1e+100':
-                result_list.append(miss)
-            elif int(l[sub]) >= 51 and int(l[sub]) <= 81:
-                result_list.append(int(l[sub]) - 50)
-            else:
-                result_list.append(int(l[sub]))
-    return result_list
+    day_list = make_list(list_of_lists, n_sub)
+    days = np.ma.getdata(day_list)
+    days = np.where((51 <= days) & (days <= 81), days - 50, days)
+    return masked_array(days, np.ma.getmaskarray(day_list), day_list.fill_value)
 
 def make_list(list_of_lists, n_sub):
     """
@@ -705,24 +455,201 @@ def make_list(list_of_lists, n_sub):
     by taking the first element of every list,
     then the second, and so on..
     If a single list is provided, it will be treated as a list of lists with one list.
+    The result is a masked array, where the missing values of the lists are masked.
+    If all the values are missing, the result is the shared missing array.
+    The lists are stacked as the columns of (n_sub, number of lists) array, which is
+    read row by row, so the values are interleaved by one vectorized operation.
     """
     # Check if list_of_lists is a list of integers or other non-list elements
-    if list_of_lists and not any(isinstance(item, list) for item in list_of_lists):
+    if list_of_lists and not any(isinstance(item, (list, np.ndarray)) for item in list_of_lists):
         # Wrap the single list in another list to make it a list of lists
         list_of_lists = [list_of_lists]
-    result_list = []
-
-    for sub in range (0, n_sub):
-        for l in list_of_lists:
-            result_list.append(l[sub])
-    return result_list
+    # lists which are all missing give the shared missing array
+    if all(np.ma.getmaskarray(l).all() for l in list_of_lists):
+        data = np.asarray(np.ma.getdata(list_of_lists[0]))
+        return missing_array(n_sub * len(list_of_lists), fill_value_of(list_of_lists), data.dtype)
+    data = np.column_stack([np.ma.getdata(l)[:n_sub] for l in list_of_lists])
+    mask = np.column_stack([np.ma.getmaskarray(l)[:n_sub] for l in list_of_lists])
+    return masked_array(data.ravel(), mask.ravel(), fill_value_of(list_of_lists))
+
+def fill_value_of(list_of_lists):
+    """
+    This function returns the eccodes missing value of the lists: the fill value of the
+    first masked array or the missing value of the type of the values.
+    """
+    for l in list_of_lists:
+        if isinstance(l, np.ma.MaskedArray):
+            return l.fill_value
+    if np.asarray(list_of_lists[0]).dtype.kind == 'f':
+        return missD
+    return miss
 
 def make_const_list(constant_list, n_sub):
     """
     This function makes same constant list for each subset.
     """
-    result_list = []
-    for i in range(0, n_sub):
-        for j in range(0, len(constant_list)):
-            result_list.append(constant_list[j])
-    return result_list
+    return np.tile(np.asarray(constant_list), n_sub)
+
+def compile_key_registry(key_table):
+    """
+    This function compiles key_table to the key registry, which is used by Subset class.
+    key_table has for each climat key: (attribute, converter, k_id). The missing default
+    of the key is given by the converter from the missing value MISSING_VALUE ('/'), so
+    it is calculated only once. Keys without converter are kept as strings.
+    """
+    registry = {}
+    for key, (attribute, converter, k_id) in key_table.items():
+        if converter is None:
+            default = MISSING_VALUE
+        else:
+            default = converter([MISSING_VALUE], k_id)
+        registry[key] = (attribute, converter, k_id, default)
+    return registry
+
+# Climat key: (Subset attribute, converter, k_id)
+KEY_REGISTRY = compile_key_registry({
+    'TTAAII': ('TTAAII', None, None),
+    'ELANEM': ('ELANEM', str2float, 1),
+    'ELBARO': ('ELBARO', str2float, 2),
+    'ELSTAT': ('ELSTAT', str2float, 3),
+    'ELTERM': ('ELTERM', str2float, 4),
+    'LAT': ('LAT', str2float, 5),
+    'LON': ('LON', str2float, 6),
+    'STATION_NAME': ('STATION_NAME', None, None),
+    'STATION_TYPE': ('STATION_TYPE', str2int, 8),
+    'WMON': ('WMON', None, None),
+    'WSI': ('WSI', None, None),
+    'REPORT_MONTH': ('REPORT_MONTH', None, None),
+    'S11_P': ('S11_P', str2float, 34),
+    'S12_P': ('S12_P', str2float, 34),
+    'S13_T': ('S13_T', str2float, 50),
+    'S13_ST': ('S13_ST', str2float, 52),
+    'S14_TX': ('S14_TX', str2float, 50),
+    'S14_TN': ('S14_TN', str2float, 50),
+    'S15_E': ('S15_E', str2float, 34),
+    'S16_R': ('S16_R', str2float, 40),
+    'S16_RD': ('S16_RD', str2int, 31),
+    'S16_NR': ('S16_NR', str2int, 32),
+    'S17_S': ('S17_S', str2float, 43),
+    'S17_PS': ('S17_PS', str2float, 43),
+    'S18_MP': ('S18_MP', str2int, 51),
+    'S18_MT': ('S18_MT', str2int, 51),
+    'S18_MTX': ('S18_MTX', str2int, 51),
+    'S18_MTN': ('S18_MTN', str2int, 51),
+    'S19_ME': ('S19_ME', str2int, 51),
+    'S19_MS': ('S19_MS', str2int, 51),
+    'S19_MR': ('S19_MR', str2int, 51),
+    'S20_YB': ('S20_YB', str2int, 63),
+    'S20_YC': ('S20_YC', str2int, 63),
+    'S21_P': ('S21_P', str2float, 34),
+    'S22_P': ('S22_P', str2float, 34),
+    'S23_T': ('S23_T', str2float, 50),
+    'S23_ST': ('S23_ST', str2float, 52),
+    'S24_TX': ('S24_TX', str2float, 50),
+    'S24_TN': ('S24_TN', str2float, 50),
+    'S25_E': ('S25_E', str2float, 34),
+    'S26_R': ('S26_R', str2float, 40),
+    'S26_NR': ('S26_NR', str2int, 32),
+    'S27_S': ('S27_S', str2float, 43),
+    'S28_YP': ('S28_YP', str2int, 56),
+    'S28_YT': ('S28_YT', str2int, 56),
+    'S28_YTX': ('S28_YTX', str2int, 56),
+    'S29_YE': ('S29_YE', str2int, 56),
+    'S29_YR': ('S29_YR', str2int, 56),
+    'S29_YS': ('S29_YS', str2int, 56),
+    'S30_T25': ('S30_T25', str2int, 51),
+    'S30_T30': ('S30_T30', str2int, 51),
+    'S31_T35': ('S31_T35', str2int, 51),
+    'S31_T40': ('S31_T40', str2int, 51),
+    'S32_TX0': ('S32_TX0', str2int, 51),
+    'S32_TN0': ('S32_TN0', str2int, 51),
+    'S33_R01': ('S33_R01', str2int, 51),
+    'S33_R05': ('S33_R05', str2int, 51),
+    'S34_R10': ('S34_R10', str2int, 51),
+    'S34_R50': ('S34_R50', str2int, 51),
+    'S35_R100': ('S35_R100', str2int, 51),
+    'S35_R150': ('S35_R150', str2int, 51),
+    'S36_S00': ('S36_S00', str2int, 51),
+    'S36_S01': ('S36_S01', str2int, 51),
+    'S37_S10': ('S37_S10', str2int, 51),
+    'S37_S50': ('S37_S50', str2int, 51),
+    'S38_F10': ('S38_F10', str2int, 51),
+    'S38_F20': ('S38_F20', str2int, 51),
+    'S38_F30': ('S38_F30', str2int, 51),
+    'S39_V1': ('S39_V1', str2int, 51),
+    'S39_V2': ('S39_V2', str2int, 51),
+    'S39_V3': ('S39_V3', str2int, 51),
+    'S40_TXD': ('S40_TXD', str2float, 50),
+    'S40_YX': ('S40_YX', str2int, 21),
+    'S41_TND': ('S41_TND', str2float, 50),
+    'S41_YN': ('S41_YN', str2int, 21),
+    'S42_TAX': ('S42_TAX', str2float, 50),
+    'S42_YAX': ('S42_YAX', str2int, 21),
+    'S43_TAN': ('S43_TAN', str2float, 50),
+    'S43_YAN': ('S43_YAN', str2int, 21),
+    'S44_RX': ('S44_RX', str2float, 44),
+    'S44_YR': ('S44_YR', str2int, 21),
+    'S45_IW': ('S45_IW', str2int, 66),
+    'S45_FX': ('S45_FX', str2float, 67),
+    'S45_YFX': ('S45_YFX', str2int, 21),
+})
+
+REGISTRY_BY_ATTRIBUTE = {registered[0]: registered for registered in KEY_REGISTRY.values()}
+
+# Subset attribute: function, which gives its value from subset object (s)
+DERIVED_FIELDS = {attribute: (lambda s, attribute=attribute: s.column(attribute))
+    for attribute in REGISTRY_BY_ATTRIBUTE}
+DERIVED_FIELDS.update({
+    'BLOCK_NUMBER': lambda s: str2int(s.WMON, 64),
+    'STATION_NUMBER': lambda s: str2int(s.WMON, 65),
+    'WIGOS': lambda s: get_wigos(s.WSI),
+    'WSI_IDS': lambda s: s.WIGOS[0],
+    'WSI_IDI': lambda s: s.WIGOS[1],
+    'WSI_INR': lambda s: s.WIGOS[2],
+    'WSI_LID': lambda s: s.WIGOS[3],
+    'R_YYYY': lambda s: report_time(s, 0),
+    'R_MM': lambda s: report_time(s, 2),
+    'R_DD': lambda s: report_time(s, 3),
+    'R_HH0': lambda s: report_hour(s, 0),
+    'R_HH6': lambda s: report_hour(s, 6),
+    'R_MI': lambda s: report_hour(s, 0),
+    'MISSING_INTS': lambda s: missing_array(s.NSUB, miss),
+    'YYYY': lambda s: make_list([s.R_YYYY, s.S20_YB, s.S20_YC, s.S20_YB, s.S20_YC], s.NSUB),
+    'MM': lambda s: make_list([s.R_MM, s.R_MM, s.R_MM], s.NSUB),
+    'DD': lambda s: make_day_list([s.R_DD, s.S40_YX, s.S41_YN, s.S42_YAX, s.S43_YAN,
+        s.S45_YFX, s.R_DD, s.S44_YR, s.R_DD, s.R_DD], s.NSUB),
+    'HH24': lambda s: make_list([s.R_HH0, s.R_HH6, s.R_HH0, s.R_HH6], s.NSUB),
+    'MI': lambda s: s.R_MI,
+    'NM': lambda s: days_in_month_list(s.R_YYYY, s.R_MM),
+    'UTC_DIFF': lambda s: get_times(s.R_MM, 4),
+    'TP': lambda s: make_list([s.UTC_DIFF, s.NM, s.NM, s.UTC_DIFF,
+        get_number_list(s.NSUB, 1), get_number_list(s.NSUB, 1)], s.NSUB),
+    'TOT_MISS': lambda s: make_list([s.S18_MP, s.S18_MT, s.S19_ME, s.S18_MTX,
+        s.S18_MTN, s.S19_MS, s.S19_MR,
+        s.S28_YP, s.S28_YT, s.S28_YTX, s.S29_YE, s.S29_YR, s.S29_YS,
+        s.S28_YTX, s.S28_YTX], s.NSUB),
+    'TNRA': lambda s: make_list([s.S38_F10, s.S38_F20, s.S38_F30, s.S32_TX0,
+        s.S30_T25, s.S30_T30, s.S31_T35, s.S31_T40, s.S32_TN0,
+        s.S36_S00, s.S36_S01, s.S37_S10, s.S37_S50,
+        s.S39_V1, s.S39_V2, s.S39_V3, s.MISSING_INTS, s.MISSING_INTS,
+        s.S33_R01, s.S33_R05, s.S34_R10, s.S34_R50, s.S35_R100, s.S35_R150], s.NSUB),
+    'P_ST': lambda s: make_list([s.S11_P, s.S21_P], s.NSUB),
+    'P_SEA': lambda s: make_list([s.S12_P, s.S22_P], s.NSUB),
+    'T': lambda s: make_list([s.S13_T, s.S42_TAX, s.S43_TAN, s.S23_T], s.NSUB),
+    'TMAX': lambda s: make_list([s.S14_TX, s.S24_TX], s.NSUB),
+    'TMIN': lambda s: make_list([s.S14_TN, s.S24_TN], s.NSUB),
+    'TMEAN': lambda s: make_list([s.S13_ST, s.S23_ST], s.NSUB),
+    'E': lambda s: make_list([s.S15_E, s.S25_E], s.NSUB),
+    'SUND': lambda s: make_list([s.S17_S, sunshine_pros(s.S17_S, s.S27_S), s.S27_S], s.NSUB),
+    'R_AC': lambda s: make_list([s.S16_R, s.S26_R], s.NSUB),
+    'R_N': lambda s: make_list([s.S16_NR, s.S26_NR], s.NSUB),
+    'N_MISS': lambda s: make_const_list([1,2,4,7,8,6,5,1,2,3,4,5,6,7,8], s.NSUB),
+    'SENSOR': lambda s: height_of_sensor(s.ELANEM, s.ELTERM),
+    'INSTRUMENT': lambda s: instrument_type(s.NSUB),
+    'FS': lambda s: first_order_statistics(s.NSUB),
+    'IND': lambda s: observing_method_extreme_temperatures(s.NSUB),
+    'CND': lambda s: make_const_list([0,1,2,3,4,5,6,7,8,16,17,18,19,20,21,22,23,24,
+        10,11,12,13,14,15], s.NSUB),
+    'D_OC': lambda s: day_of_occurance_qualifier(s.S40_YX, s.S41_YN, s.S42_YAX, s.S43_YAN,
+        s.S45_YFX, s.MISSING_INTS, s.S44_YR),
+})
@@ -0,0 +1,86 @@
+"""
+This module splices uncompressed bufr messages from the encoded subsets of the stations.
+In an uncompressed message (compressedData = 0) each subset of sequence 307073 is its own
+segment of bits in section 4 and all the segments have the same number of bits, so the
+segment of a station (row) can be cached by the hash of the row (row_keys) and reused in
+the next message. Only the rows which have changed are encoded again.
+"""
+import hashlib
+import numpy as np
+import subset_arrays as subA
+
+# Version of the cached segments, changed when the encoding changes
+SEGMENT_VERSION = 1
+
+def row_keys(keys, value_columns, settings):
+    """
+    This function returns the content hash (sha256, hex) of each row of the value columns.
+    The encoder settings (settings) are hashed with each row and only the keys which are
+    encoded (subset_arrays.KEY_REGISTRY) are hashed, in the order of the key names.
+    """
+    prefix = (str(SEGMENT_VERSION) + '|' + '|'.join(str(value) for value in settings)
+        + '\n').encode('utf8')
+    columns = sorted((key, values) for key, values in zip(keys, value_columns)
+        if key in subA.KEY_REGISTRY)
+    names = [key for key, values in columns]
+    hashes = []
+    for row in zip(*[values for key, values in columns]):
+        text = '\x1f'.join(key + '=' + value for key, value in zip(names, row))
+        hashes.append(hashlib.sha256(prefix + text.encode('utf8')).hexdigest())
+    return hashes
+
+def section_offsets(message):
+    """
+    This function returns the offsets of sections 1, 3 and 4 in bufr message (edition 4).
+    Section 2 is there only if the flag of section 1 (octet 10) tells so.
+    """
+    section1 = 8
+    offset = section1 + int.from_bytes(message[section1:section1 + 3], 'big')
+    if message[section1 + 9] & 0x80:
+        offset += int.from_bytes(message[offset:offset + 3], 'big')
+    section3 = offset
+    section4 = section3 + int.from_bytes(message[section3:section3 + 3], 'big')
+    return section1, section3, section4
+
+def subset_segments(message, subset_bits):
+    """
+    This function cuts the data of section 4 of uncompressed message to the segments of
+    its subsets (subset_bits bits each). Each segment is returned as bytes, padded with
+    zero bits to whole bytes.
+    """
+    section1, section3, section4 = section_offsets(message)
+    number_of_subsets = int.from_bytes(message[section3 + 4:section3 + 6], 'big')
+    length = int.from_bytes(message[section4:section4 + 3], 'big')
+    data = np.frombuffer(message[section4 + 4:section4 + length], dtype=np.uint8)
+    bits = np.unpackbits(data)[:number_of_subsets * subset_bits]
+    bits = bits.reshape(number_of_subsets, subset_bits)
+    return [segment.tobytes() for segment in np.packbits(bits, axis=1)]
+
+def splice_message(header, segments, subset_bits, typical_date):
+    """
+    This function makes an uncompressed bufr message from the sections 0 - 3 of a message
+    (header) and the segments of the subsets (subset_segments).
+        1. The segments are joined bit by bit and padded with zero bits to whole bytes.
+        2. The header is patched: total length (section 0), typical date (year, month,
+        day, hour, minute and second of section 1), number of subsets (section 3).
+        3. Section 4 (length, reserved octet and data) and section 5 (7777) are added.
+    """
+    # 1.
+    segment_bytes = (subset_bits + 7) // 8
+    bits = np.unpackbits(np.frombuffer(b''.join(segments), dtype=np.uint8))
+    bits = bits.reshape(len(segments), segment_bytes * 8)[:, :subset_bits]
+    data = np.packbits(bits.ravel()).tobytes()
+
+    # 2.
+    section1, section3, section4 = section_offsets(header)
+    section4_length = 4 + len(data)
+    message = bytearray(header[:section4])
+    message[4:7] = (section4 + section4_length + 4).to_bytes(3, 'big')
+    year, month, day, hour, minute, second = typical_date
+    message[section1 + 15:section1 + 17] = year.to_bytes(2, 'big')
+    message[section1 + 17:section1 + 22] = bytes([month, day, hour, minute, second])
+    message[section3 + 4:section3 + 6] = len(segments).to_bytes(2, 'big')
+
+    # 3.
+    message += section4_length.to_bytes(3, 'big') + b'\x00' + data + b'7777'
+    return bytes(message)
@@ -0,0 +1,64 @@
+"""
+Tests of backfill.py.
+Run by command: python3 -m pytest tests/ (or python3 -m unittest discover tests)
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+import backfill
+from climat_errors import BackfillInputError
+
+SAMPLE_FILE = os.path.join(TESTS_DIR, '..', 'ISCD02_YYYY-MM-DD_HH:MI_SC_timestamp.dat')
+
+class Options:
+    """
+    Command line options of backfill.py with their default values.
+    """
+    def __init__(self, **options):
+        self.work_dir = None
+        self.output_dir = None
+        self.compress = False
+        self.max_subsets = None
+        self.max_bytes = None
+        self.split_files = False
+        self.jobs = None
+        self.ttaaii = 'UNKNOWN'
+        self.code = 'SC'
+        self.__dict__.update(options)
+
+class BackfillTest(unittest.TestCase):
+    """
+    Tests of continuing a backfill in a temporary directory.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.climat_filename = os.path.join(self.directory, 'ISCD02_2024-12-01_06:00_SC_1.dat')
+        shutil.copy(SAMPLE_FILE, self.climat_filename)
+        self.options = Options(work_dir=os.path.join(self.directory, 'work'),
+            output_dir=os.path.join(self.directory, 'bufr'))
+        os.makedirs(self.options.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_continue(self):
+        converted, failed = backfill.backfill([self.climat_filename], self.options)
+        self.assertEqual((len(converted), failed), (1, []))
+        self.assertEqual(backfill.backfill([self.climat_filename], self.options), ([], []))
+        self.assertEqual(backfill.backfill([], self.options), ([], []))
+        self.assertEqual(os.listdir(self.options.output_dir), ['ISCD02_EFKL_2024-12-01_SC.bufr'])
+
+    def test_changed_climat_file(self):
+        backfill.backfill([self.climat_filename], self.options)
+        with open(self.climat_filename, 'a', encoding="utf8") as climat_file:
+            climat_file.write('\n')
+        with self.assertRaises(BackfillInputError):
+            backfill.backfill([self.climat_filename], self.options)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,403 @@
+"""
+Tests of converting climat files to bufr files by climat2bufr.py.
+Run by command: python3 -m pytest tests/ (or python3 -m unittest discover tests)
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import tempfile
+import subprocess
+import unittest
+from unittest import mock
+import numpy as np
+import eccodes
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..'))
+import climat2bufr
+import climat_pipeline
+import corrections
+import result_cache
+from climat_errors import EncodingError
+
+PROGRAM = os.path.join(TESTS_DIR, '..', 'climat2bufr.py')
+SAMPLE_FILE = os.path.join(TESTS_DIR, '..', 'ISCD02_YYYY-MM-DD_HH:MI_SC_timestamp.dat')
+EXPECTED_FILE = os.path.join(TESTS_DIR, 'data', 'ISCD02_EFKL_2024-12-01_SC.bufr')
+CLIMAT_NAME = 'ISCD02_2024-12-01_06:00_SC_1.dat'
+BUFR_NAME = 'ISCD02_EFKL_2024-12-01_SC'
+
+class Options:
+    """
+    Command line options of climat2bufr.py with their default values.
+    """
+    def __init__(self, **options):
+        self.output_dir = None
+        self.compress = False
+        self.max_subsets = None
+        self.max_bytes = None
+        self.split_files = False
+        self.jobs = None
+        self.__dict__.update(options)
+
+def sample_rows(months=None):
+    """
+    Returns the rows of the sample climat file. If months (YYYY-MM) are given, a row is
+    returned for each month: the rows of the sample file are taken in turn and their
+    REPORT_MONTH is changed to the month.
+    """
+    with open(SAMPLE_FILE, 'r', encoding="utf8") as climat_file:
+        rows = [row for row in climat_file.read().splitlines() if row.strip()]
+    if months is None:
+        return rows
+    return [rows[i % len(rows)].replace('REPORT_MONTH=2024-12-01', 'REPORT_MONTH=' + month
+        + '-01') for i, month in enumerate(months)]
+
+def decoded_values(message):
+    """
+    Decodes bufr message and returns the values of each data key (without its rank) as
+    a list of columns: one column for each occurrence of the key in a subset, with
+    the value of each subset. Compressed and uncompressed messages of the same subsets
+    give the same values.
+    """
+    bufr = eccodes.codes_new_from_message(message)
+    try:
+        eccodes.codes_set(bufr, 'unpack', 1)
+        number_of_subsets = eccodes.codes_get(bufr, 'numberOfSubsets')
+        compressed = eccodes.codes_get(bufr, 'compressedData') == 1
+        ranks = {}
+        iterator = eccodes.codes_bufr_keys_iterator_new(bufr)
+        while eccodes.codes_bufr_keys_iterator_next(iterator):
+            name = eccodes.codes_bufr_keys_iterator_get_name(iterator)
+            if name.startswith('#'):
+                name = name.split('#', 2)[2]
+                ranks[name] = ranks.get(name, 0) + 1
+        eccodes.codes_bufr_keys_iterator_delete(iterator)
+        values = {}
+        for name, number in ranks.items():
+            if compressed:
+                # the value of each subset or one value, which is the same in all subsets
+                columns = [np.broadcast_to(eccodes.codes_get_array(bufr,
+                    '#' + str(rank + 1) + '#' + name), number_of_subsets)
+                    for rank in range(0, number)]
+            else:
+                # the ranks run through the subsets one after another
+                columns = np.reshape(eccodes.codes_get_array(bufr, name),
+                    (number_of_subsets, number // number_of_subsets)).T
+            values[name] = [list(column) for column in columns]
+        return values
+    finally:
+        eccodes.codes_release(bufr)
+
+def message_key(message, key):
+    """
+    Returns the value of key in the header of bufr message.
+    """
+    bufr = eccodes.codes_new_from_message(message)
+    try:
+        return eccodes.codes_get(bufr, key)
+    finally:
+        eccodes.codes_release(bufr)
+
+class TemporaryDirectoryTest(unittest.TestCase):
+    """
+    Base class of the tests, which convert climat files in a temporary directory.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.directory, 'bufr')
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def climat_file(self, name=CLIMAT_NAME):
+        """
+        Copies the sample climat file to the temporary directory as name.
+        """
+        climat_filename = os.path.join(self.directory, name)
+        shutil.copy(SAMPLE_FILE, climat_filename)
+        return climat_filename
+
+    def changed_climat_file(self, name, row, old, new):
+        """
+        Writes the sample climat file to the temporary directory as name, with value old
+        of row (starting from 0) changed to new.
+        """
+        with open(SAMPLE_FILE, 'r', encoding="utf8") as climat_file:
+            rows = climat_file.read().splitlines()
+        self.assertIn(old, rows[row])
+        rows[row] = rows[row].replace(old, new, 1)
+        climat_filename = os.path.join(self.directory, name)
+        with open(climat_filename, 'w', encoding="utf8") as climat_file:
+            climat_file.write('\n'.join(rows) + '\n')
+        return climat_filename
+
+class ConversionTest(TemporaryDirectoryTest):
+    """
+    Tests of converting the sample climat file.
+    """
+    def test_sample_file(self):
+        output_filenames = climat2bufr.convert_file(self.climat_file(),
+            Options(output_dir=self.output_dir))
+        self.assertEqual(output_filenames,
+            [os.path.join(self.output_dir, BUFR_NAME + '.bufr')])
+        with open(output_filenames[0], 'rb') as bufr_file, \
+                open(EXPECTED_FILE, 'rb') as expected_file:
+            self.assertEqual(bufr_file.read(), expected_file.read())
+
+    def test_library_encode(self):
+        with open(SAMPLE_FILE, 'r', encoding="utf8") as climat_file, \
+                open(EXPECTED_FILE, 'rb') as expected_file:
+            self.assertEqual(climat2bufr.encode(climat_file.read()), expected_file.read())
+
+    def test_batch_with_the_same_output_name(self):
+        climat_filenames = [self.climat_file('ISCD02_2024-12-01_06:00_SC_1.dat'),
+            self.climat_file('ISCD02_2024-12-01_06:00_SC_2.dat')]
+        for jobs in (None, 2):
+            output_dir = os.path.join(self.output_dir, str(jobs))
+            os.makedirs(output_dir)
+            converted, failed = climat2bufr.convert_files(climat_filenames,
+                Options(output_dir=output_dir, jobs=jobs))
+            self.assertEqual((converted, failed), (climat_filenames, []))
+            self.assertEqual(sorted(os.listdir(output_dir)),
+                [BUFR_NAME + '.bufr', BUFR_NAME + '_2.bufr'])
+            for name in os.listdir(output_dir):
+                with open(os.path.join(output_dir, name), 'rb') as bufr_file, \
+                        open(EXPECTED_FILE, 'rb') as expected_file:
+                    self.assertEqual(bufr_file.read(), expected_file.read())
+
+    def test_failed_file_does_not_stop_batch(self):
+        bad_filename = os.path.join(self.directory, 'ISCD02_2024-12-01_06:00_SC_2.dat')
+        with open(bad_filename, 'w', encoding="utf8") as bad_file:
+            bad_file.write('A=1,B=2,A=3,*\n')
+        climat_filenames = [bad_filename, self.climat_file()]
+        converted, failed = climat2bufr.convert_files(climat_filenames,
+            Options(output_dir=self.output_dir))
+        self.assertEqual(converted, [climat_filenames[1]])
+        self.assertEqual(failed, [bad_filename])
+
+    def test_existing_file_is_not_replaced(self):
+        existing = os.path.join(self.output_dir, BUFR_NAME + '.bufr')
+        with open(existing, 'wb') as bufr_file:
+            bufr_file.write(b'other process')
+        output_filenames = climat2bufr.convert_file(self.climat_file(),
+            Options(output_dir=self.output_dir))
+        self.assertEqual(output_filenames,
+            [os.path.join(self.output_dir, BUFR_NAME + '_2.bufr')])
+        with open(existing, 'rb') as bufr_file:
+            self.assertEqual(bufr_file.read(), b'other process')
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+            [BUFR_NAME + '.bufr', BUFR_NAME + '_2.bufr'])
+
+    def test_pipeline(self):
+        climat_filenames = [self.climat_file('ISCD02_2024-12-01_06:00_SC_1.dat'),
+            self.climat_file('ISCD02_2024-12-01_06:00_SC_2.dat'),
+            os.path.join(self.directory, 'ISCD02_2024-11-01_06:00_SC_1.dat')]
+        with open(climat_filenames[2], 'w', encoding="utf8") as climat_file:
+            climat_file.write('\n'.join(sample_rows(['2024-11', '2024-10', '2024-11'])) + '\n')
+        outputs = []
+        for pipeline in (False, True):
+            output_dir = os.path.join(self.output_dir, str(pipeline))
+            os.makedirs(output_dir)
+            options = Options(output_dir=output_dir, jobs=2, max_subsets=1)
+            if pipeline:
+                converted, failed = climat_pipeline.run_pipeline(climat_filenames, options)
+            else:
+                converted, failed = climat2bufr.convert_files(climat_filenames, options)
+            self.assertEqual((sorted(converted), failed), (sorted(climat_filenames), []))
+            files = {}
+            for name in os.listdir(output_dir):
+                with open(os.path.join(output_dir, name), 'rb') as bufr_file:
+                    files[name] = bufr_file.read()
+            outputs.append(files)
+        self.assertEqual(sorted(outputs[0]), ['ISCD02_EFKL_2024-11-01_SC.bufr',
+            BUFR_NAME + '.bufr', BUFR_NAME + '_2.bufr'])
+        self.assertEqual(outputs[1], outputs[0])
+
+    def test_column_cache(self):
+        climat_filename = self.climat_file()
+        for compress in (False, True):
+            output_dir = os.path.join(self.output_dir, str(compress))
+            os.makedirs(output_dir)
+            expected = climat2bufr.convert_file(climat_filename,
+                Options(output_dir=output_dir, compress=compress))
+            options = Options(output_dir=output_dir, compress=compress,
+                column_cache=os.path.join(self.directory, 'columns'))
+            climat2bufr.convert_file(climat_filename, options)
+            with mock.patch('climat2bufr.parse_climat', side_effect=AssertionError('parsed')):
+                output_filenames = climat2bufr.convert_file(climat_filename, options)
+            for output_filename in (output_filenames[0], expected[0].replace('.bufr', '_2.bufr')):
+                with open(output_filename, 'rb') as bufr_file, \
+                        open(expected[0], 'rb') as expected_file:
+                    self.assertEqual(bufr_file.read(), expected_file.read())
+
+    def test_filesystem_without_hard_links(self):
+        with mock.patch('os.link', side_effect=PermissionError('no hard links')):
+            climat2bufr.convert_file(self.climat_file(), Options(output_dir=self.output_dir))
+            for _ in range(0, 2):
+                output_filenames = climat2bufr.convert_file(self.climat_file(),
+                    Options(output_dir=self.output_dir, split_files=True, max_subsets=2))
+        self.assertEqual(output_filenames,
+            [os.path.join(self.output_dir, BUFR_NAME + '_2_' + str(i) + '.bufr') for i in (1, 2)])
+        self.assertEqual(sorted(os.listdir(self.output_dir)), [BUFR_NAME + '.bufr',
+            BUFR_NAME + '_1.bufr', BUFR_NAME + '_2.bufr', BUFR_NAME + '_2_1.bufr',
+            BUFR_NAME + '_2_2.bufr'])
+        with open(os.path.join(self.output_dir, BUFR_NAME + '.bufr'), 'rb') as bufr_file, \
+                open(EXPECTED_FILE, 'rb') as expected_file:
+            self.assertEqual(bufr_file.read(), expected_file.read())
+
+    def test_processed_spool_file_is_not_replaced(self):
+        done_dir = os.path.join(self.directory, 'done')
+        os.makedirs(done_dir)
+        for link in (os.link, PermissionError('no hard links')):
+            with mock.patch('os.link', side_effect=link):
+                for _ in range(0, 2):
+                    climat2bufr.finish_spool_file((self.climat_file(), [], None), done_dir,
+                        None)
+        self.assertEqual(sorted(os.listdir(done_dir)), ['ISCD02_2024-12-01_06:00_SC_1.dat',
+            'ISCD02_2024-12-01_06:00_SC_1_2.dat', 'ISCD02_2024-12-01_06:00_SC_1_3.dat',
+            'ISCD02_2024-12-01_06:00_SC_1_4.dat'])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, CLIMAT_NAME)))
+
+    def test_spool_files_with_the_same_output_name(self):
+        spool_dir = os.path.join(self.directory, 'spool')
+        os.makedirs(spool_dir)
+        for name in ('ISCD02_2025-01-28_06:00_SC_1.dat', 'ISCD02_2025-01-28_06:00_SC_2.dat'):
+            shutil.copy(SAMPLE_FILE, os.path.join(spool_dir, name))
+        service = subprocess.Popen([sys.executable, PROGRAM, '--watch', spool_dir,
+            '--output-dir', self.output_dir, '--poll-interval', '0.2'],
+            stdout=subprocess.DEVNULL)
+        try:
+            done_dir = os.path.join(spool_dir, 'done')
+            deadline = time.time() + 60
+            while time.time() < deadline:
+                if os.path.isdir(done_dir) and len(os.listdir(done_dir)) == 2:
+                    break
+                time.sleep(0.2)
+        finally:
+            service.send_signal(signal.SIGTERM)
+            service.wait(60)
+        self.assertEqual(len(os.listdir(done_dir)), 2)
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+            ['ISCD02_EFKL_2025-01-28_SC.bufr', 'ISCD02_EFKL_2025-01-28_SC_2.bufr'])
+
+class MessageTest(unittest.TestCase):
+    """
+    Tests of the bufr messages of climat data (encode_messages), compared by their
+    decoded values.
+    """
+    def test_compressed_message(self):
+        rows = sample_rows()
+        message = climat2bufr.encode_messages(rows)[0]
+        compressed = climat2bufr.encode_messages(rows, compress=True)[0]
+        self.assertEqual(message_key(message, 'compressedData'), 0)
+        self.assertEqual(message_key(compressed, 'compressedData'), 1)
+        self.assertLess(len(compressed), len(message))
+        self.assertEqual(decoded_values(compressed), decoded_values(message))
+
+    def test_message_for_each_month(self):
+        months = ['2024-11', '2024-12', '2024-10', '2024-12', '2024-11']
+        rows = sample_rows(months)
+        messages = climat2bufr.encode_messages(rows)
+        self.assertEqual([(message_key(message, 'typicalYear'),
+            message_key(message, 'typicalMonth'), message_key(message, 'numberOfSubsets'))
+            for message in messages], [(2024, 10, 1), (2024, 11, 2), (2024, 12, 2)])
+        for message, month in zip(messages, sorted(set(months))):
+            month_rows = [row for row, row_month in zip(rows, months) if row_month == month]
+            self.assertEqual(decoded_values(message),
+                decoded_values(climat2bufr.encode_messages(month_rows)[0]))
+
+    def test_chunks(self):
+        rows = sample_rows(['2024-12'] * 10)
+        values = decoded_values(climat2bufr.encode_messages(rows)[0])
+        max_bytes = len(climat2bufr.encode_messages(rows[:4])[0])
+        for options, subsets in (({'max_subsets': 3}, [3, 3, 3, 1]),
+                ({'max_bytes': max_bytes}, [4, 4, 2])):
+            messages = climat2bufr.encode_messages(rows, **options)
+            self.assertEqual([message_key(message, 'numberOfSubsets') for message in messages],
+                subsets)
+            self.assertTrue(all(len(message) <= max_bytes for message in messages))
+            chunks = [decoded_values(message) for message in messages]
+            self.assertEqual({name: [sum((chunk[name][i] for chunk in chunks), [])
+                for i in range(0, len(columns))] for name, columns in values.items()}, values)
+
+    def test_spliced_message(self):
+        rows = sample_rows(['2024-11', '2024-12', '2024-11', '2024-12'])
+        changed = list(rows)
+        self.assertIn('S11_P=1010.4', changed[0])
+        changed[0] = changed[0].replace('S11_P=1010.4', 'S11_P=1010.5')
+        with tempfile.TemporaryDirectory() as directory:
+            segments = result_cache.ResultCache(directory)
+            for climat_rows, cached in ((rows, 4), (changed, 5)):
+                messages = climat2bufr.encode_messages(climat_rows, segments=segments)
+                self.assertEqual(len(segments.entries()), cached)
+                self.assertEqual(messages, climat2bufr.encode_messages(climat_rows))
+
+class OptionsTest(TemporaryDirectoryTest):
+    """
+    Tests of the command line options.
+    """
+    def test_message_size_must_be_positive(self):
+        for option in ('--max-subsets', '--max-bytes'):
+            for value in ('0', '-1', 'x'):
+                result = subprocess.run([sys.executable, PROGRAM, option, value,
+                    self.climat_file()], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    universal_newlines=True)
+                self.assertEqual(result.returncode, 2)
+                self.assertIn('argument ' + option, result.stderr)
+                self.assertNotIn('Traceback', result.stderr)
+
+class CorrectionsTest(TemporaryDirectoryTest):
+    """
+    Tests of correction messages (--corrections).
+    """
+    def message_header(self, bufr_filename):
+        """
+        Returns updateSequenceNumber and the number of subsets of the bufr file.
+        """
+        with open(bufr_filename, 'rb') as bufr_file:
+            bufr = eccodes.codes_bufr_new_from_file(bufr_file)
+        try:
+            return (eccodes.codes_get(bufr, 'updateSequenceNumber'),
+                eccodes.codes_get(bufr, 'numberOfSubsets'))
+        finally:
+            eccodes.codes_release(bufr)
+
+    def test_files_of_the_same_month(self):
+        state_dir = os.path.join(self.directory, 'corrections')
+        options = Options(output_dir=self.output_dir, corrections=state_dir)
+        first = climat2bufr.convert_file(self.climat_file(), options)
+        self.assertEqual(self.message_header(first[0]), (1, 4))
+        climat_filenames = [
+            self.changed_climat_file('ISCD02_2024-12-01_06:00_CCA_1.dat', 0, 'S11_P=1010.4',
+                'S11_P=1010.5'),
+            self.changed_climat_file('ISCD02_2024-12-01_06:00_CCB_1.dat', 1, 'S12_P=1010.9',
+                'S12_P=1011.0')]
+        converted, failed = climat2bufr.convert_files(climat_filenames, options)
+        self.assertEqual((converted, failed), (climat_filenames, []))
+        self.assertEqual(self.message_header(os.path.join(self.output_dir,
+            'ISCD02_EFKL_2024-12-01_CCA.bufr')), (2, 1))
+        # the second file changes back the station of the first one
+        self.assertEqual(self.message_header(os.path.join(self.output_dir,
+            'ISCD02_EFKL_2024-12-01_CCB.bufr')), (3, 2))
+
+    def test_too_many_corrections(self):
+        with open(EXPECTED_FILE, 'rb') as expected_file:
+            message = expected_file.read()
+        corrected = corrections.set_update_sequence_number(message, 255)
+        self.assertEqual(corrected[8 + 8], 255)
+        with self.assertRaises(EncodingError):
+            corrections.set_update_sequence_number(message, 256)
+
+    def test_parallel_corrections_are_refused(self):
+        for options in (['--jobs', '2'], ['--pipeline'], ['--watch', self.directory]):
+            result = subprocess.run([sys.executable, PROGRAM, '--corrections',
+                self.directory, self.climat_file()] + options, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, universal_newlines=True)
+            self.assertEqual(result.returncode, 2)
+            self.assertIn('--corrections cannot be used', result.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
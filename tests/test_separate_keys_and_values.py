@@ -0,0 +1,68 @@
+"""
+Tests of separate_keys_and_values.py and the reading of climat rows (read_climat).
+Run by command: python3 -m pytest tests/ (or python3 -m unittest discover tests)
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import separate_keys_and_values
+import climat2bufr
+from climat_errors import ClimatDataError
+
+class SplitRowTest(unittest.TestCase):
+    """
+    Tests of split_row.
+    """
+    def test_split_row(self):
+        keys, values = separate_keys_and_values.split_row('A=1,B=/,*')
+        self.assertEqual(keys, ['A', 'B'])
+        self.assertEqual(values, ['1', '/'])
+
+    def test_duplicate_key(self):
+        with self.assertRaisesRegex(ValueError, 'duplicate key A'):
+            separate_keys_and_values.split_row('A=1,B=2,A=3,*')
+
+    def test_duplicate_key_in_climat_rows(self):
+        with self.assertRaises(ClimatDataError) as raised:
+            climat2bufr.read_climat(['A=1,B=2,*', 'A=4,B=5,A=6,*', 'A=7,B=8,*'])
+        self.assertEqual(raised.exception.row, 2)
+
+class MappedRowsTest(unittest.TestCase):
+    """
+    Tests that a memory-mapped climat file (mapped_rows) is read as the same file line
+    by line.
+    """
+    def read_both(self, text):
+        """
+        Writes text to a climat file and returns the result of read_climat of its mapped
+        rows and of its lines. The result is the keys and the value columns or the number of
+        the bad row.
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            climat_filename = os.path.join(directory, 'climat.dat')
+            with open(climat_filename, 'w', encoding="utf8") as climat_file:
+                climat_file.write(text)
+            with open(climat_filename, 'r', encoding="utf8") as climat_file:
+                for rows in (climat2bufr.mapped_rows(climat_filename), climat_file):
+                    try:
+                        results.append(climat2bufr.read_climat(rows))
+                    except ClimatDataError as err:
+                        results.append(err.row)
+        return results
+
+    def test_rows(self):
+        mapped, lines = self.read_both('A=1,B=2,*\r\n\n \nB=3,A=4,*\nA=5,B=/,*\n  \n')
+        self.assertEqual(mapped, (['A', 'B'], [['1', '4', '5'], ['2', '3', '/']]))
+        self.assertEqual(mapped, lines)
+
+    def test_row_without_terminator(self):
+        mapped, lines = self.read_both('A=1,B=2,*\nA=3,B=4\nA=5,B=6,*\n')
+        self.assertEqual(mapped, 2)
+        self.assertEqual(mapped, lines)
+
+if __name__ == '__main__':
+    unittest.main()
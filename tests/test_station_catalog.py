@@ -0,0 +1,70 @@
+"""
+Tests of station_catalog.py.
+Run by command: python3 -m pytest tests/ (or python3 -m unittest discover tests)
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import station_catalog
+import subset_arrays as subA
+
+KEYS = ['FMISID', 'WSI', 'WMON', 'LAT']
+
+class StationCatalogTest(unittest.TestCase):
+    """
+    Tests of filling and learning station metadata.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'stations.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fill(self, rows):
+        catalog = station_catalog.StationCatalog(self.path)
+        keys, value_columns = catalog.fill(KEYS, [list(column) for column in zip(*rows)])
+        catalog.close()
+        return dict(zip(keys, value_columns))
+
+    def station_keys(self):
+        with sqlite3.connect(self.path) as connection:
+            return sorted(row[0] for row in connection.execute('SELECT station_key FROM stations'))
+
+    def test_fill_missing_metadata(self):
+        self.fill([('100908', '0-20000-0-02981', '02981', '60.1')])
+        columns = self.fill([('100908', '/', '/', '/')])
+        self.assertEqual(columns['WSI'], ['0-20000-0-02981'])
+        self.assertEqual(columns['LAT'], ['60.1'])
+
+    def test_split_wigos_is_stored(self):
+        self.fill([('100908', '0-20000-0-02981', '02981', '60.1')])
+        subA.SPLIT_WIGOS.clear()
+        catalog = station_catalog.StationCatalog(self.path)
+        catalog.close()
+        self.assertEqual(subA.SPLIT_WIGOS['0-20000-0-02981'], (0, 20000, 0, '02981'))
+
+    def test_changed_station_key(self):
+        self.fill([('100908', '/', '02981', '/')])
+        self.fill([('100908', '/', '02982', '/')])
+        catalog = station_catalog.StationCatalog(self.path)
+        self.assertIsNone(catalog.find({'WMON': '02981'}))
+        self.assertEqual(catalog.find({'WMON': '02982'})['FMISID'], '100908')
+        catalog.close()
+
+    def test_merged_station_is_deleted(self):
+        self.fill([('/', '/', '02981', '60.1')])
+        self.fill([('100908', '/', '/', '/')])
+        self.assertEqual(self.station_keys(), ['FMISID:100908', 'WMON:02981'])
+        self.fill([('100908', '/', '02981', '/')])
+        self.assertEqual(self.station_keys(), ['FMISID:100908'])
+        columns = self.fill([('/', '/', '02981', '/')])
+        self.assertEqual(columns['FMISID'], ['100908'])
+        self.assertEqual(columns['LAT'], ['60.1'])
+
+if __name__ == '__main__':
+    unittest.main()